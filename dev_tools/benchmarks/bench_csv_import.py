@@ -0,0 +1,120 @@
+"""
+Measures CSV ingestion throughput of data_handler.csv_utils.process_csv.
+
+    python dev_tools/benchmarks/bench_csv_import.py --rows 10000 100000 1000000
+
+``--legacy`` also runs the previous row-by-row ingestion (save() per task,
+activity and counter update) on files up to ``--legacy-max-rows``.
+``--region`` uploads the rows as regional tasks to a temporary filesystem
+storage backend.
+"""
+
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+from common import benchmark_database, seed_workflow, setup_django
+
+COLUMNS = ["title", "body", "author", "url", "score"]
+
+
+def write_csv(path, n_rows):
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(COLUMNS)
+        for i in range(n_rows):
+            writer.writerow(
+                [f"title {i}", "lorem ipsum " * 8, f"author{i % 97}", f"/{i}", i % 5]
+            )
+
+
+def legacy_process_csv(csv_file, workflow, source, user, filename, region=None):
+    from django.db.models import F
+
+    from human_lambdas.data_handler.csv_utils import (
+        extract_value,
+        validate_keys,
+    )
+    from human_lambdas.data_handler.data_validation import data_validation
+    from human_lambdas.workflow_handler.models import Task, TaskActivity
+
+    dataset = csv.reader(csv_file)
+    title_row = next(dataset)
+    validate_keys(title_row, workflow)
+    for row in dataset:
+        data = [extract_value(w_input, row, title_row) for w_input in workflow.data]
+        task = Task(
+            data=data_validation(data), workflow=workflow, source=source, region=region
+        )
+        task.save()
+        TaskActivity(
+            task=task,
+            source="csv",
+            filename=filename,
+            created_by=user,
+            action="created",
+        ).save()
+        workflow.n_tasks = F("n_tasks") + 1
+        workflow.save()
+
+
+def run(label, process, path, workflow, region):
+    from human_lambdas.workflow_handler.models import Source
+
+    source = Source.objects.create(
+        name=label, workflow=workflow, created_by=workflow.created_by
+    )
+    with open(path, newline="") as csv_file:
+        n_rows = sum(1 for _ in csv_file) - 1
+        csv_file.seek(0)
+        start = time.perf_counter()
+        process(
+            csv_file,
+            workflow=workflow,
+            source=source,
+            user=workflow.created_by,
+            filename=os.path.basename(path),
+            region=region,
+        )
+        seconds = time.perf_counter() - start
+    print(f"{label}: {n_rows} rows in {seconds:.1f}s, {n_rows / seconds:.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--legacy", action="store_true")
+    parser.add_argument("--legacy-max-rows", type=int, default=10000)
+    parser.add_argument("--region", choices=["AU", "US"])
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="hl-bench-csv-")
+    os.environ.setdefault(
+        "REGIONAL_STORAGE_LOCAL_DIR", os.path.join(tmp_dir, "storage")
+    )
+    setup_django()
+    from human_lambdas.data_handler import csv_utils
+
+    # the notification email is not part of the ingestion
+    csv_utils.send_notification = lambda workflow: None
+
+    with benchmark_database():
+        workflow = seed_workflow()
+        workflow.data = [
+            {"id": column, "name": column, "type": "text", "text": {"read_only": True}}
+            for column in COLUMNS
+        ]
+        workflow.save()
+        for n_rows in args.rows:
+            path = os.path.join(tmp_dir, f"{n_rows}.csv")
+            write_csv(path, n_rows)
+            run(f"bulk {n_rows}", csv_utils.process_csv, path, workflow, args.region)
+            if args.legacy and n_rows <= args.legacy_max_rows:
+                run(f"legacy {n_rows}", legacy_process_csv, path, workflow, args.region)
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Shows the query plans and latencies of the hot task queries with and without
+the composite and partial indexes of Task.
+
+    python dev_tools/benchmarks/bench_indexes.py --workflows 50 --tasks 5000000
+
+Most of the seeded tasks are completed, as in production. Point POSTGRES_*
+at a Postgres server to see its plans, SQLite is used otherwise.
+"""
+
+import argparse
+import random
+
+from common import (
+    benchmark_database,
+    report,
+    seed_workflow,
+    setup_django,
+    timed,
+)
+
+OPEN_STATUSES = ["new", "assigned", "in_progress"]
+
+
+def seed(n_workflows, n_tasks, chunk_size=50000):
+    from django.utils import timezone
+
+    from human_lambdas.user_handler.models import User
+    from human_lambdas.workflow_handler.models import Task, Workflow
+
+    first = seed_workflow()
+    workflows = [first] + [
+        Workflow.objects.create(
+            name=f"benchmark {i}",
+            organization=first.organization,
+            created_by=first.created_by,
+        )
+        for i in range(1, n_workflows)
+    ]
+    workers = [first.created_by] + [
+        User.objects.create(name=f"worker {i}", email=f"worker{i}@benchmark.local")
+        for i in range(1, 20)
+    ]
+    now = timezone.now()
+    for start in range(0, n_tasks, chunk_size):
+        tasks = []
+        for _ in range(min(chunk_size, n_tasks - start)):
+            completed = random.random() < 0.95
+            status = "completed" if completed else random.choice(OPEN_STATUSES)
+            tasks.append(
+                Task(
+                    workflow=random.choice(workflows),
+                    data=[],
+                    status=status,
+                    assigned_to=random.choice(workers) if status != "new" else None,
+                    completed_at=(
+                        now - timezone.timedelta(minutes=random.randint(1, 525600))
+                        if completed
+                        else None
+                    ),
+                )
+            )
+        Task.objects.bulk_create(tasks)
+    return workflows, workers
+
+
+def queries(workflow, worker):
+    from django.utils import timezone
+
+    from human_lambdas.workflow_handler.models import Task
+
+    tasks = Task.objects.defer("data")
+    now = timezone.now()
+    return {
+        "next task": tasks.filter(
+            workflow=workflow, status__in=["pending", "new"]
+        ).order_by("created_at")[:10],
+        "assigned to self": tasks.filter(
+            workflow=workflow,
+            status__in=["assigned", "in_progress"],
+            assigned_to=worker,
+        )[:1],
+        "pending list": tasks.filter(workflow=workflow)
+        .exclude(status="completed")
+        .order_by("created_at", "pk")[:100],
+        "completed list": tasks.filter(
+            workflow=workflow,
+            status="completed",
+            completed_at__range=(now - timezone.timedelta(days=30), now),
+        ).order_by("-completed_at", "-pk")[:100],
+    }
+
+
+def run(label, workflows, workers, repeat):
+    print(f"--- {label}")
+    for name, queryset in queries(workflows[0], workers[0]).items():
+        print(f"{name}:")
+        for line in queryset.explain().splitlines():
+            print(f"    {line}")
+        samples = []
+        for _ in range(repeat):
+            workflow, worker = random.choice(workflows), random.choice(workers)
+            queryset = queries(workflow, worker)[name]
+            samples.append(timed(lambda: list(queryset)))
+        report(f"{name} ({label})", samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workflows", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+
+    from human_lambdas.workflow_handler.models import Task
+
+    with benchmark_database():
+        workflows, workers = seed(args.workflows, args.tasks)
+        indexes = Task._meta.indexes
+        with connection.schema_editor() as schema_editor:
+            for index in indexes:
+                schema_editor.remove_index(Task, index)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        run("without indexes", workflows, workers, args.repeat)
+
+        with connection.schema_editor() as schema_editor:
+            for index in indexes:
+                schema_editor.add_index(Task, index)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        run("with indexes", workflows, workers, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Measures query count and latency of the WorkflowMetrics computation.
+
+    python dev_tools/benchmarks/bench_metrics.py --workflows 30 --tasks 20000
+
+``legacy`` replays the previous computation, one query per metric, time range
+and workflow, ``engine`` aggregates the tasks and ``rollups`` reads the daily
+rollups. tat is only measured when POSTGRES_* is set, SQLite cannot average
+durations.
+"""
+
+import argparse
+import random
+
+from common import (
+    benchmark_database,
+    report,
+    seed_workflow,
+    setup_django,
+    timed,
+)
+
+
+def seed(n_workflows, n_tasks):
+    from django.utils import timezone
+
+    from human_lambdas.workflow_handler.models import Task, Workflow
+
+    first = seed_workflow()
+    workflows = [first] + [
+        Workflow.objects.create(
+            name=f"benchmark {i}",
+            organization=first.organization,
+            created_by=first.created_by,
+        )
+        for i in range(1, n_workflows)
+    ]
+    now = timezone.now()
+    tasks = []
+    for _ in range(n_tasks):
+        created_at = now - timezone.timedelta(minutes=random.randint(1, 400 * 24 * 60))
+        completed_at = created_at + timezone.timedelta(
+            minutes=random.randint(1, 10 * 24 * 60)
+        )
+        completed = completed_at < now and random.random() < 0.8
+        tasks.append(
+            Task(
+                workflow=random.choice(workflows),
+                data=[],
+                status="completed" if completed else "new",
+                completed_at=completed_at if completed else None,
+                handling_time_seconds=random.randint(1, 600) if completed else 0,
+                correct=random.choice([None, True, False]) if completed else None,
+            )
+        )
+    Task.objects.bulk_create(tasks)
+    # created_at is set on insert
+    for task in tasks:
+        if task.completed_at:
+            task.created_at = task.completed_at - timezone.timedelta(hours=1)
+    Task.objects.bulk_update(tasks, ["created_at"], batch_size=500)
+    return first.organization, workflows
+
+
+def legacy(metrics, organization, workflows, range_name):
+    from human_lambdas.metrics.views import _TIME_RANGE_DICT
+
+    time_ranges = _TIME_RANGE_DICT[range_name]()
+    return {
+        (qtype, index, workflow.pk): metric(
+            start_time=start_time,
+            end_time=end_time,
+            organization=organization,
+            workflow=workflow,
+        )
+        for qtype, metric in metrics.items()
+        for index, (start_time, end_time) in enumerate(time_ranges)
+        for workflow in workflows
+    }
+
+
+def engine(metrics, organization, workflows, range_name, use_rollups=False):
+    from human_lambdas.metrics.engine import compute_metrics
+    from human_lambdas.metrics.views import _TIME_RANGE_DICT, process_kwargs
+    from human_lambdas.workflow_handler.models import Task, TaskDailyRollup
+
+    time_ranges = _TIME_RANGE_DICT[range_name]()
+    rollups = None
+    if use_rollups:
+        rollups = TaskDailyRollup.objects.filter(
+            organization=organization, workflow__in=workflows
+        )
+    return compute_metrics(
+        metrics,
+        Task.objects.filter(
+            process_kwargs(organization=organization), workflow__in=workflows
+        ),
+        time_ranges,
+        range_name,
+        group_by="workflow",
+        rollups=rollups,
+    )
+
+
+def rollups(metrics, organization, workflows, range_name):
+    return engine(metrics, organization, workflows, range_name, use_rollups=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workflows", type=int, default=30)
+    parser.add_argument("--tasks", type=int, default=20000)
+    parser.add_argument(
+        "--range", choices=["daily", "weekly", "monthly"], default="monthly"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from human_lambdas.metrics import views
+    from human_lambdas.workflow_handler.rollups import backfill_rollups
+
+    with benchmark_database():
+        metrics = dict(views.METRICS)
+        if connection.vendor == "sqlite":
+            del metrics["tat"]
+        organization, workflows = seed(args.workflows, args.tasks)
+        backfill_rollups(workflows)
+        for label, compute in [
+            ("legacy", legacy),
+            ("engine", engine),
+            ("rollups", rollups),
+        ]:
+            samples = []
+            for _ in range(args.repeat):
+                with CaptureQueriesContext(connection) as queries:
+                    samples.append(
+                        timed(
+                            lambda: compute(
+                                metrics, organization, workflows, args.range
+                            )
+                        )
+                    )
+            report(f"{label} ({len(queries)} queries)", samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Measures /tasks/next claim latency with many workers pulling from one queue.
+
+    python dev_tools/benchmarks/bench_next_task.py --workers 50 --tasks 2000
+
+Set POSTGRES_* to benchmark SKIP LOCKED; on SQLite the conditional UPDATE
+single-writer path is exercised instead. ``legacy`` replays the previous
+``select_for_update().first()`` + ``save()`` claim for comparison.
+"""
+
+import argparse
+import threading
+import time
+from collections import Counter
+
+from common import (
+    benchmark_database,
+    report,
+    seed_workflow,
+    setup_django,
+    timed,
+)
+
+
+def legacy_claim(queryset, user):
+    from django.db import transaction
+    from django.utils import timezone
+
+    with transaction.atomic():
+        task = (
+            queryset.select_for_update().filter(status__in=("pending", "new")).first()
+        )
+        if not task:
+            task = queryset.select_for_update().filter(status="open").first()
+        if task:
+            task.status = "in_progress"
+            task.assigned_to = user
+            task.assigned_at = timezone.now()
+            task.save()
+        return task
+
+
+def run(strategy, claim, workflow, workers, n_tasks):
+    from django.db import connection
+
+    from human_lambdas.user_handler.models import User
+    from human_lambdas.workflow_handler.models import Task
+
+    Task.objects.filter(workflow=workflow).delete()
+    Task.objects.bulk_create([Task(workflow=workflow, data=[]) for _ in range(n_tasks)])
+    users = [
+        User.objects.get_or_create(
+            email=f"worker{i}@benchmark.local", defaults={"name": f"worker{i}"}
+        )[0]
+        for i in range(workers)
+    ]
+    queryset = (
+        Task.objects.defer("data").filter(workflow=workflow).order_by("created_at")
+    )
+
+    barrier = threading.Barrier(workers)
+    lock = threading.Lock()
+    latencies, claimed, errors = [], [], Counter()
+
+    def worker(user):
+        barrier.wait()
+        try:
+            while True:
+                result = []
+                try:
+                    latency = timed(lambda: result.append(claim(queryset, user)))
+                except Exception as ex:
+                    errors[type(ex).__name__] += 1
+                    continue
+                if result[0] is None:
+                    return
+                with lock:
+                    latencies.append(latency)
+                    claimed.append(result[0].pk)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    report(f"{strategy} ({workers} workers)", latencies)
+    duplicates = len(claimed) - len(set(claimed))
+    print(
+        f"{strategy}: claimed={len(claimed)}/{n_tasks} duplicates={duplicates} "
+        f"errors={dict(errors)} throughput={len(claimed) / wall:.1f} claims/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=2000)
+    parser.add_argument(
+        "--strategy", choices=["claim", "legacy", "both"], default="both"
+    )
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+
+    from human_lambdas.workflow_handler.utils import claim_next_task
+
+    strategies = {"claim": claim_next_task, "legacy": legacy_claim}
+    with benchmark_database():
+        print(f"database: {connection.vendor}")
+        workflow = seed_workflow()
+        for name, claim in strategies.items():
+            if args.strategy in (name, "both"):
+                run(name, claim, workflow, args.workers, args.tasks)
+
+
+if __name__ == "__main__":
+    main()
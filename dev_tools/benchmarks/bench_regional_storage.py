@@ -0,0 +1,94 @@
+"""
+Compares per-task regional_storage.retrieve/store loops with the concurrent
+retrieve_many/store_many.
+
+    python dev_tools/benchmarks/bench_regional_storage.py --tasks 200 --latency-ms 40
+
+Runs offline against the filesystem (or in-memory) storage backend in a
+temporary directory, sleeping ``--latency-ms`` per request to stand in for
+the Cloud Storage round trip. ``--backend gcs`` uses the configured bucket.
+"""
+
+import argparse
+import tempfile
+import time
+from unittest import mock
+
+from common import setup_django, timed
+
+BACKENDS = {
+    "filesystem": "FileSystemBackend",
+    "memory": "InMemoryBackend",
+    "gcs": "GCSBackend",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--backend", choices=list(BACKENDS), default="filesystem")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.utils.module_loading import import_string
+
+    from human_lambdas.workflow_handler import regional_cache, regional_storage
+    from human_lambdas.workflow_handler.region import Region
+
+    region = Region.AU
+    pks = list(range(1, args.tasks + 1))
+    data = {
+        pk: [{"id": "text", "type": "text", "text": {"value": "x" * 512}}] for pk in pks
+    }
+    backend_class = import_string(
+        f"human_lambdas.workflow_handler.storage_backends.{BACKENDS[args.backend]}"
+    )
+    latency = 0 if args.backend == "gcs" else args.latency_ms / 1000
+
+    class SlowBackend(backend_class):
+        def read(self, *args, **kwargs):
+            time.sleep(latency)
+            return super().read(*args, **kwargs)
+
+        def write(self, *args, **kwargs):
+            time.sleep(latency)
+            return super().write(*args, **kwargs)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        location = settings.REGIONAL_BUCKET_AU if args.backend == "gcs" else tmp_dir
+        backend = SlowBackend(location)
+        with mock.patch.object(
+            settings, "STORAGE_TEST_PREFIX", "benchmark"
+        ), mock.patch.object(Region, "get_backend", lambda self: backend):
+            # measure transfers, not the regional cache
+            regional_cache.get_cache.cache_clear()
+            with mock.patch.object(settings, "REGIONAL_CACHE_MAX_BYTES", 0):
+                results = {
+                    "store": timed(
+                        lambda: [
+                            regional_storage.store(pk, region, data[pk]) for pk in pks
+                        ]
+                    ),
+                    "store_many": timed(
+                        lambda: regional_storage.store_many(data.items(), region)
+                    ),
+                    "retrieve": timed(
+                        lambda: [regional_storage.retrieve(pk, region) for pk in pks]
+                    ),
+                    "retrieve_many": timed(
+                        lambda: regional_storage.retrieve_many(pks, region)
+                    ),
+                }
+
+    print(
+        f"{args.tasks} tasks, {settings.REGIONAL_STORAGE_MAX_WORKERS} workers, "
+        f"{args.backend} backend @ {latency * 1000}ms"
+    )
+    for label, seconds in results.items():
+        print(f"{label:>14}: {seconds * 1000:9.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Shared setup for the benchmark scripts in this directory.
+
+Benchmarks run against a throwaway database created next to the configured
+one (a temporary SQLite file, or a ``test_`` database when POSTGRES_DB is set)
+so they can be pointed at a real Postgres without touching its data.
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, List
+
+SRC_DIR = Path(__file__).resolve().parents[2] / "src"
+
+
+def setup_django():
+    sys.path.insert(0, SRC_DIR.as_posix())
+    os.environ.setdefault(
+        "DJANGO_SETTINGS_MODULE", "human_lambdas.hl_rest_api.settings"
+    )
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    import django
+
+    django.setup()
+
+
+@contextmanager
+def benchmark_database() -> Iterator[None]:
+    from django.db import connection
+
+    settings_dict = connection.settings_dict
+    if settings_dict["ENGINE"] == "django.db.backends.sqlite3":
+        tmp_dir = tempfile.mkdtemp(prefix="hl-bench-")
+        settings_dict["TEST"]["NAME"] = os.path.join(tmp_dir, "bench.sqlite3")
+        # many benchmarks hammer SQLite from several threads
+        settings_dict["OPTIONS"]["timeout"] = 60
+
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def seed_workflow(name: str = "benchmark"):
+    from human_lambdas.user_handler.models import Organization, User
+    from human_lambdas.workflow_handler.models import Workflow
+
+    user = User.objects.create(name=name, email=f"{name}@benchmark.local")
+    organization = Organization.objects.create(name=name)
+    organization.add_admin(user)
+    return Workflow.objects.create(
+        name=name, organization=organization, created_by=user
+    )
+
+
+def timed(fn: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def report(label: str, samples: List[float]):
+    if not samples:
+        print(f"{label}: no samples")
+        return
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+    print(
+        f"{label}: n={len(samples)} mean={statistics.mean(samples) * 1000:.2f}ms "
+        f"p50={pct(0.5):.2f}ms p90={pct(0.9):.2f}ms p99={pct(0.99):.2f}ms "
+        f"max={ordered[-1] * 1000:.2f}ms"
+    )
@@ -0,0 +1,13 @@
+import tempfile
+
+import pytest
+from django.test import override_settings
+
+
+@pytest.fixture(autouse=True)
+def media_root():
+    """
+    Every test stores its uploads in its own directory, removed after it.
+    """
+    with tempfile.TemporaryDirectory() as path, override_settings(MEDIA_ROOT=path):
+        yield path
@@ -1,17 +1,41 @@
 import ast
 import copy
 import csv
-from typing import Optional
+import itertools
+import logging
+import re
+from collections import defaultdict
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
 
+from django.conf import settings
+from django.db import transaction
 from django.db.models import F
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 
 from human_lambdas.user_handler.notifications import send_notification
-from human_lambdas.workflow_handler.models import Task, TaskActivity
+from human_lambdas.workflow_handler.models import (
+    ImportJob,
+    Task,
+    TaskActivity,
+    Workflow,
+)
+from human_lambdas.workflow_handler.utils import decode_csv
 
 from .data_transformation import ner_ext2int, ner_int2ext
 from .data_validation import data_validation
 
+logger = logging.getLogger(__name__)
+
 
 # NER supports two mutually exclusive formats:
 # 1) A column with the identifier with full support for the NER JSON format
@@ -40,50 +64,44 @@ def validate_keys(title_row, workflow):
 
 
 # NER is a special case since it follows a different set of conventions
-def extract_ner(data_item, row, title_row):
-    # NER standard case
-    if data_item["id"] in title_row:
-        if title_row.index(data_item["id"]) < len(row):
-            input_value = row[title_row.index(data_item["id"])]
-            try:
-                # We expect an object containing NER properties, so we will need the AST parser
-                ner_object = (
-                    ast.literal_eval(input_value)
-                    if len(input_value) > 0
-                    else {"text": ""}
-                )
-            except (ValueError, SyntaxError):
-                raise Exception(
-                    f"The value provided is not in right format: {input_value}"
-                )
-            # We should have an object matching the external API representation
-            # We can leverage the API transformer
-            ner_ext2int(data_item, {data_item["id"]: ner_object})
-            return data_item
+def extract_ner(data_item, input_value):
+    try:
+        # We expect an object containing NER properties, so we will need the AST parser
+        ner_object = (
+            ast.literal_eval(input_value) if len(input_value) > 0 else {"text": ""}
+        )
+    except (ValueError, SyntaxError):
+        raise Exception(f"The value provided is not in right format: {input_value}")
+    # We should have an object matching the external API representation
+    # We can leverage the API transformer
+    ner_ext2int(data_item, {data_item["id"]: ner_object})
+
 
-    # NER special case where the `text` sub-key is included
-    if f'{data_item["id"]}.text' in title_row:
-        if title_row.index(f'{data_item["id"]}.text') < len(row):
-            input_value = row[title_row.index(f'{data_item["id"]}.text')]
-            data_item[data_item["type"]]["value"] = input_value
+# NER special case where the `text` sub-key is included
+def extract_ner_text(data_item, input_value):
+    data_item[data_item["type"]]["value"] = input_value
 
-    return data_item
+
+# plain numbers are parsed without the AST parser, with the same result
+NUMBER_LITERAL = re.compile(r"-?(0|[1-9][0-9]*)(\.[0-9]+)?")
+
+
+def parse_literal(input_value):
+    match = NUMBER_LITERAL.fullmatch(input_value)
+    if match:
+        return float(input_value) if match.group(2) else int(input_value)
+    return ast.literal_eval(input_value)
 
 
 # Extract Python literals in number, list, object based types
-def extract_literals(data_item, row, title_row):
-    if data_item["id"] in title_row:
-        if title_row.index(data_item["id"]) < len(row):
-            input_value = row[title_row.index(data_item["id"])].strip()
-            try:
-                data_item[data_item["type"]]["value"] = (
-                    ast.literal_eval(input_value) if len(input_value) > 0 else None
-                )
-            except (ValueError, SyntaxError):
-                raise Exception(
-                    f"The value provided is not in right format: {input_value}"
-                )
-    return data_item
+def extract_literals(data_item, input_value):
+    input_value = input_value.strip()
+    try:
+        data_item[data_item["type"]]["value"] = (
+            parse_literal(input_value) if len(input_value) > 0 else None
+        )
+    except (ValueError, SyntaxError):
+        raise Exception(f"The value provided is not in right format: {input_value}")
 
 
 LITERAL_TYPES = [
@@ -96,51 +114,268 @@ LITERAL_TYPES = [
 ]
 
 
-def extract_default(data_item, row, title_row):
-    if data_item["id"] in title_row:
-        if title_row.index(data_item["id"]) < len(row):
-            input_value = row[title_row.index(data_item["id"])]
-            data_item[data_item["type"]]["value"] = input_value
-    return data_item
+def extract_default(data_item, input_value):
+    data_item[data_item["type"]]["value"] = input_value
 
 
-def extract_value(w_data, row, title_row):
-    data_item = copy.deepcopy(w_data)
-    if "layout" in data_item:
-        del data_item["layout"]
-    if data_item["type"] in LITERAL_TYPES:
-        return extract_literals(data_item, row, title_row)
-    if data_item["type"] == "named_entity_recognition":
-        return extract_ner(data_item, row, title_row)
+Extractor = Callable[[Dict[str, Any], str], None]
+
+
+class BlockExtraction(NamedTuple):
+    # the workflow block without its layout
+    template: Dict[str, Any]
+    # candidate columns, the first one present in a row is extracted
+    columns: List[Tuple[int, Extractor]]
+
+    def extract(self, row: List[str]) -> Dict[str, Any]:
+        # extractors only set keys of the type dict, a shallow copy of it is enough
+        data_item = dict(self.template)
+        block_type = data_item["type"]
+        if isinstance(data_item.get(block_type), dict):
+            data_item[block_type] = dict(data_item[block_type])
+        for index, extractor in self.columns:
+            if index < len(row):
+                extractor(data_item, row[index])
+                break
+        return data_item
+
+
+def compile_block(w_data, title_row) -> BlockExtraction:
+    template = copy.deepcopy(w_data)
+    template.pop("layout", None)
+    if template["type"] == "named_entity_recognition":
+        candidates = [
+            (template["id"], extract_ner),
+            (f'{template["id"]}.text', extract_ner_text),
+        ]
+    elif template["type"] in LITERAL_TYPES:
+        candidates = [(template["id"], extract_literals)]
     else:
-        return extract_default(data_item, row, title_row)
+        candidates = [(template["id"], extract_default)]
+    return BlockExtraction(
+        template,
+        [
+            # the first column with the id is used
+            (title_row.index(column_id), extractor)
+            for column_id, extractor in candidates
+            if column_id in title_row
+        ],
+    )
+
+
+class ExtractionPlan:
+    """
+    The blocks of a workflow compiled against the title row of a CSV file, so
+    that every row is extracted with index lookups instead of searching the
+    title row and deep copying the blocks.
+    """
+
+    def __init__(self, blocks, title_row):
+        self.blocks = [compile_block(w_data, title_row) for w_data in blocks]
+
+    def extract(self, row: List[str]) -> List[Dict[str, Any]]:
+        return [block.extract(row) for block in self.blocks]
+
+
+def extract_value(w_data, row, title_row):
+    return compile_block(w_data, title_row).extract(row)
+
+
+def extract_row(row, plan: ExtractionPlan):
+    return data_validation(plan.extract(row))
+
+
+CSV_CHUNK_SIZE = 1000
+# row errors kept on an import job, the failed rows are counted regardless
+IMPORT_JOB_MAX_ERRORS = 100
+
+
+def create_tasks(
+    data_list: List[List[Dict[str, Any]]],
+    workflow,
+    source,
+    user,
+    filename,
+    region: Optional[str] = None,
+) -> List[Task]:
+    with transaction.atomic():
+        tasks = Task.objects.bulk_create(
+            [
+                Task(data=data, workflow=workflow, source=source, region=region)
+                for data in data_list
+            ]
+        )
+        TaskActivity.objects.bulk_create(
+            [
+                TaskActivity(
+                    task=task,
+                    source="csv",
+                    filename=filename,
+                    created_by=user,
+                    action="created",
+                )
+                for task in tasks
+            ]
+        )
+        Workflow.objects.filter(pk=workflow.pk).update(
+            n_tasks=F("n_tasks") + len(tasks)
+        )
+    return tasks
+
+
+def chunked(rows: Iterable[Any], chunk_size: int) -> Iterable[List[Any]]:
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
 
 
 def process_csv(
-    csv_file, workflow, source, user, filename, region: Optional[str] = None
+    csv_file,
+    workflow,
+    source,
+    user,
+    filename,
+    region: Optional[str] = None,
+    chunk_size: int = CSV_CHUNK_SIZE,
 ):
     dataset = csv.reader(csv_file)
     title_row = next(dataset)
     validate_keys(title_row, workflow)
-    for row in dataset:
-        data = [extract_value(w_input, row, title_row) for w_input in workflow.data]
-        task = Task(
-            data=data_validation(data),
-            workflow=workflow,
-            source=source,
-            region=None if region in ["EU", None] else region,
+    plan = ExtractionPlan(workflow.data, title_row)
+    region = None if region in ["EU", None] else region
+    # Every chunk is validated before any of its rows are inserted, then
+    # created with a handful of bulk statements in its own transaction
+    for rows in chunked(dataset, chunk_size):
+        data_list = [extract_row(row, plan) for row in rows]
+        create_tasks(data_list, workflow, source, user, filename, region)
+    send_notification(workflow)
+
+
+def read_import_file(job: ImportJob) -> Iterable[List[str]]:
+    with job.file.storage.open(job.file.name, "rb") as csv_file:
+        yield from csv.reader(decode_csv(csv_file))
+
+
+def claim_import_job() -> Optional[ImportJob]:
+    """
+    Marks the oldest queued import job as running, None if there is none.
+    """
+    queued = ImportJob.objects.filter(status="queued").order_by("pk")
+    for pk in queued.values_list("pk", flat=True)[:10]:
+        # another worker may have claimed the job in the meantime
+        if ImportJob.objects.filter(pk=pk, status="queued").update(
+            status="running", started_at=timezone.now()
+        ):
+            return ImportJob.objects.get(pk=pk)
+    return None
+
+
+def _delete_import_file(job: ImportJob) -> None:
+    """
+    The upload holds the raw data of the tasks, it is not kept once the job
+    ended, a failed job is resumed with the file uploaded again.
+    """
+    try:
+        job.file.delete(save=False)
+    except Exception:
+        logger.exception(f"Could not delete the file of import job {job.pk}")
+
+
+def stage_import_file(job: ImportJob, file_obj) -> None:
+    """
+    Stages the file of a failed job, uploaded again to resume it. Raises
+    ValueError if it does not have the rows of the job.
+    """
+    job.file = file_obj
+    job.save(update_fields=["file", "updated_at"])
+    rows_total = max(sum(1 for _ in read_import_file(job)) - 1, 0)
+    if job.rows_total is not None and rows_total != job.rows_total:
+        _delete_import_file(job)
+        job.save(update_fields=["file", "updated_at"])
+        raise ValueError(
+            f"The file has {rows_total} rows, the import has {job.rows_total}"
         )
-        task.save()
-        TaskActivity(
-            task=task,
-            source="csv",
-            filename=filename,
-            created_by=user,
-            action="created",
-        ).save()
-        workflow.n_tasks = F("n_tasks") + 1
-        workflow.save()
+
+
+def _fail_import_job(job: ImportJob, exception: BaseException) -> None:
+    job.status = "failed"
+    job.finished_at = timezone.now()
+    job.errors = job.errors + [
+        {"message": str(exception) or exception.__class__.__name__}
+    ]
+    _delete_import_file(job)
+    job.save(update_fields=["status", "finished_at", "errors", "file", "updated_at"])
+
+
+def run_import_job(job: ImportJob, chunk_size: Optional[int] = None) -> ImportJob:
+    """
+    Imports the rows of a running job after its offset. The tasks of every
+    chunk are committed together with the progress of the job, rows failing
+    validation are counted and skipped. Any other error fails the job, it can
+    be queued again with the file to resume after the last committed chunk.
+    """
+    chunk_size = chunk_size or settings.CSV_IMPORT_CHUNK_SIZE
+    workflow = job.workflow
+    region = None if job.region in ["EU", None] else job.region
+    try:
+        if job.rows_total is None:
+            # the title row is not counted
+            job.rows_total = max(sum(1 for _ in read_import_file(job)) - 1, 0)
+            job.save(update_fields=["rows_total", "updated_at"])
+        dataset = iter(read_import_file(job))
+        title_row = next(dataset, None)
+        if title_row is None:
+            raise Exception("The file is empty")
+        validate_keys(title_row, workflow)
+        plan = ExtractionPlan(workflow.data, title_row)
+        for rows in chunked(itertools.islice(dataset, job.offset, None), chunk_size):
+            data_list, errors = [], []
+            for row_number, row in enumerate(rows, start=job.offset + 1):
+                try:
+                    data_list.append(extract_row(row, plan))
+                except Exception as exception:
+                    errors.append({"row": row_number, "message": str(exception)})
+            with transaction.atomic():
+                if data_list:
+                    create_tasks(
+                        data_list,
+                        workflow,
+                        job.source,
+                        job.created_by,
+                        job.filename,
+                        region,
+                    )
+                job.offset += len(rows)
+                job.rows_done += len(data_list)
+                job.rows_failed += len(errors)
+                job.errors = (job.errors + errors)[:IMPORT_JOB_MAX_ERRORS]
+                job.save(
+                    update_fields=[
+                        "offset",
+                        "rows_done",
+                        "rows_failed",
+                        "errors",
+                        "updated_at",
+                    ]
+                )
+    except Exception as exception:
+        logger.exception(f"Import job {job.pk} failed at row {job.offset}")
+        _fail_import_job(job, exception)
+        return job
+    except BaseException as exception:
+        # e.g. the worker was stopped, leave the job resumable
+        _fail_import_job(job, exception)
+        raise
+
+    job.status = "completed"
+    job.finished_at = timezone.now()
+    _delete_import_file(job)
+    job.save(update_fields=["status", "finished_at", "file", "updated_at"])
     send_notification(workflow)
+    return job
 
 
 def extract_value_csv_export(task_data):
@@ -150,28 +385,46 @@ def extract_value_csv_export(task_data):
         return task_data[task_data["type"]]["value"]
 
 
-def task_list_to_csv_response(task_list):
-    workflow = task_list[0].workflow
-    response = HttpResponse(content_type="text/csv")
+class Echo:
+    """
+    File-like object for csv.writer, returns the written lines instead of
+    buffering them.
+    """
+
+    def write(self, value):
+        return value
+
+
+CSV_EXPORT_CHUNK_SIZE = 500
+
+
+def completed_task_rows(workflow, tasks: Iterable[Task]) -> Iterable[List[Any]]:
+    headers = [workflow_data["id"] for workflow_data in workflow.data]
+    yield headers
+    positions = defaultdict(list)
+    for position, block_id in enumerate(headers):
+        positions[block_id].append(position)
+    for task in tasks:
+        row = [None] * len(headers)
+        # visited in reverse so that the first block with a value wins
+        for task_data in reversed(task.data or []):
+            if task_data["id"] in positions and "value" in task_data[task_data["type"]]:
+                value = extract_value_csv_export(task_data)
+                for position in positions[task_data["id"]]:
+                    row[position] = value
+        yield row
+
+
+def task_list_to_csv_response(workflow, tasks: Iterable[Task]):
+    """
+    Streams the tasks as CSV rows while they are read from the database.
+    """
+    writer = csv.writer(Echo())
+    response = StreamingHttpResponse(
+        (writer.writerow(row) for row in completed_task_rows(workflow, tasks)),
+        content_type="text/csv",
+    )
     response[
         "Content-Disposition"
     ] = 'attachment; filename="workflow_{0}_completed_tasks.csv"'.format(workflow.id)
-    writer = csv.writer(response)
-    headers = [task_data["id"] for task_data in workflow.data]
-    writer.writerow(headers)
-    for task in task_list:
-        writer.writerow(
-            [
-                next(
-                    (
-                        extract_value_csv_export(task_data)
-                        for task_data in task.data
-                        if task_data["id"] == workflow_data["id"]
-                        and "value" in task_data[task_data["type"]]
-                    ),
-                    None,
-                )
-                for workflow_data in workflow.data
-            ]
-        )
     return response
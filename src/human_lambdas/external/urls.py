@@ -3,6 +3,7 @@ from django.urls import path
 from human_lambdas.workflow_handler.flush import FlushTasksView
 from human_lambdas.workflow_handler.views import (
     ExternalWorkflowView,
+    ListWebhookDeliveryView,
     ListWorkflowView,
     RUWebhookView,
 )
@@ -64,6 +65,11 @@ urlpatterns = [
         RUWebhookView.as_view(),
         name="webhook",
     ),
+    path(
+        "orgs/<int:org_id>/workflows/<int:workflow_id>/webhook/deliveries",
+        ListWebhookDeliveryView.as_view(),
+        name="webhook-deliveries",
+    ),
     path(
         "orgs/<int:org_id>/workflows/<int:workflow_id>/tasks/create",
         CreateTaskView.as_view(),
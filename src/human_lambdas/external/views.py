@@ -49,14 +49,15 @@ class GetExternalCompletedTaskView(GetCompletedTaskView):
             },
         )
         return (
-            Task.objects.defer("data")
+            Task.objects.prefetch_regional_data()
+            .select_related("workflow", "assigned_to", "source")
             .filter(
                 Q(workflow=workflow)
                 & Q(status="completed")
                 & Q(completed_at__range=(parse_dates(self.request)))
             )
             .filter(*args, **kwargs)
-            .order_by("-completed_at")
+            .order_by("-completed_at", "-pk")
         )
 
 
@@ -100,7 +101,7 @@ class CreateTaskView(CreateAPIView):
         formatted_data, workflow = self.preprocess_data()
 
         if workflow.is_running:
-            notify_slack(f"API Task created for {workflow.name}", request)
+            notify_slack("API Task created", workflow, request)
 
         serializer = self.get_serializer(data={**request.data, "data": formatted_data})
         serializer.is_valid(raise_exception=True)
@@ -57,8 +57,18 @@ def initdb():
     )
 
 
+@click.command()
+def worker():
+    """Runs background jobs, such as CSV imports, webhooks and emails"""
+    cmd = f"{sys.executable} -m human_lambdas.manage runworker"
+    click.echo(f"Running {cmd}")
+
+    subprocess.run(cmd, shell=True, check=True)
+
+
 cli.add_command(up)
 cli.add_command(initdb)
+cli.add_command(worker)
 
 if __name__ == "__main__":
     cli()
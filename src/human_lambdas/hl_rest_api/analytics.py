@@ -1,31 +1,60 @@
+import logging
+
 import analytics
+from analytics.request import post as post_batch
 from django.conf import settings
+from django.utils import timezone
 
+from .background import BackgroundDispatcher
 from .hl_client import enqueue_signup
 
+logger = logging.getLogger(__name__)
+
+
+def send(calls):
+    """
+    Sends the analytics calls to Segment in one request, the client only
+    builds their messages. The calls carry the time they were made at, as
+    they are only sent when the dispatcher flushes.
+    """
+    if not analytics.write_key:
+        return
+    client = analytics.Client(analytics.write_key, send=False)
+    batch = []
+    for method, args, timestamp in calls:
+        try:
+            _, message = getattr(client, method)(*args, timestamp=timestamp)
+        except Exception:
+            logger.exception(f"Invalid analytics {method} call")
+        else:
+            batch.append(message)
+    if batch:
+        post_batch(analytics.write_key, batch=batch)
+
+
+# the calls are sent from a background thread, so that Segment never holds
+# up the requests tracking them
+dispatcher = BackgroundDispatcher(
+    "analytics",
+    send,
+    max_size=settings.ANALYTICS_QUEUE_SIZE,
+    flush_interval=settings.ANALYTICS_FLUSH_SECONDS,
+)
+
 
 def alias(new_id, old_id):
     if not settings.DEBUG:
-        try:
-            analytics.alias(new_id, old_id)
-        except:
-            pass
+        dispatcher.put(("alias", (new_id, old_id), timezone.now()))
 
 
 def identify(*args):
     if not settings.DEBUG:
-        try:
-            analytics.identify(*args)
-        except:
-            pass
+        dispatcher.put(("identify", args, timezone.now()))
 
 
 def track(*args):
     if not settings.DEBUG:
-        try:
-            analytics.track(*args)
-        except:
-            pass
+        dispatcher.put(("track", args, timezone.now()))
 
 
 def signup_events(user_obj, organization_obj):
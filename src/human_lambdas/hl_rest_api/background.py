@@ -0,0 +1,152 @@
+"""
+Buffered sending from a background thread, for the calls to external
+services which should not hold up the requests making them.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundDispatcher:
+    """
+    Hands the items put on its queue to handle in batches of up to
+    batch_size from a daemon thread, at least every flush_interval seconds.
+
+    The queue holds at most max_size items, the oldest are dropped when it
+    is full so that a slow service never holds up the requests. The queue
+    depth and the dropped items are logged every stats_interval seconds, and
+    the queue is flushed on exit.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handle: Callable[[List[Any]], None],
+        max_size: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        stats_interval: float = 60.0,
+    ):
+        self.name = name
+        self.handle = handle
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats_interval = stats_interval
+        self.queue: deque = deque()
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.handled = 0
+        self.failed = 0
+        self.dropped = 0
+        self.closed = False
+        self.thread: Optional[threading.Thread] = None
+        self.pid: Optional[int] = None
+        atexit.register(self.close)
+
+    def put(self, item: Any) -> None:
+        with self.condition:
+            if self.closed:
+                self.dropped += 1
+                return
+            if len(self.queue) >= self.max_size:
+                self.queue.popleft()
+                self.dropped += 1
+            self.queue.append(item)
+            self._start()
+            if len(self.queue) >= self.batch_size:
+                self.condition.notify_all()
+
+    def _start(self) -> None:
+        # started by the first item of every process, the thread of a
+        # parent process does not run in the forked workers
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.in_flight = 0
+            self.thread = threading.Thread(
+                target=self._run, name=f"{self.name}-dispatcher", daemon=True
+            )
+            self.thread.start()
+
+    def _run(self) -> None:
+        logged_at = time.monotonic()
+        while True:
+            with self.condition:
+                if len(self.queue) < self.batch_size and not self.closed:
+                    self.condition.wait(self.flush_interval)
+                if not self.queue and self.closed:
+                    return
+                batch = [
+                    self.queue.popleft()
+                    for _ in range(min(self.batch_size, len(self.queue)))
+                ]
+                self.in_flight = len(batch)
+            if batch:
+                self._handle(batch)
+            if time.monotonic() - logged_at >= self.stats_interval:
+                self.log_stats()
+                logged_at = time.monotonic()
+
+    def _handle(self, batch: List[Any]) -> None:
+        try:
+            self.handle(batch)
+        except Exception:
+            logger.exception(f"{self.name}: failed to send {len(batch)} items")
+            failed = len(batch)
+        else:
+            failed = 0
+        with self.condition:
+            self.handled += len(batch) - failed
+            self.failed += failed
+            self.in_flight = 0
+            self.condition.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self.condition:
+            return {
+                "depth": len(self.queue),
+                "handled": self.handled,
+                "failed": self.failed,
+                "dropped": self.dropped,
+            }
+
+    def log_stats(self) -> None:
+        stats = self.stats()
+        log = logger.warning if stats["dropped"] else logger.info
+        log(
+            f"{self.name} queue: depth {stats['depth']}, handled "
+            f"{stats['handled']}, failed {stats['failed']}, dropped "
+            f"{stats['dropped']}"
+        )
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until the queued items are handled, whether they were.
+        """
+        with self.condition:
+            if self.pid != os.getpid():
+                return not self.queue
+            self.condition.notify_all()
+            return self.condition.wait_for(
+                lambda: not self.queue and not self.in_flight, timeout
+            )
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Handles the queued items and stops the thread.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+            thread = self.thread if self.pid == os.getpid() else None
+        if thread is not None:
+            thread.join(timeout)
+        if self.dropped:
+            self.log_stats()
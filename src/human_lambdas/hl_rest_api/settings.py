@@ -159,6 +159,11 @@ STATIC_URL = "/"
 STATIC_ROOT = os.path.join(BASE_DIR, "html", "build")
 WHITENOISE_INDEX_FILE = True
 
+# Uploaded CSV files, kept until their import job completed
+MEDIA_ROOT = os.getenv(
+    "MEDIA_ROOT", (Path.cwd() / ".human_lambdas" / "media").as_posix()
+)
+
 AUTH_USER_MODEL = "user_handler.User"
 
 if DEBUG:
@@ -306,12 +311,25 @@ if LOCAL_IP and not DEBUG:
 
 
 SEGMENT_KEY = os.environ.get("SEGMENT_KEY")
+# Most analytics events queued per process, the oldest are dropped beyond it
+ANALYTICS_QUEUE_SIZE = int(os.getenv("ANALYTICS_QUEUE_SIZE", 10000))
+ANALYTICS_FLUSH_SECONDS = float(os.getenv("ANALYTICS_FLUSH_SECONDS", 1.0))
+# Slack notifications are sent in the background, the repeated ones within
+# SLACK_COALESCE_SECONDS once
+SLACK_COALESCE_SECONDS = float(os.getenv("SLACK_COALESCE_SECONDS", 10))
+SLACK_TIMEOUT_SECONDS = float(os.getenv("SLACK_TIMEOUT_SECONDS", 5))
 
 # Notification email
 SEND_NOTIFICATION_TEMPLATE = os.environ.get("SEND_NOTIFICATION_TEMPLATE")
 NOTIFICATION_ASM_GROUPID = os.environ.get("NOTIFICATION_ASM_GROUPID")
 
 THROTTLING_TIME_MIN = 5
+# Send notification emails in the background, with `manage.py runworker`,
+# instead of within the request, see user_handler.models.EmailOutbox
+EMAIL_BACKGROUND = os.getenv("EMAIL_BACKGROUND") == "True"
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 5))
+EMAIL_RETRY_SECONDS = float(os.getenv("EMAIL_RETRY_SECONDS", 60))
+EMAIL_LEASE_SECONDS = int(os.getenv("EMAIL_LEASE_SECONDS", 300))
 
 # Account Emails
 INVITATION_EXPIRATION_WINDOW_DAYS = 30
@@ -343,3 +361,96 @@ DEV_BUCKET = "data-local-dev"
 
 REGIONAL_BUCKET_AU = os.getenv("REGIONAL_BUCKET_AU", DEV_BUCKET)
 REGIONAL_BUCKET_US = os.getenv("REGIONAL_BUCKET_US", DEV_BUCKET)
+# Where regional task data is stored, see workflow_handler.storage_backends.
+# REGIONAL_STORAGE_LOCAL_DIR keeps every region on the local filesystem instead
+# of Cloud Storage.
+REGIONAL_STORAGE_LOCAL_DIR = os.getenv("REGIONAL_STORAGE_LOCAL_DIR")
+if REGIONAL_STORAGE_LOCAL_DIR:
+    REGIONAL_STORAGE = {
+        region: {
+            "BACKEND": "human_lambdas.workflow_handler.storage_backends.FileSystemBackend",
+            "LOCATION": os.path.join(REGIONAL_STORAGE_LOCAL_DIR, region),
+        }
+        for region in ["AU", "US"]
+    }
+else:
+    REGIONAL_STORAGE = {
+        "AU": {
+            "BACKEND": "human_lambdas.workflow_handler.storage_backends.GCSBackend",
+            "LOCATION": REGIONAL_BUCKET_AU,
+        },
+        "US": {
+            "BACKEND": "human_lambdas.workflow_handler.storage_backends.GCSBackend",
+            "LOCATION": REGIONAL_BUCKET_US,
+        },
+    }
+# Concurrent transfers of regional_storage.retrieve_many/store_many
+REGIONAL_STORAGE_MAX_WORKERS = int(os.getenv("REGIONAL_STORAGE_MAX_WORKERS", 8))
+# In-process cache of regional blobs, revalidated against the blob generation
+REGIONAL_CACHE_MAX_BYTES = int(os.getenv("REGIONAL_CACHE_MAX_BYTES", 64_000_000))
+# Cached blobs are served without revalidating them for this long after the
+# bucket last confirmed them, so changes made by other servers can take as
+# long to show
+REGIONAL_CACHE_REVALIDATE_SECONDS = float(
+    os.getenv("REGIONAL_CACHE_REVALIDATE_SECONDS", 5)
+)
+# Optional Fernet-encrypted disk tier (requires cryptography). Only enable it
+# for the regions this server is located in.
+REGIONAL_CACHE_DISK_DIR = os.getenv("REGIONAL_CACHE_DISK_DIR")
+REGIONAL_CACHE_DISK_KEY = os.getenv("REGIONAL_CACHE_DISK_KEY")
+REGIONAL_CACHE_DISK_REGIONS = [
+    region
+    for region in os.getenv("REGIONAL_CACHE_DISK_REGIONS", "").split(",")
+    if region
+]
+# Import uploaded CSV files in the background, with `manage.py runworker`,
+# instead of within the upload request
+CSV_IMPORT_BACKGROUND = os.getenv("CSV_IMPORT_BACKGROUND") == "True"
+CSV_IMPORT_CHUNK_SIZE = int(os.getenv("CSV_IMPORT_CHUNK_SIZE", 1000))
+# Cache of the metrics per time bucket, see metrics.cache. Local memory by
+# default, METRICS_CACHE_URL selects a shared Redis server (requires
+# django-redis). The local memory cache is per process: changes only
+# invalidate the cache of the process handling them.
+METRICS_CACHE_URL = os.getenv("METRICS_CACHE_URL")
+if os.getenv("PYTEST") == "true":
+    METRICS_CACHE = {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+elif METRICS_CACHE_URL:
+    METRICS_CACHE = {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": METRICS_CACHE_URL,
+    }
+else:
+    METRICS_CACHE = {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "metrics",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "metrics": METRICS_CACHE,
+}
+# Seconds the metrics of the current (not yet ended) bucket are cached
+METRICS_CACHE_CURRENT_TTL = int(os.getenv("METRICS_CACHE_CURRENT_TTL", 60))
+# Seconds the metrics of ended buckets are cached. By default until
+# invalidated with Redis, and 5 minutes with the local memory cache, which
+# the other processes do not see invalidated
+if os.getenv("METRICS_CACHE_CLOSED_TTL"):
+    METRICS_CACHE_CLOSED_TTL = int(os.getenv("METRICS_CACHE_CLOSED_TTL"))
+elif METRICS_CACHE_URL:
+    METRICS_CACHE_CLOSED_TTL = None
+else:
+    METRICS_CACHE_CLOSED_TTL = 300
+# Seconds the task counts requested with cursor pagination are cached
+TASK_COUNT_CACHE_TTL = int(os.getenv("TASK_COUNT_CACHE_TTL", 60))
+# Deliver webhooks in the background, with `manage.py runworker`, instead of
+# within the request of the event, see workflow_handler.webhooks
+WEBHOOK_BACKGROUND = os.getenv("WEBHOOK_BACKGROUND") == "True"
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", 16))
+WEBHOOK_TARGET_CONCURRENCY = int(os.getenv("WEBHOOK_TARGET_CONCURRENCY", 2))
+WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", 10))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", 8))
+WEBHOOK_RETRY_BASE_SECONDS = float(os.getenv("WEBHOOK_RETRY_BASE_SECONDS", 30))
+WEBHOOK_RETRY_MAX_SECONDS = float(os.getenv("WEBHOOK_RETRY_MAX_SECONDS", 6 * 60 * 60))
+WEBHOOK_LEASE_SECONDS = int(os.getenv("WEBHOOK_LEASE_SECONDS", 300))
+WEBHOOK_MAX_BATCH_SIZE = int(os.getenv("WEBHOOK_MAX_BATCH_SIZE", 1000))
+WEBHOOK_MAX_BATCH_WINDOW_MS = int(os.getenv("WEBHOOK_MAX_BATCH_WINDOW_MS", 60000))
@@ -0,0 +1,129 @@
+import datetime
+import threading
+from unittest import mock
+
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from human_lambdas.hl_rest_api import analytics
+from human_lambdas.hl_rest_api.background import BackgroundDispatcher
+
+
+class TestBackgroundDispatcher(APITestCase):
+    def setUp(self):
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def handle(self, batch):
+        self.release.wait()
+        self.batches.append(batch)
+
+    def dispatcher(self, **kwargs):
+        dispatcher = BackgroundDispatcher("test", self.handle, **kwargs)
+        self.addCleanup(dispatcher.close)
+        return dispatcher
+
+    def test_batches(self):
+        dispatcher = self.dispatcher(batch_size=100, flush_interval=0.01)
+        for i in range(250):
+            dispatcher.put(i)
+        self.assertTrue(dispatcher.flush(timeout=5))
+
+        self.assertEqual([i for batch in self.batches for i in batch], list(range(250)))
+        self.assertTrue(all(len(batch) <= 100 for batch in self.batches))
+        self.assertEqual(
+            dispatcher.stats(), {"depth": 0, "handled": 250, "failed": 0, "dropped": 0}
+        )
+
+    def test_drops_oldest_when_full(self):
+        dispatcher = self.dispatcher(max_size=3, batch_size=1, flush_interval=0.01)
+        self.release.clear()
+        dispatcher.put("a")
+        with dispatcher.condition:
+            dispatcher.condition.wait_for(lambda: dispatcher.in_flight, timeout=5)
+        for item in "bcde":
+            dispatcher.put(item)
+        self.assertEqual(dispatcher.stats()["depth"], 3)
+        self.release.set()
+        self.assertTrue(dispatcher.flush(timeout=5))
+
+        self.assertEqual(self.batches, [["a"], ["c"], ["d"], ["e"]])
+        self.assertEqual(dispatcher.stats()["dropped"], 1)
+
+    def test_failures_are_counted(self):
+        def handle(batch):
+            if "bad" in batch:
+                raise ValueError()
+            self.batches.append(batch)
+
+        dispatcher = BackgroundDispatcher("test", handle, batch_size=1)
+        self.addCleanup(dispatcher.close)
+        dispatcher.put("bad")
+        dispatcher.put("good")
+        self.assertTrue(dispatcher.flush(timeout=5))
+
+        self.assertEqual(self.batches, [["good"]])
+        self.assertEqual(dispatcher.stats()["failed"], 1)
+        self.assertEqual(dispatcher.stats()["handled"], 1)
+
+    def test_close_flushes(self):
+        dispatcher = self.dispatcher(flush_interval=60)
+        dispatcher.put("a")
+        dispatcher.close()
+
+        self.assertEqual(self.batches, [["a"]])
+        dispatcher.put("b")
+        self.assertEqual(dispatcher.stats()["dropped"], 1)
+
+
+class TestAnalytics(APITestCase):
+    @override_settings(DEBUG=False)
+    @mock.patch("analytics.write_key", "key")
+    @mock.patch("human_lambdas.hl_rest_api.analytics.post_batch")
+    def test_sent_in_batches(self, post_batch):
+        analytics.identify(1, {"is_admin": True})
+        analytics.track(1, "Get Token")
+        self.assertTrue(analytics.dispatcher.flush(timeout=5))
+
+        messages = [
+            message
+            for call in post_batch.call_args_list
+            for message in call[1]["batch"]
+        ]
+        self.assertEqual(
+            [message["type"] for message in messages], ["identify", "track"]
+        )
+        self.assertEqual(messages[1]["event"], "Get Token")
+        self.assertEqual(messages[1]["userId"], "1")
+
+    @override_settings(DEBUG=False)
+    @mock.patch("analytics.write_key", "key")
+    @mock.patch("human_lambdas.hl_rest_api.analytics.post_batch")
+    def test_timestamped_when_tracked(self, post_batch):
+        tracked_at = [
+            datetime.datetime(2021, 5, 26, 14, 20, second, tzinfo=datetime.timezone.utc)
+            for second in (1, 2)
+        ]
+        with mock.patch("django.utils.timezone.now", side_effect=tracked_at):
+            analytics.track(1, "Get Token")
+            analytics.track(1, "Get Token")
+        self.assertTrue(analytics.dispatcher.flush(timeout=5))
+
+        messages = [
+            message
+            for call in post_batch.call_args_list
+            for message in call[1]["batch"]
+        ]
+        self.assertEqual(
+            [message["timestamp"] for message in messages],
+            [timestamp.isoformat() for timestamp in tracked_at],
+        )
+
+    @mock.patch("analytics.write_key", "key")
+    @mock.patch("human_lambdas.hl_rest_api.analytics.post_batch")
+    def test_not_tracked_in_debug(self, post_batch):
+        analytics.track(1, "Get Token")
+        analytics.dispatcher.flush(timeout=5)
+
+        post_batch.assert_not_called()
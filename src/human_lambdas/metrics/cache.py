@@ -0,0 +1,136 @@
+"""
+Caches the computed metrics per time bucket in the "metrics" cache.
+
+A bucket which has ended only changes when the tasks completed within it
+are audited, so its metrics are kept until invalidated, while those of the
+current bucket expire after METRICS_CACHE_CURRENT_TTL seconds. Every bucket
+has a version, part of the keys of its cached metrics, which invalidate
+replaces when a task completed within the bucket is completed or audited.
+The organization has a version as well, replaced by invalidate_organization
+when a change can affect any bucket, such as disabling a workflow.
+"""
+
+import datetime
+import hashlib
+import json
+from typing import Callable, Iterable, List, Optional
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .engine import TRUNC_KINDS, Metrics, TimeRange
+
+
+def get_cache():
+    return caches["metrics"]
+
+
+def bucket_start(kind: str, day: datetime.date) -> datetime.date:
+    if kind == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if kind == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _version_key(organization_id: int, kind: str, start: datetime.date) -> str:
+    return f"metrics:{organization_id}:{kind}:{start.isoformat()}:version"
+
+
+def _organization_version_key(organization_id: int) -> str:
+    return f"metrics:{organization_id}:version"
+
+
+def invalidate(organization_id: int, days: Iterable[datetime.date]) -> None:
+    """
+    Invalidates the daily, weekly and monthly buckets of the (UTC) days.
+    """
+    keys = {
+        _version_key(organization_id, kind, bucket_start(kind, day))
+        for day in days
+        for kind in TRUNC_KINDS.values()
+    }
+    if keys:
+        get_cache().set_many({key: uuid4().hex for key in keys}, timeout=None)
+
+
+def invalidate_organization(organization_id: int) -> None:
+    """
+    Invalidates all the buckets of the organization.
+    """
+    get_cache().set(_organization_version_key(organization_id), uuid4().hex, None)
+
+
+def cached_metrics(
+    organization_id: int,
+    metrics: Iterable[str],
+    time_ranges: List[TimeRange],
+    range_name: str,
+    group_by: Optional[str],
+    entity_ids: Iterable[int],
+    compute: Callable[[List[TimeRange]], Metrics],
+) -> Metrics:
+    """
+    The metrics of the time ranges, compute is only called with the time
+    ranges which are not cached.
+    """
+    cache = get_cache()
+    kind = TRUNC_KINDS[range_name]
+    metrics = sorted(set(metrics))
+    version_keys = [
+        _version_key(organization_id, kind, start.date()) for start, _ in time_ranges
+    ]
+    organization_key = _organization_version_key(organization_id)
+    versions = cache.get_many(version_keys + [organization_key])
+    # a version evicted from the cache must not bring its old metrics back
+    new_versions = {
+        key: uuid4().hex
+        for key in version_keys + [organization_key]
+        if key not in versions
+    }
+    if new_versions:
+        cache.set_many(new_versions, timeout=None)
+        versions.update(new_versions)
+
+    query = hashlib.sha1(
+        json.dumps([metrics, group_by, sorted(entity_ids)]).encode()
+    ).hexdigest()
+    keys = [
+        f"metrics:{organization_id}:{versions[organization_key]}:{kind}"
+        f":{start.date().isoformat()}:{versions[version_key]}:{query}"
+        for (start, _), version_key in zip(time_ranges, version_keys)
+    ]
+    cached = cache.get_many(keys)
+
+    result = Metrics()
+    missing = []
+    for index, key in enumerate(keys):
+        if key not in cached:
+            missing.append(index)
+            continue
+        for metric, values in cached[key].items():
+            for entity, value in values.items():
+                result.values[metric][(index, entity)] = value
+    if not missing:
+        return result
+
+    computed = compute([time_ranges[index] for index in missing])
+    buckets = [{metric: {} for metric in metrics} for _ in missing]
+    for metric in metrics:
+        for (position, entity), value in computed.values[metric].items():
+            buckets[position][metric][entity] = value
+            result.values[metric][(missing[position], entity)] = value
+
+    current_end = max(end for _, end in time_ranges)
+    closed, current = {}, {}
+    for index, bucket in zip(missing, buckets):
+        if time_ranges[index][1] == current_end:
+            current[keys[index]] = bucket
+        else:
+            closed[keys[index]] = bucket
+    if closed:
+        cache.set_many(closed, timeout=settings.METRICS_CACHE_CLOSED_TTL)
+    if current:
+        cache.set_many(current, timeout=settings.METRICS_CACHE_CURRENT_TTL)
+    return result
@@ -0,0 +1,171 @@
+"""
+Percentiles and histograms of the handling time (aht) and turnaround time
+(tat) of completed tasks, in seconds.
+
+Percentiles are computed by the database with percentile_cont on Postgres.
+Other databases stream the values into a QuantileSketch instead, which
+keeps the memory bounded by the spread of the values rather than their
+number.
+"""
+
+import math
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from django.db import connection
+from django.db.models import (
+    Aggregate,
+    Count,
+    DurationField,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    Q,
+    QuerySet,
+)
+from django.utils import timezone
+
+# percentile metrics and their (distribution, fraction)
+PERCENTILE_METRICS = {
+    f"{distribution}_p{percentile}": (distribution, percentile / 100)
+    for distribution in ["aht", "tat"]
+    for percentile in [50, 90, 99]
+}
+HISTOGRAM_METRICS = {"aht_histogram": "aht", "tat_histogram": "tat"}
+
+# lower bounds of the histogram bins, in seconds
+HISTOGRAM_EDGES = [
+    0,
+    60,
+    5 * 60,
+    15 * 60,
+    60 * 60,
+    4 * 60 * 60,
+    24 * 60 * 60,
+    3 * 24 * 60 * 60,
+    7 * 24 * 60 * 60,
+]
+
+# relative error of the percentiles estimated by QuantileSketch
+SKETCH_RELATIVE_ACCURACY = 0.01
+
+
+class PercentileCont(Aggregate):
+    function = "percentile_cont"
+    name = "PercentileCont"
+    template = "%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+def turnaround():
+    return ExpressionWrapper(
+        F("completed_at") - F("created_at"), output_field=DurationField()
+    )
+
+
+DISTRIBUTIONS = {
+    "aht": lambda: F("handling_time_seconds"),
+    "tat": turnaround,
+}
+
+
+def annotate_distributions(tasks: QuerySet) -> QuerySet:
+    """
+    Annotates the tasks with the {distribution}_value fields, only used to
+    select the values: aggregating over these annotations is not supported
+    by Django 2.2.
+    """
+    return tasks.annotate(
+        **{
+            f"{distribution}_value": expression()
+            for distribution, expression in DISTRIBUTIONS.items()
+        }
+    )
+
+
+def supports_percentile_cont() -> bool:
+    return connection.vendor == "postgresql"
+
+
+def to_seconds(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, timezone.timedelta):
+        return value / timezone.timedelta(seconds=1)
+    return float(value)
+
+
+def percentile_aggregate(metric: str) -> Aggregate:
+    distribution, fraction = PERCENTILE_METRICS[metric]
+    output_field = DurationField() if distribution == "tat" else FloatField()
+    return PercentileCont(
+        DISTRIBUTIONS[distribution](), fraction, output_field=output_field
+    )
+
+
+def _at_least(distribution: str, seconds: int) -> Q:
+    if distribution == "tat":
+        return Q(
+            completed_at__gte=F("created_at") + timezone.timedelta(seconds=seconds)
+        )
+    return Q(handling_time_seconds__gte=seconds)
+
+
+def histogram_aggregates(metric: str) -> Dict[str, Aggregate]:
+    """
+    One conditional count per histogram bin, named {metric}_{bin}.
+    """
+    distribution = HISTOGRAM_METRICS[metric]
+    aggregates = {}
+    for index, lower in enumerate(HISTOGRAM_EDGES):
+        condition = _at_least(distribution, lower)
+        if index + 1 < len(HISTOGRAM_EDGES):
+            condition &= ~_at_least(distribution, HISTOGRAM_EDGES[index + 1])
+        aggregates[f"{metric}_{index}"] = Count("pk", filter=condition)
+    return aggregates
+
+
+def histogram_value(metric: str, row: Dict[str, Any]) -> Optional[list]:
+    counts = [row[f"{metric}_{index}"] for index in range(len(HISTOGRAM_EDGES))]
+    if not any(counts):
+        return None
+    return [
+        {"min": lower, "count": count} for lower, count in zip(HISTOGRAM_EDGES, counts)
+    ]
+
+
+class QuantileSketch:
+    """
+    Streaming quantile estimate with a bounded relative error, values are
+    counted in logarithmically growing bins (DDSketch).
+    """
+
+    def __init__(self, relative_accuracy: float = SKETCH_RELATIVE_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins: Counter = Counter()
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if value <= 0:
+            self.zeros += 1
+        else:
+            self.bins[math.ceil(math.log(value) / self.log_gamma)] += 1
+
+    def quantile(self, fraction: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = fraction * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                break
+        # the middle of the bin, within relative_accuracy of its values
+        return 2 * math.pow(self.gamma, index) / (self.gamma + 1)
@@ -0,0 +1,300 @@
+"""
+Computes the metrics of every time bucket and entity (workflow or worker) of
+a metrics request at once. Metrics of the tasks completed within a bucket are
+aggregated in one query grouped by the truncated completion time, read from
+the daily rollups when given, pending tasks are counted at the end of every
+bucket with conditional aggregates. Percentiles and histograms are
+described in distributions.
+"""
+
+import datetime
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db.models import Avg, Count, DateField, F, Q, QuerySet, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .distributions import (
+    HISTOGRAM_METRICS,
+    PERCENTILE_METRICS,
+    QuantileSketch,
+    annotate_distributions,
+    histogram_aggregates,
+    histogram_value,
+    percentile_aggregate,
+    supports_percentile_cont,
+    to_seconds,
+)
+
+TimeRange = Tuple[datetime.datetime, datetime.datetime]
+
+TRUNC_KINDS = {"daily": "day", "weekly": "week", "monthly": "month"}
+
+# metrics of the tasks completed within a bucket
+BUCKETED_METRICS = ("completed", "aht", "tat", "accuracy")
+# value of a metric for buckets without tasks
+EMPTY_VALUES = {"completed": 0, "pending": 0}
+
+COMPLETED = Q(status="completed")
+
+# rollup field of the task fields metrics are grouped by
+ROLLUP_GROUP_BY = {"workflow": "workflow", "assigned_to": "worker"}
+ROLLUP_AGGREGATES = {
+    "completed": Sum("completed"),
+    "handling_time_seconds": Sum("handling_time_seconds"),
+    "turnaround_seconds": Sum("turnaround_seconds"),
+    "audited": Sum("audited"),
+    "correct": Sum("correct"),
+}
+
+
+def _aggregates(metric: str) -> Dict[str, Any]:
+    if metric == "completed":
+        return {"completed": Count("pk", filter=COMPLETED)}
+    if metric == "aht":
+        return {"aht": Avg("handling_time_seconds", filter=COMPLETED)}
+    if metric == "tat":
+        return {"tat": Avg(F("completed_at") - F("created_at"), filter=COMPLETED)}
+    if metric == "accuracy":
+        return {
+            "audited": Count("pk", filter=~Q(correct=None)),
+            "correct": Count("pk", filter=Q(correct=True)),
+        }
+    raise ValueError(f"Unknown metric {metric}")
+
+
+def _value(metric: str, row: Dict[str, Any]) -> Any:
+    if metric == "aht":
+        return row["aht"] if row["aht"] else None
+    if metric == "tat":
+        return row["tat"] / timezone.timedelta(seconds=1) if row["tat"] else None
+    if metric == "accuracy":
+        return row["correct"] / row["audited"] if row["audited"] else None
+    return row[metric]
+
+
+def _rollup_value(metric: str, row: Dict[str, Any]) -> Any:
+    if metric == "aht":
+        aht = row["handling_time_seconds"] / row["completed"] if row["completed"] else 0
+        return aht if aht else None
+    if metric == "tat":
+        tat = row["turnaround_seconds"] / row["completed"] if row["completed"] else 0
+        return tat if tat else None
+    if metric == "accuracy":
+        return row["correct"] / row["audited"] if row["audited"] else None
+    return row[metric]
+
+
+class Metrics:
+    """
+    The computed metrics, by metric, bucket (index of the time range) and
+    entity (pk of the workflow or worker, None if not grouped).
+    """
+
+    def __init__(self):
+        self.values: Dict[str, Dict[Tuple[int, Optional[int]], Any]]
+        self.values = defaultdict(dict)
+
+    def get(self, metric: str, bucket: int, entity: Optional[int] = None) -> Any:
+        return self.values[metric].get((bucket, entity), EMPTY_VALUES.get(metric))
+
+
+def _bucketed(
+    metrics: List[str],
+    tasks: QuerySet,
+    time_ranges: List[TimeRange],
+    kind: str,
+    group_by: Optional[str],
+    result: Metrics,
+) -> None:
+    buckets = {start: index for index, (start, _) in enumerate(time_ranges)}
+    aggregates = {}
+    for metric in metrics:
+        aggregates.update(_aggregates(metric))
+    fields = ["bucket", group_by] if group_by else ["bucket"]
+    rows = (
+        tasks.filter(
+            completed_at__range=(
+                min(start for start, _ in time_ranges),
+                max(end for _, end in time_ranges),
+            )
+        )
+        .annotate(bucket=Trunc("completed_at", kind, tzinfo=timezone.utc))
+        .values(*fields)
+        .annotate(**aggregates)
+        .order_by()
+    )
+    for row in rows:
+        bucket = buckets.get(row["bucket"])
+        if bucket is None:
+            continue
+        entity = row[group_by] if group_by else None
+        for metric in metrics:
+            result.values[metric][(bucket, entity)] = _value(metric, row)
+
+
+def _bucketed_rollups(
+    metrics: List[str],
+    rollups: QuerySet,
+    time_ranges: List[TimeRange],
+    kind: str,
+    group_by: Optional[str],
+    result: Metrics,
+) -> None:
+    buckets = {start.date(): index for index, (start, _) in enumerate(time_ranges)}
+    group_by = ROLLUP_GROUP_BY[group_by] if group_by else None
+    fields = ["bucket", group_by] if group_by else ["bucket"]
+    rows = (
+        rollups.filter(
+            day__range=(
+                min(start for start, _ in time_ranges).date(),
+                max(end for _, end in time_ranges).date(),
+            )
+        )
+        .annotate(bucket=Trunc("day", kind, output_field=DateField()))
+        .values(*fields)
+        .annotate(**ROLLUP_AGGREGATES)
+        .order_by()
+    )
+    for row in rows:
+        bucket = buckets.get(row["bucket"])
+        if bucket is None:
+            continue
+        entity = row[group_by] if group_by else None
+        for metric in metrics:
+            result.values[metric][(bucket, entity)] = _rollup_value(metric, row)
+
+
+def _distributions(
+    metrics: List[str],
+    tasks: QuerySet,
+    time_ranges: List[TimeRange],
+    kind: str,
+    group_by: Optional[str],
+    result: Metrics,
+) -> None:
+    buckets = {start: index for index, (start, _) in enumerate(time_ranges)}
+    fields = ["bucket", group_by] if group_by else ["bucket"]
+    tasks = (
+        tasks.filter(
+            COMPLETED,
+            completed_at__range=(
+                min(start for start, _ in time_ranges),
+                max(end for _, end in time_ranges),
+            ),
+        )
+        .annotate(bucket=Trunc("completed_at", kind, tzinfo=timezone.utc))
+        .order_by()
+    )
+    in_database = supports_percentile_cont()
+    aggregated = [
+        metric for metric in metrics if metric in HISTOGRAM_METRICS or in_database
+    ]
+    sketched = [metric for metric in metrics if metric not in aggregated]
+
+    if aggregated:
+        aggregates = {}
+        for metric in aggregated:
+            if metric in HISTOGRAM_METRICS:
+                aggregates.update(histogram_aggregates(metric))
+            else:
+                aggregates[metric] = percentile_aggregate(metric)
+        for row in tasks.values(*fields).annotate(**aggregates):
+            bucket = buckets.get(row["bucket"])
+            if bucket is None:
+                continue
+            entity = row[group_by] if group_by else None
+            for metric in aggregated:
+                if metric in HISTOGRAM_METRICS:
+                    value = histogram_value(metric, row)
+                else:
+                    value = to_seconds(row[metric])
+                result.values[metric][(bucket, entity)] = value
+
+    if sketched:
+        distributions = {PERCENTILE_METRICS[metric][0] for metric in sketched}
+        sketches: Dict[Tuple[int, Optional[int], str], QuantileSketch]
+        sketches = defaultdict(QuantileSketch)
+        values = [f"{distribution}_value" for distribution in distributions]
+        rows = annotate_distributions(tasks).values(*fields, *values)
+        for row in rows.iterator():
+            bucket = buckets.get(row["bucket"])
+            if bucket is None:
+                continue
+            entity = row[group_by] if group_by else None
+            for distribution in distributions:
+                sketches[(bucket, entity, distribution)].add(
+                    to_seconds(row[f"{distribution}_value"])
+                )
+        for (bucket, entity, distribution), sketch in sketches.items():
+            for metric in sketched:
+                metric_distribution, fraction = PERCENTILE_METRICS[metric]
+                if metric_distribution == distribution:
+                    result.values[metric][(bucket, entity)] = sketch.quantile(fraction)
+
+
+def _pending(
+    tasks: QuerySet,
+    time_ranges: List[TimeRange],
+    group_by: Optional[str],
+    result: Metrics,
+) -> None:
+    aggregates = {
+        f"pending_{index}": Count(
+            "pk",
+            filter=Q(created_at__lte=end)
+            & (Q(completed_at__gt=end) | Q(completed_at=None)),
+        )
+        for index, (_, end) in enumerate(time_ranges)
+    }
+    tasks = tasks.filter(
+        Q(created_at__lte=max(end for _, end in time_ranges))
+        & (
+            Q(completed_at__gt=min(end for _, end in time_ranges))
+            | Q(completed_at=None)
+        )
+    ).order_by()
+    if group_by:
+        rows = tasks.values(group_by).annotate(**aggregates)
+    else:
+        rows = [tasks.aggregate(**aggregates)]
+    for row in rows:
+        entity = row[group_by] if group_by else None
+        for index in range(len(time_ranges)):
+            result.values["pending"][(index, entity)] = row[f"pending_{index}"]
+
+
+def compute_metrics(
+    metrics: Iterable[str],
+    tasks: QuerySet,
+    time_ranges: List[TimeRange],
+    range_name: str,
+    group_by: Optional[str] = None,
+    rollups: Optional[QuerySet] = None,
+) -> Metrics:
+    """
+    Computes the metrics of the tasks for every time range, per value of the
+    group_by field if given. time_ranges must be the consecutive calendar
+    days, weeks or months of range_name. The metrics of completed tasks are
+    read from the rollups instead of the tasks if given, filtered like the
+    tasks.
+    """
+    metrics = set(metrics)
+    result = Metrics()
+    kind = TRUNC_KINDS[range_name]
+    bucketed = [metric for metric in BUCKETED_METRICS if metric in metrics]
+    if bucketed and rollups is not None:
+        _bucketed_rollups(bucketed, rollups, time_ranges, kind, group_by, result)
+    elif bucketed:
+        _bucketed(bucketed, tasks, time_ranges, kind, group_by, result)
+    distributions = [
+        metric
+        for metric in metrics
+        if metric in PERCENTILE_METRICS or metric in HISTOGRAM_METRICS
+    ]
+    if distributions:
+        _distributions(distributions, tasks, time_ranges, kind, group_by, result)
+    if "pending" in metrics:
+        _pending(tasks, time_ranges, group_by, result)
+    return result
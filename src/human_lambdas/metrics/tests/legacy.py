@@ -0,0 +1,69 @@
+"""
+The metrics of a single time range, counted with one query per range like
+the views did before metrics.engine. The engine is tested against them.
+"""
+
+from django.db.models import Avg, F, Q
+
+from human_lambdas.metrics.distributions import (
+    HISTOGRAM_METRICS,
+    PERCENTILE_METRICS,
+    QuantileSketch,
+    annotate_distributions,
+    histogram_aggregates,
+    histogram_value,
+    percentile_aggregate,
+    supports_percentile_cont,
+    to_seconds,
+)
+from human_lambdas.metrics.views import process_kwargs
+from human_lambdas.workflow_handler.models import Task
+
+
+def completed_tasks(**kwargs):
+    return Task.objects.filter(
+        process_kwargs(**kwargs)
+        & Q(status="completed")
+        & Q(completed_at__range=[kwargs["start_time"], kwargs["end_time"]])
+    )
+
+
+def get_completed(**kwargs):
+    return completed_tasks(**kwargs).count()
+
+
+def get_pending(**kwargs):
+    return Task.objects.filter(
+        process_kwargs(**kwargs)
+        & Q(created_at__lte=kwargs["end_time"])
+        & Q(Q(completed_at__gt=kwargs["end_time"]) | Q(completed_at=None))
+    ).count()
+
+
+def get_aht(**kwargs):
+    result = completed_tasks(**kwargs).aggregate(aht=Avg(F("handling_time_seconds")))
+    return result["aht"] if result["aht"] else None
+
+
+def get_distribution(metric, **kwargs):
+    tasks = completed_tasks(**kwargs).order_by()
+    if metric in HISTOGRAM_METRICS:
+        return histogram_value(metric, tasks.aggregate(**histogram_aggregates(metric)))
+    if supports_percentile_cont():
+        return to_seconds(tasks.aggregate(value=percentile_aggregate(metric))["value"])
+    distribution, fraction = PERCENTILE_METRICS[metric]
+    sketch = QuantileSketch()
+    values = annotate_distributions(tasks).values_list(
+        f"{distribution}_value", flat=True
+    )
+    for value in values.iterator():
+        sketch.add(to_seconds(value))
+    return sketch.quantile(fraction)
+
+
+# tat averages durations, which SQLite does not support
+LEGACY_METRICS = {
+    "completed": get_completed,
+    "pending": get_pending,
+    "aht": get_aht,
+}
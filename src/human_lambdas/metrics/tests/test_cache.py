@@ -0,0 +1,231 @@
+import datetime
+
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITransactionTestCase
+
+from human_lambdas.metrics.cache import (
+    bucket_start,
+    cached_metrics,
+    get_cache,
+    invalidate,
+    invalidate_organization,
+)
+from human_lambdas.metrics.engine import Metrics
+from human_lambdas.metrics.tests.test_engine import create_tasks
+from human_lambdas.metrics.views import _TIME_RANGE_DICT
+from human_lambdas.user_handler.models import Organization, User
+from human_lambdas.workflow_handler.models import Task, Workflow
+from human_lambdas.workflow_handler.rollups import (
+    backfill_rollups,
+    contribution,
+    update_rollup,
+)
+from human_lambdas.workflow_handler.tests.constants import REGISTRATION_DATA
+
+METRICS_CACHE = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "metrics": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "test-metrics",
+    },
+}
+
+
+@override_settings(CACHES=METRICS_CACHE)
+class TestCachedMetrics(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.time_ranges = _TIME_RANGE_DICT["weekly"]()
+        self.computed = []
+
+    def compute(self, time_ranges):
+        self.computed.append(time_ranges)
+        metrics = Metrics()
+        for index, (start, _) in enumerate(time_ranges):
+            metrics.values["completed"][(index, 7)] = start.day
+        return metrics
+
+    def get(self, entity_ids=(7,)):
+        return cached_metrics(
+            1,
+            ["completed"],
+            self.time_ranges,
+            "weekly",
+            "workflow",
+            entity_ids,
+            self.compute,
+        )
+
+    def test_when_cached_then_not_computed_again(self):
+        first = self.get()
+        second = self.get()
+
+        self.assertEqual(self.computed, [self.time_ranges])
+        self.assertEqual(first.values, second.values)
+        self.assertEqual(second.get("completed", 3, 7), self.time_ranges[3][0].day)
+
+    def test_when_other_entities_then_computed(self):
+        self.get()
+        self.get(entity_ids=(7, 8))
+
+        self.assertEqual(len(self.computed), 2)
+
+    def test_when_day_invalidated_then_only_its_bucket_computed(self):
+        self.get()
+        start, end = self.time_ranges[4]
+
+        invalidate(1, [(start + timezone.timedelta(days=2)).date()])
+        self.get()
+
+        self.assertEqual(self.computed[1], [(start, end)])
+
+    def test_when_organization_invalidated_then_all_computed(self):
+        self.get()
+        invalidate_organization(2)
+        self.get()
+        self.assertEqual(len(self.computed), 1)
+
+        invalidate_organization(1)
+        self.get()
+        self.assertEqual(self.computed[1], self.time_ranges)
+
+    def test_bucket_start(self):
+        day = datetime.date(2021, 5, 13)
+
+        self.assertEqual(bucket_start("day", day), day)
+        self.assertEqual(bucket_start("week", day), datetime.date(2021, 5, 10))
+        self.assertEqual(bucket_start("month", day), datetime.date(2021, 5, 1))
+
+
+# the cached metrics are invalidated once the changes are committed
+@override_settings(CACHES=METRICS_CACHE)
+class TestMetricsEndpointCache(APITransactionTestCase):
+    def setUp(self):
+        get_cache().clear()
+        _ = self.client.post("/v1/users/register", REGISTRATION_DATA)
+        self.org_id = Organization.objects.get(user__email="foo@bar.com").pk
+        response = self.client.post(
+            "/v1/users/token", {"email": "foo@bar.com", "password": "foowordbar"}
+        )
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + response.data["access"])
+        user = User.objects.get(email="foo@bar.com")
+        self.workflows = [
+            Workflow.objects.create(
+                name=f"workflow {i}", organization_id=self.org_id, created_by=user
+            )
+            for i in range(3)
+        ]
+        create_tasks(self.workflows, user, timezone.now())
+        backfill_rollups(self.workflows)
+
+    def get_accuracy(self):
+        response = self.client.get(
+            f"/v1/orgs/{self.org_id}/metrics/workflows",
+            {"range": "monthly", "type": ["accuracy", "completed"]},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_when_requested_again_then_served_from_cache(self):
+        first = self.get_accuracy()
+        with CaptureQueriesContext(connection) as queries:
+            second = self.get_accuracy()
+
+        # authentication, permissions and workflows
+        self.assertLessEqual(len(queries), 4)
+        for qtype in ["accuracy", "completed"]:
+            for first_data, second_data in zip(first[qtype], second[qtype]):
+                # the current bucket ends now
+                for data_dict in [first_data, second_data]:
+                    data_dict.pop("id")
+                    data_dict.pop("date")
+                self.assertEqual(first_data, second_data)
+
+    def test_when_task_audited_then_bucket_recomputed(self):
+        task = (
+            Task.objects.filter(status="completed", correct=False)
+            .order_by("completed_at")
+            .first()
+        )
+        name = task.workflow.name
+        self.get_accuracy()
+
+        before = contribution(task)
+        task.correct = True
+        task.save()
+        update_rollup(before, contribution(task))
+        data = self.get_accuracy()
+
+        month = next(
+            data_dict
+            for data_dict in data["accuracy"]
+            if data_dict["date"] > task.completed_at
+        )
+        audited = Task.objects.filter(
+            workflow=task.workflow,
+            completed_at__year=task.completed_at.year,
+            completed_at__month=task.completed_at.month,
+            correct__isnull=False,
+        )
+        self.assertEqual(
+            month[name], audited.filter(correct=True).count() / audited.count()
+        )
+
+    def test_when_read_before_commit_then_recomputed_after(self):
+        task = (
+            Task.objects.filter(status="completed", correct=False)
+            .order_by("completed_at")
+            .first()
+        )
+        name = task.workflow.name
+        month = next(
+            index
+            for index, data_dict in enumerate(self.get_accuracy()["accuracy"])
+            if data_dict["date"] > task.completed_at
+        )
+
+        with transaction.atomic():
+            before = contribution(task)
+            task.correct = True
+            task.save()
+            update_rollup(before, contribution(task))
+            # the old metrics, still cached under the old version
+            during = self.get_accuracy()["accuracy"][month][name]
+        after = self.get_accuracy()["accuracy"][month][name]
+
+        self.assertLess(during, after)
+        audited = Task.objects.filter(
+            workflow=task.workflow,
+            completed_at__year=task.completed_at.year,
+            completed_at__month=task.completed_at.month,
+            correct__isnull=False,
+        )
+        self.assertEqual(after, audited.filter(correct=True).count() / audited.count())
+
+    def get_completed(self):
+        response = self.client.get(
+            f"/v1/orgs/{self.org_id}/metrics",
+            {"range": "monthly", "type": ["completed"]},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sum(data_dict["completed"] or 0 for data_dict in response.data)
+
+    def test_when_workflow_disabled_then_metrics_recomputed(self):
+        before = self.get_completed()
+        # the tasks of the first workflow are not completed
+        workflow = self.workflows[1]
+        response = self.client.patch(
+            f"/v1/orgs/{self.org_id}/workflows/{workflow.pk}",
+            {"disabled": True},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+
+        self.assertEqual(
+            self.get_completed(),
+            before - Task.objects.filter(workflow=workflow, status="completed").count(),
+        )
@@ -0,0 +1,104 @@
+import random
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from human_lambdas.metrics.distributions import HISTOGRAM_EDGES, QuantileSketch
+from human_lambdas.metrics.engine import compute_metrics
+from human_lambdas.metrics.tests.legacy import get_distribution
+from human_lambdas.metrics.tests.test_engine import create_tasks
+from human_lambdas.metrics.views import _TIME_RANGE_DICT
+from human_lambdas.user_handler.models import Organization, User
+from human_lambdas.workflow_handler.models import Task, Workflow
+
+
+def exact_quantile(values, fraction):
+    values = sorted(values)
+    rank = fraction * (len(values) - 1)
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+class TestQuantileSketch(SimpleTestCase):
+    def test_when_many_values_then_quantiles_within_relative_accuracy(self):
+        rng = random.Random(42)
+        values = [rng.lognormvariate(5, 2) for _ in range(20000)]
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+
+        for fraction in [0.5, 0.9, 0.99]:
+            expected = exact_quantile(values, fraction)
+            self.assertAlmostEqual(
+                sketch.quantile(fraction), expected, delta=expected * 0.02
+            )
+        self.assertLess(len(sketch.bins), 1000)
+
+    def test_when_zeros_then_zero_quantile(self):
+        sketch = QuantileSketch()
+        for value in [0, 0, 0, 10]:
+            sketch.add(value)
+
+        self.assertEqual(sketch.quantile(0.5), 0)
+        self.assertAlmostEqual(sketch.quantile(1), 10, delta=0.1)
+
+    def test_when_empty_then_none(self):
+        self.assertIsNone(QuantileSketch().quantile(0.5))
+
+
+class TestDistributionMetrics(TestCase):
+    def setUp(self):
+        self.worker = User.objects.create(name="worker", email="worker@bar.com")
+        self.organization = Organization.objects.create(name="fooInc")
+        self.organization.add_admin(self.worker)
+        self.workflows = [
+            Workflow.objects.create(
+                name=f"workflow {i}",
+                organization=self.organization,
+                created_by=self.worker,
+            )
+            for i in range(2)
+        ]
+        create_tasks(self.workflows, self.worker, timezone.now())
+
+    def test_when_grouped_by_workflow_then_equal_to_single_range(self):
+        time_ranges = _TIME_RANGE_DICT["monthly"]()
+        metrics = ["aht_p50", "aht_p90", "tat_p99", "aht_histogram", "tat_histogram"]
+
+        result = compute_metrics(
+            metrics,
+            Task.objects.filter(workflow__in=self.workflows),
+            time_ranges,
+            "monthly",
+            group_by="workflow",
+        )
+
+        for metric in metrics:
+            for index, (start_time, end_time) in enumerate(time_ranges):
+                for workflow in self.workflows:
+                    expected = get_distribution(
+                        metric,
+                        start_time=start_time,
+                        end_time=end_time,
+                        organization=self.organization,
+                        workflow=workflow,
+                    )
+                    actual = result.get(metric, index, workflow.pk)
+                    self.assertEqual(actual, expected, f"{metric} bucket {index}")
+
+    def test_when_histogram_then_every_completed_task_counted_once(self):
+        end_time = timezone.now()
+        start_time = end_time - timezone.timedelta(days=365)
+        histogram = get_distribution(
+            "tat_histogram",
+            start_time=start_time,
+            end_time=end_time,
+            organization=self.organization,
+        )
+
+        self.assertEqual([bin["min"] for bin in histogram], HISTOGRAM_EDGES)
+        self.assertEqual(
+            sum(bin["count"] for bin in histogram),
+            Task.objects.filter(status="completed").count(),
+        )
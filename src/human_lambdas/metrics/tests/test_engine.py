@@ -0,0 +1,153 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from human_lambdas.metrics.engine import compute_metrics
+from human_lambdas.metrics.tests.legacy import LEGACY_METRICS
+from human_lambdas.metrics.views import _TIME_RANGE_DICT, process_kwargs
+from human_lambdas.user_handler.models import Organization, User
+from human_lambdas.workflow_handler.models import (
+    Task,
+    TaskDailyRollup,
+    Workflow,
+)
+from human_lambdas.workflow_handler.rollups import backfill_rollups
+from human_lambdas.workflow_handler.tests.constants import REGISTRATION_DATA
+
+
+def create_tasks(workflows, worker, now):
+    for i in range(40):
+        created_at = now - timezone.timedelta(days=i * 4 + 1, hours=i)
+        completed_at = created_at + timezone.timedelta(days=i % 5, minutes=7)
+        completed = i % 3 != 0 and completed_at < now
+        task = Task.objects.create(
+            workflow=workflows[i % len(workflows)],
+            status="completed" if completed else "new",
+            completed_at=completed_at if completed else None,
+            handling_time_seconds=i * 10 if completed else 0,
+            correct=[None, True, False][i % 3] if completed else None,
+            assigned_to=worker if i % 2 else None,
+        )
+        # created_at is set on insert
+        Task.objects.filter(pk=task.pk).update(created_at=created_at)
+
+
+class TestMetricsEngine(TestCase):
+    def setUp(self):
+        self.worker = User.objects.create(name="worker", email="worker@bar.com")
+        self.organization = Organization.objects.create(name="fooInc")
+        self.organization.add_admin(self.worker)
+        self.workflows = [
+            Workflow.objects.create(
+                name=f"workflow {i}",
+                organization=self.organization,
+                created_by=self.worker,
+            )
+            for i in range(3)
+        ]
+        create_tasks(self.workflows, self.worker, timezone.now())
+
+    def assert_legacy_equal(self, range_name, group_by=None, entities=(None,)):
+        time_ranges = _TIME_RANGE_DICT[range_name]()
+        tasks = Task.objects.filter(process_kwargs(organization=self.organization))
+
+        metrics = compute_metrics(
+            LEGACY_METRICS, tasks, time_ranges, range_name, group_by=group_by
+        )
+
+        for metric, legacy in LEGACY_METRICS.items():
+            for index, (start_time, end_time) in enumerate(time_ranges):
+                for entity in entities:
+                    kwargs = {}
+                    if group_by == "workflow":
+                        kwargs["workflow"] = entity
+                    elif group_by == "assigned_to":
+                        kwargs["worker"] = entity
+                    expected = legacy(
+                        start_time=start_time,
+                        end_time=end_time,
+                        organization=self.organization,
+                        **kwargs,
+                    )
+                    actual = metrics.get(metric, index, getattr(entity, "pk", None))
+                    self.assertEqual(
+                        actual, expected, f"{metric} {range_name} bucket {index}"
+                    )
+
+    def test_when_not_grouped_then_equal_to_legacy_metrics(self):
+        for range_name in ["daily", "weekly", "monthly"]:
+            self.assert_legacy_equal(range_name)
+
+    def test_when_grouped_by_workflow_then_equal_to_legacy_metrics(self):
+        for range_name in ["daily", "weekly", "monthly"]:
+            self.assert_legacy_equal(range_name, "workflow", self.workflows)
+
+    def test_when_grouped_by_worker_then_equal_to_legacy_metrics(self):
+        self.assert_legacy_equal("monthly", "assigned_to", [self.worker])
+
+    def test_when_accuracy_computed_then_share_of_audited_tasks(self):
+        time_ranges = _TIME_RANGE_DICT["monthly"]()
+        tasks = Task.objects.filter(process_kwargs(organization=self.organization))
+
+        with self.assertNumQueries(1):
+            metrics = compute_metrics(
+                ["accuracy"], tasks, time_ranges, "monthly", group_by="workflow"
+            )
+
+        for index, (start_time, end_time) in enumerate(time_ranges):
+            for workflow in self.workflows:
+                audited = [
+                    task.correct
+                    for task in tasks.filter(workflow=workflow)
+                    if task.correct is not None
+                    and start_time <= task.completed_at < end_time
+                ]
+                expected = sum(audited) / len(audited) if audited else None
+                self.assertEqual(metrics.get("accuracy", index, workflow.pk), expected)
+
+    def test_when_read_from_rollups_then_equal_to_tasks(self):
+        backfill_rollups(self.workflows)
+        tasks = Task.objects.filter(process_kwargs(organization=self.organization))
+        rollups = TaskDailyRollup.objects.filter(organization=self.organization)
+        for range_name in ["daily", "weekly", "monthly"]:
+            for group_by in [None, "workflow", "assigned_to"]:
+                time_ranges = _TIME_RANGE_DICT[range_name]()
+                metrics = [*LEGACY_METRICS, "accuracy"]
+                args = (metrics, tasks, time_ranges, range_name, group_by)
+                expected = compute_metrics(*args)
+                actual = compute_metrics(*args, rollups=rollups)
+                self.assertEqual(actual.values, expected.values)
+
+
+class TestMetricsQueries(APITestCase):
+    def setUp(self):
+        _ = self.client.post("/v1/users/register", REGISTRATION_DATA)
+        self.org_id = Organization.objects.get(user__email="foo@bar.com").pk
+        response = self.client.post(
+            "/v1/users/token", {"email": "foo@bar.com", "password": "foowordbar"}
+        )
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + response.data["access"])
+        user = User.objects.get(email="foo@bar.com")
+        workflows = [
+            Workflow.objects.create(
+                name=f"workflow {i}", organization_id=self.org_id, created_by=user
+            )
+            for i in range(10)
+        ]
+        create_tasks(workflows, user, timezone.now())
+
+    def test_when_many_workflows_then_queries_independent_of_buckets(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                f"/v1/orgs/{self.org_id}/metrics/workflows",
+                {"range": "daily", "type": ["completed", "pending", "aht"]},
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["pending"]), 28 + 1)
+        self.assertEqual(len(response.data["completed"][0]), 10 + 2)
+        # authentication, permissions, workflows and one per kind of metric
+        self.assertLess(len(queries), 10)
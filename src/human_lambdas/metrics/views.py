@@ -1,8 +1,7 @@
 import logging
 from uuid import uuid4
 
-from django.conf import settings
-from django.db.models import Avg, F, Q
+from django.db.models import Q
 from django.utils import timezone
 from drf_yasg2.utils import swagger_auto_schema
 from rest_framework import serializers
@@ -10,9 +9,19 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from human_lambdas.metrics.cache import cached_metrics
+from human_lambdas.metrics.distributions import (
+    HISTOGRAM_METRICS,
+    PERCENTILE_METRICS,
+)
+from human_lambdas.metrics.engine import compute_metrics
 from human_lambdas.user_handler.models import Organization, User
 from human_lambdas.user_handler.permissions import IsOrgAdmin
-from human_lambdas.workflow_handler.models import Task, Workflow
+from human_lambdas.workflow_handler.models import (
+    Task,
+    TaskDailyRollup,
+    Workflow,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -32,95 +41,26 @@ def process_kwargs(**kwargs):
     return query
 
 
-def get_completed(**kwargs):
-    basic_query = process_kwargs(**kwargs)
-    tasks = Task.objects.defer("data").filter(
-        basic_query
-        & Q(status="completed")
-        & Q(completed_at__range=[kwargs["start_time"], kwargs["end_time"]])
-    )
-    return tasks.count()
-
-
-def get_pending(**kwargs):
-    basic_query = process_kwargs(**kwargs)
-    result = (
-        Task.objects.defer("data")
-        .filter(
-            basic_query
-            & Q(created_at__lte=kwargs["end_time"])
-            & Q(Q(completed_at__gt=kwargs["end_time"]) | Q(completed_at=None))
-        )
-        .count()
-    )
-    return result
+METRICS = (
+    "completed",
+    "pending",
+    "aht",
+    "tat",
+    "accuracy",
+    *PERCENTILE_METRICS,
+    *HISTOGRAM_METRICS,
+)
 
-
-def get_aht(**kwargs):
-    basic_query = process_kwargs(**kwargs)
-    result = (
-        Task.objects.defer("data")
-        .filter(
-            basic_query
-            & Q(status="completed")
-            & Q(completed_at__range=[kwargs["start_time"], kwargs["end_time"]])
-        )
-        .aggregate(aht=Avg(F("handling_time_seconds")))
-    )
-    aht = result["aht"]
-    return aht if aht else None
-
-
-def get_tat(**kwargs):
-    basic_query = process_kwargs(**kwargs)
-    result = (
-        Task.objects.defer("data")
-        .filter(
-            basic_query
-            & Q(status="completed")
-            & Q(completed_at__range=[kwargs["start_time"], kwargs["end_time"]])
-        )
-        .aggregate(tat=Avg(F("completed_at") - F("created_at")))
-    )
-    tat = result["tat"]
-    return tat / timezone.timedelta(seconds=1) if tat else None
-
-
-def get_accuracy(**kwargs):
-    basic_query = process_kwargs(**kwargs)
-    all_audited = Task.objects.defer("data").filter(
-        basic_query
-        & ~Q(correct=None)
-        & Q(completed_at__range=[kwargs["start_time"], kwargs["end_time"]])
-    )
-
-    if not all_audited.exists():
-        return None
-
-    num_audited = float(len(all_audited))
-    num_correct = float(len(all_audited.filter(Q(correct=True))))
-
-    return num_correct / num_audited
-
-
-METRICS = {
-    "completed": get_completed,
-    "pending": get_pending,
-    "aht": get_aht,
-    "tat": get_tat,
-    "accuracy": get_accuracy,
-}
-
-WORKER_METRICS = {
-    "completed": get_completed,
-    "aht": get_aht,
-    "accuracy": get_accuracy,
-}
+WORKER_METRICS = tuple(
+    metric
+    for metric in METRICS
+    if metric in ("completed", "aht", "accuracy") or metric.startswith("aht_")
+)
 
 
 class WorkflowMetricsQuerySerializer(serializers.Serializer):
     range = serializers.CharField(required=False)
-    type = serializers.MultipleChoiceField(list(METRICS.keys()), required=False)
+    type = serializers.MultipleChoiceField(METRICS, required=False)
 
 
 def process_monthly():
@@ -165,6 +105,67 @@ _TIME_RANGE_DICT = {
 }
 
 
+def get_metrics(
+    organization,
+    metrics,
+    tasks,
+    rollups,
+    time_ranges,
+    range_name,
+    group_by=None,
+    entities=(),
+):
+    """
+    compute_metrics, for the time ranges which are not cached.
+    """
+    return cached_metrics(
+        organization.pk,
+        metrics,
+        time_ranges,
+        range_name,
+        group_by,
+        [entity.pk for entity in entities],
+        lambda missing: compute_metrics(
+            metrics, tasks, missing, range_name, group_by=group_by, rollups=rollups
+        ),
+    )
+
+
+def entity_metrics(
+    organization, qtypes, available, tasks, rollups, entities, group_by, range_name
+):
+    """
+    The metrics of every entity (workflow or worker) per time range, keyed by
+    the entity names.
+    """
+    entities = list(entities)
+    time_ranges = _TIME_RANGE_DICT[range_name]()
+    metrics = get_metrics(
+        organization,
+        [qtype for qtype in qtypes if qtype in available],
+        tasks,
+        rollups,
+        time_ranges,
+        range_name,
+        group_by=group_by,
+        entities=entities,
+    )
+    result = {}
+    for qtype in qtypes:
+        data = []
+        for index, (start_time, end_time) in reversed(list(enumerate(time_ranges))):
+            data_dict = {
+                "date": end_time,
+                "id": uuid4().hex,
+            }
+            if qtype in available:
+                for entity in entities:
+                    data_dict[entity.name] = metrics.get(qtype, index, entity.pk)
+            data.append(data_dict)
+        result[qtype] = data
+    return result
+
+
 class OrganizationMetrics(APIView):
     permission_classes = (IsAuthenticated, IsOrgAdmin)
 
@@ -179,16 +180,24 @@ class OrganizationMetrics(APIView):
 
     @swagger_auto_schema(query_serializer=WorkflowMetricsQuerySerializer)
     def get(self, request, *args, **kwargs):
-        if settings.DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
-            return Response(None, status=204)
-
         self.validate_data(request.data)
         data = []
         qtypes = request.query_params.getlist("type")
         if any([qtype in METRICS for qtype in qtypes]):
             organization = self.get_queryset().first()
-            time_ranges = self.process_time_range(request.query_params.get("range"))
-            for start_time, end_time in reversed(time_ranges):
+            range_name = request.query_params.get("range")
+            time_ranges = self.process_time_range(range_name)
+            metrics = get_metrics(
+                organization,
+                [qtype for qtype in qtypes if qtype in METRICS],
+                Task.objects.filter(process_kwargs(organization=organization)),
+                TaskDailyRollup.objects.filter(
+                    organization=organization, workflow__disabled=False
+                ),
+                time_ranges,
+                range_name,
+            )
+            for index, (start_time, end_time) in reversed(list(enumerate(time_ranges))):
                 data_dict = {
                     "date": (end_time - timezone.timedelta(microseconds=1)).replace(
                         tzinfo=None
@@ -196,14 +205,8 @@ class OrganizationMetrics(APIView):
                     "id": uuid4().hex,
                 }
                 for qtype in qtypes:
-                    try:
-                        data_dict[qtype] = METRICS[qtype](
-                            start_time=start_time,
-                            end_time=end_time,
-                            organization=organization,
-                        )
-                    except KeyError:
-                        continue
+                    if qtype in METRICS:
+                        data_dict[qtype] = metrics.get(qtype, index)
                 data.append(data_dict)
         return Response(data, status=200)
 
@@ -217,13 +220,11 @@ class WorkflowMetrics(APIView):
     def validate_data(self, data):
         pass
 
-    def process_time_range(self, range_name):
-        return _TIME_RANGE_DICT[range_name]()
-
     def get(self, request, *args, **kwargs):
         self.validate_data(request.data)
         qtypes = request.query_params.getlist("type")
         workflow_ids = request.query_params.getlist("workflow_id")
+        result = {}
         if any([qtype in METRICS for qtype in qtypes]):
             organization = self.get_queryset().first()
             if workflow_ids:
@@ -234,28 +235,22 @@ class WorkflowMetrics(APIView):
                 workflows = Workflow.objects.filter(
                     organization=organization, disabled=False
                 ).all()
-            time_ranges = self.process_time_range(request.query_params.get("range"))
-            result = {}
-            for qtype in qtypes:
-                data = []
-                for start_time, end_time in reversed(time_ranges):
-                    data_dict = {
-                        "date": end_time,
-                        "id": uuid4().hex,
-                    }
-
-                    for workflow in workflows:
-                        try:
-                            data_dict[workflow.name] = METRICS[qtype](
-                                start_time=start_time,
-                                end_time=end_time,
-                                organization=organization,
-                                workflow=workflow,
-                            )
-                        except KeyError:
-                            continue
-                    data.append(data_dict)
-                result[qtype] = data
+            result = entity_metrics(
+                organization,
+                qtypes,
+                METRICS,
+                Task.objects.filter(
+                    process_kwargs(organization=organization), workflow__in=workflows
+                ),
+                TaskDailyRollup.objects.filter(
+                    organization=organization,
+                    workflow__disabled=False,
+                    workflow__in=workflows,
+                ),
+                workflows,
+                "workflow",
+                request.query_params.get("range"),
+            )
         return Response(result, status=200)
 
 
@@ -268,13 +263,11 @@ class WorkerMetrics(APIView):
     def validate_data(self, data):
         pass
 
-    def process_time_range(self, range_name):
-        return _TIME_RANGE_DICT[range_name]()
-
     def get(self, request, *args, **kwargs):
         self.validate_data(request.data)
         qtypes = request.query_params.getlist("type")
         worker_id = request.query_params.getlist("worker_id")
+        result = {}
         if any([qtype in WORKER_METRICS for qtype in qtypes]):
             organization = self.get_queryset().first()
             if worker_id:
@@ -284,26 +277,20 @@ class WorkerMetrics(APIView):
                 ).all()
             else:
                 users = User.objects.filter(organization=organization).all()
-            time_ranges = self.process_time_range(request.query_params.get("range"))
-            result = {}
-            for qtype in qtypes:
-                data = []
-                for start_time, end_time in reversed(time_ranges):
-                    data_dict = {
-                        "date": end_time,
-                        "id": uuid4().hex,
-                    }
-
-                    for user in users:
-                        try:
-                            data_dict[user.name] = WORKER_METRICS[qtype](
-                                start_time=start_time,
-                                end_time=end_time,
-                                organization=organization,
-                                worker=user,
-                            )
-                        except KeyError:
-                            continue
-                    data.append(data_dict)
-                result[qtype] = data
+            result = entity_metrics(
+                organization,
+                qtypes,
+                WORKER_METRICS,
+                Task.objects.filter(
+                    process_kwargs(organization=organization), assigned_to__in=users
+                ),
+                TaskDailyRollup.objects.filter(
+                    organization=organization,
+                    workflow__disabled=False,
+                    worker__in=users,
+                ),
+                users,
+                "assigned_to",
+                request.query_params.get("range"),
+            )
         return Response(result, status=200)
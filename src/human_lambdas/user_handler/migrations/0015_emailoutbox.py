@@ -0,0 +1,66 @@
+# Generated by Django 2.2.13 on 2021-05-24 15:32
+
+import django.utils.timezone
+from django.db import migrations, models
+
+import human_lambdas.workflow_handler.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user_handler", "0014_invitation_invite_link"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmailOutbox",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "to_emails",
+                    human_lambdas.workflow_handler.fields.JSONField(default=list),
+                ),
+                ("template_id", models.CharField(max_length=128)),
+                (
+                    "template_data",
+                    human_lambdas.workflow_handler.fields.JSONField(default=dict),
+                ),
+                ("group_id", models.IntegerField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "pending"),
+                            ("sent", "sent"),
+                            ("failed", "failed"),
+                        ],
+                        default="pending",
+                        max_length=32,
+                    ),
+                ),
+                ("attempts", models.IntegerField(default=0)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("sent_at", models.DateTimeField(null=True)),
+                ("error", models.TextField(null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="emailoutbox",
+            index=models.Index(
+                fields=["status", "next_attempt_at"], name="email_outbox_due_idx"
+            ),
+        ),
+    ]
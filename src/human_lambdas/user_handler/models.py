@@ -1,5 +1,8 @@
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 from django.db import models
+from django.utils import timezone
+
+from human_lambdas.workflow_handler.fields import JSONField
 
 
 class Notification(models.Model):
@@ -148,3 +151,38 @@ class ForgottenPassword(models.Model):
 
     def __str__(self):
         return "{0}_forgotten_password".format(self.email)
+
+
+EMAIL_OUTBOX_STATUSES = [
+    ("pending", "pending"),
+    ("sent", "sent"),
+    ("failed", "failed"),
+]
+
+
+class EmailOutbox(models.Model):
+    """
+    A templated email queued to be sent by `manage.py runworker`, so that
+    the requests queuing it never wait on SendGrid.
+    """
+
+    to_emails = JSONField(default=list)
+    template_id = models.CharField(max_length=128)
+    template_data = JSONField(default=dict)
+    group_id = models.IntegerField()
+    status = models.CharField(
+        max_length=32, choices=EMAIL_OUTBOX_STATUSES, default="pending"
+    )
+    attempts = models.IntegerField(default=0)
+    # also pushed back while a worker is sending it
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True)
+    error = models.TextField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "next_attempt_at"], name="email_outbox_due_idx"
+            )
+        ]
@@ -1,6 +1,9 @@
 import logging
+from typing import List
 
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from rest_framework import serializers
@@ -8,9 +11,10 @@ from rest_framework.generics import RetrieveUpdateAPIView
 from rest_framework.permissions import IsAuthenticated
 
 from human_lambdas.hl_rest_api import analytics
+from human_lambdas.workflow_handler.models import WorkflowNotification
 
 from .apps import UserHandlerConfig
-from .models import Notification, User
+from .models import EmailOutbox, Notification
 
 logger = logging.getLogger(__name__)
 
@@ -62,24 +66,33 @@ class NotificationView(RetrieveUpdateAPIView):
 
 
 def send_notification(workflow):
-    users = User.objects.filter(
-        notifications__workflownotification__workflow=workflow,
-        notifications__enabled=True,
-    ).distinct()
-    emails = []
-    for user in users:
-        wf_notification = user.notifications.workflownotification_set.filter(
-            workflow=workflow
-        ).first()
-        if not wf_notification.enabled or (
-            wf_notification.last_notified
-            and timezone.now() - wf_notification.last_notified
-            < timezone.timedelta(minutes=settings.THROTTLING_TIME_MIN)
-        ):
-            continue
-        emails.append(user.email)
-        wf_notification.last_notified = timezone.now()
-        wf_notification.save()
+    """
+    Emails the new tasks of the workflow to the users with its notifications
+    enabled, and who were not notified of it in the last THROTTLING_TIME_MIN
+    minutes. With EMAIL_BACKGROUND set the email is queued for
+    `manage.py runworker` instead.
+    """
+    now = timezone.now()
+    throttled_since = now - timezone.timedelta(minutes=settings.THROTTLING_TIME_MIN)
+    with transaction.atomic():
+        # concurrent calls for the workflow skip the users claimed here
+        due = list(
+            WorkflowNotification.objects.select_for_update(
+                skip_locked=True, of=("self",)
+            )
+            .filter(
+                Q(last_notified__isnull=True) | Q(last_notified__lt=throttled_since),
+                workflow=workflow,
+                enabled=True,
+                notification__enabled=True,
+                notification__user__isnull=False,
+            )
+            .values_list("pk", "notification__user__email")
+        )
+        WorkflowNotification.objects.filter(pk__in=[pk for pk, _ in due]).update(
+            last_notified=now
+        )
+    emails = list(dict.fromkeys(email for _, email in due))
     if emails:
         if (
             settings.SEND_NOTIFICATION_TEMPLATE is None
@@ -90,13 +103,81 @@ def send_notification(workflow):
 
         template_data = {
             "workflow_name": workflow.name,
-            "org_id": workflow.organization.pk,
+            "org_id": workflow.organization_id,
             "hl_url": settings.FRONT_END_BASE_URL,
             "workflow_id": workflow.pk,
         }
-        UserHandlerConfig.emailclient.send_email(
-            to_email=emails,
+        email = EmailOutbox.objects.create(
+            to_emails=emails,
             template_id=settings.SEND_NOTIFICATION_TEMPLATE,
             template_data=template_data,
             group_id=int(settings.NOTIFICATION_ASM_GROUPID),
         )
+        if not settings.EMAIL_BACKGROUND:
+            send_email(email, retry=False)
+
+
+def claim_emails(limit: int) -> List[EmailOutbox]:
+    """
+    Leases up to limit due emails, pushing their next attempt back by
+    EMAIL_LEASE_SECONDS so that the emails of a worker which died are sent
+    once it expires.
+    """
+    now = timezone.now()
+    lease_until = now + timezone.timedelta(seconds=settings.EMAIL_LEASE_SECONDS)
+    due = (
+        EmailOutbox.objects.filter(status="pending", next_attempt_at__lte=now)
+        .order_by("next_attempt_at")
+        .values_list("pk", "next_attempt_at")
+    )
+    claimed = []
+    for pk, next_attempt_at in due[:limit]:
+        # another worker may have claimed the email in the meantime
+        if EmailOutbox.objects.filter(
+            pk=pk, status="pending", next_attempt_at=next_attempt_at
+        ).update(next_attempt_at=lease_until):
+            claimed.append(pk)
+    return list(EmailOutbox.objects.filter(pk__in=claimed).order_by("pk"))
+
+
+def send_email(email: EmailOutbox, retry: bool = True) -> None:
+    """
+    Sends an email of the outbox. A failed email is retried with exponential
+    backoff up to EMAIL_MAX_ATTEMPTS times, if retry.
+    """
+    email.attempts += 1
+    try:
+        UserHandlerConfig.emailclient.send_email(
+            to_email=email.to_emails,
+            template_id=email.template_id,
+            template_data=email.template_data,
+            group_id=email.group_id,
+        )
+    except Exception as exception:
+        UserHandlerConfig.emailclient.reset_data()
+        email.error = str(exception) or exception.__class__.__name__
+        if retry and email.attempts < settings.EMAIL_MAX_ATTEMPTS:
+            delay = settings.EMAIL_RETRY_SECONDS * 2 ** (email.attempts - 1)
+            email.next_attempt_at = timezone.now() + timezone.timedelta(seconds=delay)
+        else:
+            email.status = "failed"
+            logger.warning(
+                f"Email {email.pk} failed after {email.attempts} attempts: "
+                f"{email.error}"
+            )
+    else:
+        email.status = "sent"
+        email.sent_at = timezone.now()
+    email.save(
+        update_fields=["attempts", "status", "sent_at", "next_attempt_at", "error"]
+    )
+
+
+def send_queued_emails(limit: int = 100) -> int:
+    """
+    Sends the due emails of the outbox, the number of emails attempted.
+    """
+    emails = claim_emails(limit)
+    for email in emails:
+        send_email(email)
+    return len(emails)
@@ -1,8 +1,21 @@
+from unittest import mock
+
+from django.test import override_settings
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from human_lambdas.user_handler.models import Organization
-from human_lambdas.user_handler.notifications import send_notification
+from human_lambdas.user_handler.apps import UserHandlerConfig
+from human_lambdas.user_handler.models import (
+    EmailOutbox,
+    Notification,
+    Organization,
+    User,
+)
+from human_lambdas.user_handler.notifications import (
+    send_notification,
+    send_queued_emails,
+)
 from human_lambdas.workflow_handler.models import (
     Workflow,
     WorkflowNotification,
@@ -68,3 +81,125 @@ class TestNotifications(APITestCase):
         wfnotifications = WorkflowNotification.objects.filter(workflow=workflow).all()
         for wfn in wfnotifications:
             self.assertIsNotNone(wfn.last_notified)
+
+
+@override_settings(
+    SEND_NOTIFICATION_TEMPLATE="template",
+    NOTIFICATION_ASM_GROUPID="1",
+    EMAIL_BACKGROUND=True,
+)
+class TestNotificationEmails(APITestCase):
+    def setUp(self):
+        _ = self.client.post("/v1/users/register", REGISTRATION_DATA)
+        self.organization = Organization.objects.get(user__email="foo@bar.com")
+        self.workflow = Workflow.objects.create(
+            name="workflow",
+            organization=self.organization,
+            created_by=User.objects.get(email="foo@bar.com"),
+        )
+        self.n_users = 0
+
+    def add_users(self, n_users):
+        for _ in range(n_users):
+            self.n_users += 1
+            user = User.objects.create(
+                email=f"user{self.n_users}@bar.com",
+                notifications=Notification.objects.create(),
+            )
+            WorkflowNotification.objects.create(
+                workflow=self.workflow, notification=user.notifications
+            )
+
+    def test_constant_queries(self):
+        self.add_users(1)
+        with self.assertNumQueries(5):
+            send_notification(self.workflow)
+        WorkflowNotification.objects.update(last_notified=None)
+        self.add_users(10)
+        with self.assertNumQueries(5):
+            send_notification(self.workflow)
+
+        self.assertEqual(
+            EmailOutbox.objects.order_by("pk").last().to_emails,
+            [f"user{i}@bar.com" for i in range(1, 12)],
+        )
+
+    def test_throttling(self):
+        self.add_users(3)
+        WorkflowNotification.objects.filter(
+            notification__user__email="user1@bar.com"
+        ).update(last_notified=timezone.now())
+        WorkflowNotification.objects.filter(
+            notification__user__email="user2@bar.com"
+        ).update(last_notified=timezone.now() - timezone.timedelta(hours=1))
+        Notification.objects.filter(user__email="user3@bar.com").update(enabled=False)
+        send_notification(self.workflow)
+
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.to_emails, ["user2@bar.com"])
+        self.assertEqual(email.template_id, "template")
+        self.assertEqual(email.template_data["workflow_id"], self.workflow.pk)
+        self.assertEqual(email.status, "pending")
+
+        send_notification(self.workflow)
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+    @mock.patch.object(UserHandlerConfig.emailclient, "send_email")
+    def test_send_queued_emails(self, send_email):
+        self.add_users(1)
+        send_notification(self.workflow)
+        self.assertEqual(send_queued_emails(), 1)
+
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.status, "sent")
+        self.assertIsNotNone(email.sent_at)
+        send_email.assert_called_once_with(
+            to_email=["user1@bar.com"],
+            template_id="template",
+            template_data=email.template_data,
+            group_id=1,
+        )
+        self.assertEqual(send_queued_emails(), 0)
+
+    @override_settings(EMAIL_MAX_ATTEMPTS=2)
+    @mock.patch.object(UserHandlerConfig.emailclient, "send_email")
+    def test_failed_emails_are_retried(self, send_email):
+        send_email.side_effect = ValueError("unavailable")
+        self.add_users(1)
+        send_notification(self.workflow)
+        send_queued_emails()
+
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.status, "pending")
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(email.error, "unavailable")
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertEqual(send_queued_emails(), 0)
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        send_queued_emails()
+        email.refresh_from_db()
+        self.assertEqual(email.status, "failed")
+        self.assertEqual(email.attempts, 2)
+
+    @override_settings(EMAIL_BACKGROUND=False)
+    @mock.patch.object(UserHandlerConfig.emailclient, "send_email")
+    def test_sent_inline(self, send_email):
+        self.add_users(1)
+        send_notification(self.workflow)
+
+        send_email.assert_called_once()
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.status, "sent")
+        self.assertEqual(send_queued_emails(), 0)
+
+    @override_settings(EMAIL_BACKGROUND=False)
+    @mock.patch.object(UserHandlerConfig.emailclient, "send_email")
+    def test_failed_inline_email_is_not_retried(self, send_email):
+        send_email.side_effect = ValueError("unavailable")
+        self.add_users(1)
+        send_notification(self.workflow)
+
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.status, "failed")
+        self.assertEqual(email.attempts, 1)
@@ -20,12 +20,15 @@ from human_lambdas.workflow_handler.views import (
     CreateTaskFormView,
     CreateWorkflowView,
     FileUploadView,
+    ImportJobView,
     InternalWorkflowView,
     ListNonCompleteTaskView,
     ListTaskView,
+    ListWebhookDeliveryView,
     ListWorkflowView,
     NextTaskView,
     RefreshTaskView,
+    ResumeImportJobView,
     RUDTaskView,
     RUWebhookView,
     SaveTaskView,
@@ -36,6 +39,16 @@ urlpatterns = [
     path("", ListWorkflowView.as_view(), name="list-workflows"),
     path("/<int:workflow_id>", InternalWorkflowView.as_view(), name="update-workflow"),
     path("/<int:workflow_id>/upload", FileUploadView.as_view(), name="upload"),
+    path(
+        "/<int:workflow_id>/imports/<int:job_id>",
+        ImportJobView.as_view(),
+        name="import-job",
+    ),
+    path(
+        "/<int:workflow_id>/imports/<int:job_id>/resume",
+        ResumeImportJobView.as_view(),
+        name="resume-import-job",
+    ),
     path("/<int:workflow_id>/tasks", ListTaskView.as_view(), name="list-tasks"),
     path(
         "/<int:workflow_id>/tasks/pending",
@@ -58,6 +71,11 @@ urlpatterns = [
         name="save-task",
     ),
     path("/<int:workflow_id>/webhook", RUWebhookView.as_view(), name="webhook"),
+    path(
+        "/<int:workflow_id>/webhook/deliveries",
+        ListWebhookDeliveryView.as_view(),
+        name="webhook-deliveries",
+    ),
     path(
         "/<int:workflow_id>/tasks/<int:task_id>/assign",
         AssignTaskView.as_view(),
@@ -1,20 +1,26 @@
 from urllib.parse import urlencode
 
+from django.db import transaction
 from django.db.models import Q
-from django.shortcuts import get_list_or_404, get_object_or_404
-from next_prev import next_in_order, prev_in_order
+from django.http import Http404
+from django.shortcuts import get_object_or_404
 from rest_framework.generics import ListAPIView, RetrieveUpdateDestroyAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.status import HTTP_400_BAD_REQUEST
 from rest_framework.views import APIView
 
-from human_lambdas.data_handler.csv_utils import task_list_to_csv_response
+from human_lambdas.data_handler.csv_utils import (
+    CSV_EXPORT_CHUNK_SIZE,
+    task_list_to_csv_response,
+)
 from human_lambdas.hl_rest_api import analytics
+from human_lambdas.metrics.cache import invalidate_organization
 from human_lambdas.user_handler.models import Organization
 from human_lambdas.user_handler.permissions import IsInternalWorker, IsOrgAdmin
 
 from .models import Source, Task, TaskActivity, Workflow
+from .rollups import contribution, update_rollup
 from .serializers import (
     SourceSerializer,
     TaskMetadataSerializer,
@@ -23,10 +29,14 @@ from .serializers import (
 from .utils import (
     STAFF_ORG_ID,
     TaskPagination,
+    keyset_neighbours,
     parse_dates,
     process_query_params,
 )
 
+# most upcoming task ids returned with ?prefetch
+MAX_AUDIT_PREFETCH = 100
+
 
 def make_task_filter_url(org_id, task_id, filters):
     if task_id < 0:
@@ -62,13 +72,14 @@ class GetCompletedTaskView(ListAPIView):
     def get_queryset(self, *args, **kwargs):
         return (
             Task.objects.defer("data")
+            .with_list_fields()
             .filter(
                 self._get_ownership_filter()
                 & Q(status="completed")
                 & Q(completed_at__range=(parse_dates(self.request)))
             )
             .filter(*args, **kwargs)
-            .order_by("-completed_at")
+            .order_by("-completed_at", "-pk")
         )
 
     def list(self, request, *args, **kwargs):
@@ -97,7 +108,7 @@ class GetCompletedTasksCSVView(APIView):
             & Q(organization__pk=self.kwargs["org_id"])
         )
         return (
-            Task.objects.defer("data")
+            Task.objects.prefetch_regional_data()
             .filter(
                 Q(workflow__in=workflows)
                 & Q(status="completed")
@@ -117,13 +128,19 @@ class GetCompletedTasksCSVView(APIView):
                 status=400,
             )
         filters = process_query_params(request.query_params)
-        tasks = get_list_or_404(self.get_queryset(**filters))
+        tasks = self.get_queryset(**filters)
+        workflow_id = tasks.values_list("workflow", flat=True).first()
+        if workflow_id is None:
+            raise Http404("No Task matches the given query.")
         analytics.track(
             request.user.pk,
             "Download CSV tasks",
             {"workflow_id": request.query_params["queue_id"]},
         )
-        return task_list_to_csv_response(tasks)
+        return task_list_to_csv_response(
+            Workflow.objects.get(pk=workflow_id),
+            tasks.iterator(chunk_size=CSV_EXPORT_CHUNK_SIZE),
+        )
 
 
 class ListSourcesView(ListAPIView):
@@ -146,6 +163,7 @@ class ListSourcesView(ListAPIView):
 class AuditsGetTask(RetrieveUpdateDestroyAPIView):
     permission_classes = (IsAuthenticated, IsOrgAdmin.__or__(IsInternalWorker))
     serializer_class = TaskSerializer
+    lookup_url_kwarg = "task_id"
 
     def _get_ownership_filter(self):
         if self.kwargs["org_id"] == STAFF_ORG_ID:
@@ -172,29 +190,49 @@ class AuditsGetTask(RetrieveUpdateDestroyAPIView):
                 & Q(completed_at__range=(parse_dates(self.request)))
             )
             .filter(**filters)
-            .order_by("-completed_at")
+            .order_by("-completed_at", "-pk")
         )
 
     def get(self, request, *args, **kwargs):
+        try:
+            prefetch = int(request.query_params.get("prefetch", 0))
+        except ValueError:
+            prefetch = -1
+        if not 0 <= prefetch <= MAX_AUDIT_PREFETCH:
+            return Response(
+                status=HTTP_400_BAD_REQUEST,
+                data={
+                    "status_code": HTTP_400_BAD_REQUEST,
+                    "errors": [
+                        {
+                            "message": "prefetch must be a number between 0 and "
+                            f"{MAX_AUDIT_PREFETCH}"
+                        }
+                    ],
+                },
+            )
+
         queryset = self.filter_queryset(self.get_queryset())
         obj = get_object_or_404(queryset, pk=kwargs["task_id"])
         self.check_object_permissions(self.request, obj)
         serializer = self.get_serializer(obj)
-        next_task = next_in_order(obj, qs=queryset)
-        previous_task = prev_in_order(obj, qs=queryset)
-        next_task_id = next_task.pk if next_task else -1
-        prev_task_id = previous_task.pk if previous_task else -1
-        return Response(
-            {
-                "result": serializer.data,
-                "next": make_task_filter_url(
-                    kwargs["org_id"], next_task_id, request.query_params
-                ),
-                "previous": make_task_filter_url(
-                    kwargs["org_id"], prev_task_id, request.query_params
-                ),
-            }
-        )
+        # the neighbours are found with the (completed_at, id) of the task
+        next_task_ids = keyset_neighbours(queryset, obj, max(prefetch, 1))
+        prev_task_ids = keyset_neighbours(queryset, obj, previous=True)
+        next_task_id = next_task_ids[0] if next_task_ids else -1
+        prev_task_id = prev_task_ids[0] if prev_task_ids else -1
+        data = {
+            "result": serializer.data,
+            "next": make_task_filter_url(
+                kwargs["org_id"], next_task_id, request.query_params
+            ),
+            "previous": make_task_filter_url(
+                kwargs["org_id"], prev_task_id, request.query_params
+            ),
+        }
+        if prefetch:
+            data["upcoming"] = next_task_ids[:prefetch]
+        return Response(data)
 
     def put(self, request, *args, **kwargs):
         if kwargs["org_id"] == STAFF_ORG_ID:
@@ -219,8 +257,11 @@ class AuditsGetTask(RetrieveUpdateDestroyAPIView):
                 },
             )
 
+        before = contribution(task)
         task.correct = request.data["correct"]
-        task.save()
+        with transaction.atomic():
+            task.save()
+            update_rollup(before, contribution(task))
 
         action_name_lookup = {
             None: "audited_empty",
@@ -234,3 +275,11 @@ class AuditsGetTask(RetrieveUpdateDestroyAPIView):
             action=action_name_lookup[task.correct],
         ).save()
         return Response()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            update_rollup(contribution(instance), None)
+            instance.delete()
+            # the task was also counted as pending until its completion
+            organization_id = instance.workflow.organization_id
+            transaction.on_commit(lambda: invalidate_organization(organization_id))
@@ -1,3 +1,4 @@
+from django.db import transaction
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
@@ -6,6 +7,7 @@ from rest_framework.views import APIView
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
 from human_lambdas.external.authentication import TokenAuthentication
+from human_lambdas.metrics.cache import invalidate_organization
 from human_lambdas.user_handler.models import Organization
 from human_lambdas.workflow_handler.models import Task, Workflow
 
@@ -34,4 +36,6 @@ class FlushTasksView(APIView):
         workflow = Workflow.objects.get(pk=self.kwargs["workflow_id"])
         workflow.n_tasks = 0
         workflow.save()
+        # the flushed tasks are no longer counted as pending
+        transaction.on_commit(lambda: invalidate_organization(workflow.organization_id))
         return Response(status=200)
@@ -0,0 +1,68 @@
+"""
+Storage of the uploaded CSV files while they are imported, see
+models.ImportJob. The file of an import into a region is staged in the
+storage of the region, like the data of its tasks, so that it never leaves
+the region. The others are staged in the default file storage, MEDIA_ROOT
+unless DEFAULT_FILE_STORAGE selects a shared one.
+"""
+
+import uuid
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage, default_storage
+from django.utils.deconstruct import deconstructible
+
+from human_lambdas.workflow_handler.region import Region
+from human_lambdas.workflow_handler.storage_backends import BlobNotFound
+
+
+def import_file_path(job, filename: str) -> str:
+    """
+    The files of a region are named after it, every file gets its own
+    directory so that its name is kept.
+    """
+    path = f"imports/{uuid.uuid4().hex}/{filename}"
+    if job.region in Region.__members__:
+        return f"{job.region}/{path}"
+    return path
+
+
+@deconstructible
+class ImportStorage(Storage):
+    def _region(self, name: str) -> Tuple[Optional[Region], str]:
+        region_name, _, _ = name.partition("/")
+        if region_name not in Region.__members__:
+            return None, name
+        if settings.STORAGE_TEST_PREFIX:
+            return Region[region_name], f"{settings.STORAGE_TEST_PREFIX}/{name}"
+        return Region[region_name], name
+
+    def _open(self, name, mode="rb"):
+        region, key = self._region(name)
+        if region is None:
+            return default_storage.open(name, mode)
+        try:
+            return ContentFile(region.get_backend().read(key).content, name=name)
+        except BlobNotFound:
+            raise FileNotFoundError(name)
+
+    def _save(self, name, content):
+        region, key = self._region(name)
+        if region is None:
+            return default_storage.save(name, content)
+        region.get_backend().write(key, content.read(), content_type="text/csv")
+        return name
+
+    def delete(self, name):
+        region, key = self._region(name)
+        if region is None:
+            default_storage.delete(name)
+        else:
+            region.get_backend().delete(key)
+
+    def exists(self, name):
+        region, _ = self._region(name)
+        # the names of regional files are unique
+        return region is None and default_storage.exists(name)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from human_lambdas.workflow_handler.models import Workflow
+from human_lambdas.workflow_handler.rollups import backfill_rollups
+
+
+class Command(BaseCommand):
+    help = "Recomputes the daily metrics rollups from the completed tasks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--organization",
+            type=int,
+            action="append",
+            help="Only recompute the rollups of this organization, can be repeated",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        workflows = Workflow.objects.order_by("pk")
+        if options["organization"]:
+            workflows = workflows.filter(organization__in=options["organization"])
+        for workflow in workflows.iterator():
+            n_rollups = backfill_rollups([workflow], options["chunk_size"])
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Wrote {n_rollups} rollups for workflow "{workflow.id}"'
+                )
+            )
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+
+from human_lambdas.workflow_handler import regional_storage
+from human_lambdas.workflow_handler.models import Task
+from human_lambdas.workflow_handler.region import Region
+
+
+class Command(BaseCommand):
+    help = "Rewrites regional task blobs stored as plain JSON in the compressed format"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--region",
+            action="append",
+            choices=list(Region.__members__),
+            help="Only rewrite the blobs of this region, can be repeated",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the blobs which would be rewritten",
+        )
+
+    def handle(self, *args, **options):
+        for region_name in options["region"] or list(Region.__members__):
+            pks = (
+                Task.objects.filter(region=region_name)
+                .order_by("pk")
+                .values_list("pk", flat=True)
+            )
+            checked, rewritten = 0, 0
+            batch = []
+            for pk in pks.iterator():
+                batch.append(pk)
+                if len(batch) == options["batch_size"]:
+                    rewritten += self.recompress(batch, region_name, options)
+                    checked += len(batch)
+                    batch = []
+            if batch:
+                rewritten += self.recompress(batch, region_name, options)
+                checked += len(batch)
+
+            verb = "Would rewrite" if options["dry_run"] else "Rewrote"
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{verb} {rewritten} of {checked} task blobs in {region_name}"
+                )
+            )
+
+    def recompress(self, pks, region_name, options):
+        return regional_storage.recompress_many(
+            pks, Region[region_name], dry_run=options["dry_run"]
+        )
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from human_lambdas.workflow_handler.models import Task, comment_count
+
+
+class Command(BaseCommand):
+    help = "Recounts the comments of the tasks whose comment count is off"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--organization",
+            type=int,
+            action="append",
+            help="Only repair the tasks of this organization, can be repeated",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        tasks = (
+            Task.objects.count_comments()
+            .exclude(n_comments=F("comment_count"))
+            .order_by("pk")
+        )
+        if options["organization"]:
+            tasks = tasks.filter(workflow__organization__in=options["organization"])
+
+        pks = list(tasks.values_list("pk", flat=True))
+        for start in range(0, len(pks), options["chunk_size"]):
+            chunk = pks[start : start + options["chunk_size"]]
+            # recounted by the update, comments may have changed meanwhile
+            Task.objects.filter(pk__in=chunk).update(n_comments=comment_count())
+        self.stdout.write(
+            self.style.SUCCESS(f"Repaired the comment count of {len(pks)} tasks")
+        )
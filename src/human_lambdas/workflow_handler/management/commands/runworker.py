@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from human_lambdas.data_handler.csv_utils import (
+    claim_import_job,
+    run_import_job,
+)
+from human_lambdas.user_handler.notifications import send_queued_emails
+from human_lambdas.workflow_handler.webhooks import WebhookDispatcher
+
+QUEUES = ["imports", "webhooks", "emails"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs queued background jobs, such as CSV imports, webhook deliveries "
+        "and emails"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait for new jobs when the queue is empty",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty",
+        )
+        parser.add_argument(
+            "--queue",
+            choices=QUEUES,
+            action="append",
+            help=(
+                "Only run the jobs of this queue, can be repeated. Imports hold "
+                "up webhook deliveries while they run, so run the webhooks in "
+                "a separate worker with many imports."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        queues = options["queue"] or QUEUES
+        dispatcher = WebhookDispatcher() if "webhooks" in queues else None
+        try:
+            while True:
+                delivering = dispatcher.dispatch() if dispatcher else 0
+                busy = False
+                if "emails" in queues:
+                    busy = send_queued_emails() > 0
+                if "imports" in queues:
+                    job = claim_import_job()
+                    if job is not None:
+                        run_import_job(job)
+                        self.stdout.write(
+                            f"Import job {job.pk} {job.status}: {job.rows_done} "
+                            f"rows imported, {job.rows_failed} failed"
+                        )
+                        busy = True
+                if busy:
+                    continue
+                if options["once"] and not delivering:
+                    return
+                if delivering:
+                    # records the deliveries as soon as they finish
+                    dispatcher.collect(timeout=options["interval"])
+                else:
+                    time.sleep(options["interval"])
+        finally:
+            if dispatcher:
+                dispatcher.close()
@@ -0,0 +1,81 @@
+# Generated by Django 2.2.13 on 2021-05-10 09:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+import human_lambdas.workflow_handler.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("workflow_handler", "0036_workflow_pinned_block"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportJob",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("file", models.FileField(upload_to="imports/")),
+                ("filename", models.CharField(max_length=512)),
+                ("region", models.CharField(max_length=128, null=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "queued"),
+                            ("running", "running"),
+                            ("completed", "completed"),
+                            ("failed", "failed"),
+                        ],
+                        default="queued",
+                        max_length=32,
+                    ),
+                ),
+                ("rows_total", models.IntegerField(null=True)),
+                ("rows_done", models.IntegerField(default=0)),
+                ("rows_failed", models.IntegerField(default=0)),
+                ("offset", models.IntegerField(default=0)),
+                (
+                    "errors",
+                    human_lambdas.workflow_handler.fields.JSONField(default=list),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("started_at", models.DateTimeField(null=True)),
+                ("finished_at", models.DateTimeField(null=True)),
+                (
+                    "created_by",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "source",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="workflow_handler.Source",
+                    ),
+                ),
+                (
+                    "workflow",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="workflow_handler.Workflow",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 2.2.13 on 2021-05-12 10:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user_handler", "0014_invitation_invite_link"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("workflow_handler", "0037_importjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("completed", models.IntegerField(default=0)),
+                ("handling_time_seconds", models.BigIntegerField(default=0)),
+                ("turnaround_seconds", models.FloatField(default=0)),
+                ("audited", models.IntegerField(default=0)),
+                ("correct", models.IntegerField(default=0)),
+                (
+                    "organization",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="user_handler.Organization",
+                    ),
+                ),
+                (
+                    "worker",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "workflow",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="workflow_handler.Workflow",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="taskdailyrollup",
+            index=models.Index(
+                fields=["organization", "day"], name="workflow_ha_organiz_9a2fa0_idx"
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="taskdailyrollup",
+            unique_together={("workflow", "worker", "day")},
+        ),
+    ]
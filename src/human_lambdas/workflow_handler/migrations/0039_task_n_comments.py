@@ -0,0 +1,18 @@
+# Generated by Django 2.2.13 on 2021-05-14 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("workflow_handler", "0038_taskdailyrollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="task",
+            name="n_comments",
+            field=models.IntegerField(default=0),
+        ),
+    ]
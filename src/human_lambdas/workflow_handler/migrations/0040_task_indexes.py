@@ -0,0 +1,34 @@
+# Generated by Django 2.2.13 on 2021-05-17 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("workflow_handler", "0039_task_n_comments"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["workflow", "status", "completed_at", "id"],
+                name="task_status_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(_negated=True, status="completed"),
+                fields=["workflow", "created_at", "id"],
+                name="task_pending_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["assigned_to", "status"], name="task_assignee_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.13 on 2021-05-21 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("workflow_handler", "0041_webhookdelivery"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="webhook",
+            name="batch_size",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="webhook",
+            name="batch_window_ms",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="webhookdelivery",
+            name="batch_id",
+            field=models.UUIDField(db_index=True, null=True),
+        ),
+    ]
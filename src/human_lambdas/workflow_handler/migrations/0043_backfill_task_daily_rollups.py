@@ -0,0 +1,74 @@
+# Generated by Django 2.2.13 on 2021-05-25 09:12
+
+from collections import Counter, defaultdict
+
+from django.db import migrations
+from django.utils import timezone
+
+ROLLUP_FIELDS = (
+    "completed",
+    "handling_time_seconds",
+    "turnaround_seconds",
+    "audited",
+    "correct",
+)
+
+
+def backfill_rollups(apps, schema_editor):
+    """
+    Fills TaskDailyRollup from the tasks completed before it existed, like
+    workflow_handler.rollups.backfill_rollups.
+    """
+    Task = apps.get_model("workflow_handler", "Task")
+    TaskDailyRollup = apps.get_model("workflow_handler", "TaskDailyRollup")
+    Workflow = apps.get_model("workflow_handler", "Workflow")
+    for workflow in Workflow.objects.only("pk", "organization_id").iterator():
+        totals = defaultdict(Counter)
+        tasks = (
+            Task.objects.filter(workflow=workflow, status="completed")
+            .exclude(completed_at=None)
+            .values_list(
+                "assigned_to_id",
+                "completed_at",
+                "created_at",
+                "handling_time_seconds",
+                "correct",
+            )
+            .order_by()
+        )
+        for row in tasks.iterator(chunk_size=2000):
+            worker_id, completed_at, created_at, handling_time, correct = row
+            day = completed_at.astimezone(timezone.utc).date()
+            totals[(worker_id, day)].update(
+                completed=1,
+                handling_time_seconds=handling_time,
+                turnaround_seconds=(completed_at - created_at)
+                / timezone.timedelta(seconds=1),
+                audited=int(correct is not None),
+                correct=int(correct is True),
+            )
+        TaskDailyRollup.objects.filter(workflow=workflow).delete()
+        TaskDailyRollup.objects.bulk_create(
+            [
+                TaskDailyRollup(
+                    organization_id=workflow.organization_id,
+                    workflow=workflow,
+                    worker_id=worker_id,
+                    day=day,
+                    **{field: values[field] for field in ROLLUP_FIELDS},
+                )
+                for (worker_id, day), values in totals.items()
+            ],
+            batch_size=100,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("workflow_handler", "0042_webhook_batches"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
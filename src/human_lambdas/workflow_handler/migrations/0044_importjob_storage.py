@@ -0,0 +1,23 @@
+# Generated by Django 2.2.13 on 2021-05-25 11:03
+
+from django.db import migrations, models
+
+import human_lambdas.workflow_handler.import_storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("workflow_handler", "0043_backfill_task_daily_rollups"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="importjob",
+            name="file",
+            field=models.FileField(
+                storage=human_lambdas.workflow_handler.import_storage.ImportStorage(),
+                upload_to=human_lambdas.workflow_handler.import_storage.import_file_path,
+            ),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.2.13 on 2021-05-26 10:41
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_comment_counts(apps, schema_editor):
+    """
+    Counts the comments of the tasks created before n_comments existed,
+    like the repaircommentcounts command.
+    """
+    Task = apps.get_model("workflow_handler", "Task")
+    TaskActivity = apps.get_model("workflow_handler", "TaskActivity")
+    comments = (
+        TaskActivity.objects.filter(task=models.OuterRef("pk"), action="comment")
+        .order_by()
+        .values("task")
+        .annotate(count=models.Count("pk"))
+        .values("count")
+    )
+    comment_count = Coalesce(
+        models.Subquery(comments, output_field=models.IntegerField()), 0
+    )
+    pks = list(
+        TaskActivity.objects.filter(action="comment")
+        .order_by("task")
+        .values_list("task", flat=True)
+        .distinct()
+    )
+    for start in range(0, len(pks), 2000):
+        Task.objects.filter(pk__in=pks[start : start + 2000]).update(
+            n_comments=comment_count
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("workflow_handler", "0044_importjob_storage"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_comment_counts, migrations.RunPython.noop),
+    ]
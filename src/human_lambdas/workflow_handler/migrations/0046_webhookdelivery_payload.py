@@ -0,0 +1,20 @@
+# Generated by Django 2.2.13 on 2021-05-26 14:20
+
+from django.db import migrations
+
+import human_lambdas.workflow_handler.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("workflow_handler", "0045_backfill_task_n_comments"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="webhookdelivery",
+            name="payload",
+            field=human_lambdas.workflow_handler.fields.JSONField(null=True),
+        ),
+    ]
@@ -1,6 +1,10 @@
-from typing import Any, Dict
+import itertools
+from collections import defaultdict
+from typing import Any, Dict, Iterable
 
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from rest_hooks.models import AbstractHook
 from rest_hooks.signals import hook_event
 
@@ -8,6 +12,10 @@ from human_lambdas.data_handler.data_transformation import transform_int2ext
 from human_lambdas.user_handler.models import Notification, Organization, User
 from human_lambdas.workflow_handler import regional_storage
 from human_lambdas.workflow_handler.fields import JSONField
+from human_lambdas.workflow_handler.import_storage import (
+    ImportStorage,
+    import_file_path,
+)
 from human_lambdas.workflow_handler.region import Region
 
 STATUS_MAPPING = {"assigned": "in_progress", "pending": "new"}
@@ -42,6 +50,174 @@ class Source(models.Model):
         return self.name
 
 
+IMPORT_JOB_STATUSES = [
+    ("queued", "queued"),
+    ("running", "running"),
+    ("completed", "completed"),
+    ("failed", "failed"),
+]
+
+
+class ImportJob(models.Model):
+    """
+    A CSV upload imported in chunks. offset counts the data rows of all
+    committed chunks, a failed job resumes after them.
+    """
+
+    workflow = models.ForeignKey(Workflow, on_delete=models.CASCADE)
+    source = models.ForeignKey(Source, on_delete=models.CASCADE)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    # deleted once the job completed or failed
+    file = models.FileField(upload_to=import_file_path, storage=ImportStorage())
+    filename = models.CharField(max_length=512)
+    region = models.CharField(max_length=128, null=True)
+    status = models.CharField(
+        max_length=32, choices=IMPORT_JOB_STATUSES, default="queued"
+    )
+    rows_total = models.IntegerField(null=True)
+    rows_done = models.IntegerField(default=0)
+    rows_failed = models.IntegerField(default=0)
+    offset = models.IntegerField(default=0)
+    errors = JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    @property
+    def rows_pending(self):
+        if self.rows_total is None:
+            return None
+        return self.rows_total - self.offset
+
+    def __str__(self):
+        return self.filename
+
+
+def comment_count():
+    """
+    The number of comment activities of the task.
+    """
+    comments = (
+        TaskActivity.objects.filter(task=models.OuterRef("pk"), action="comment")
+        .order_by()
+        .values("task")
+        .annotate(count=models.Count("pk"))
+        .values("count")
+    )
+    return Coalesce(models.Subquery(comments, output_field=models.IntegerField()), 0)
+
+
+class TaskQuerySet(models.QuerySet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._prefetch_regional_data = False
+
+    def prefetch_regional_data(self):
+        """
+        Fetches the data of regional tasks in bulk once the queryset is
+        evaluated, instead of one storage request per task on first access.
+        """
+        clone = self._chain()
+        clone._prefetch_regional_data = True
+        return clone
+
+    def with_list_fields(self):
+        """
+        Joins the workflow, worker and source, which every serialized task
+        includes.
+        """
+        return self.select_related("workflow", "assigned_to", "source")
+
+    def count_comments(self):
+        """
+        Annotates the tasks with the number of their comment activities as
+        comment_count, which n_comments is repaired from.
+        """
+        return self.annotate(comment_count=comment_count())
+
+    def bulk_create(self, objs, batch_size=None, ignore_conflicts=False):
+        """
+        Like Task.save, keeps the data of regional tasks out of the database
+        and stores it in the regional storage instead. Also sets the pks of
+        the created tasks on databases which do not return them.
+        """
+        if ignore_conflicts:
+            raise ValueError("Tasks cannot be bulk created ignoring conflicts")
+        objs = list(objs)
+        regional_data = [(task, task.data) for task in objs if task.region]
+        for task, _ in regional_data:
+            task.data = {}
+        try:
+            with transaction.atomic(using=self.db, savepoint=False):
+                returns_pks = connections[
+                    self.db
+                ].features.can_return_ids_from_bulk_insert
+                if not returns_pks:
+                    last_pk = self._last_pk()
+                super().bulk_create(objs, batch_size, ignore_conflicts)
+                if not returns_pks:
+                    self._set_created_pks(objs, last_pk)
+                by_region = defaultdict(list)
+                for task, data in regional_data:
+                    by_region[task.region].append((task.pk, data))
+                for region_name, items in by_region.items():
+                    regional_storage.store_many(items, Region[region_name])
+        finally:
+            for task, data in regional_data:
+                task.data = data
+        return objs
+
+    def _last_pk(self):
+        tasks = self.model._base_manager.using(self.db)
+        return tasks.aggregate(last_pk=models.Max("pk"))["last_pk"] or 0
+
+    def _set_created_pks(self, objs, last_pk):
+        pks = list(
+            self.model._base_manager.using(self.db)
+            .filter(
+                pk__gt=last_pk,
+                workflow_id__in={task.workflow_id for task in objs},
+            )
+            .order_by("pk")
+            .values_list("pk", flat=True)[: len(objs)]
+        )
+        if len(pks) != len(objs):
+            raise RuntimeError("Could not determine the pks of the created tasks")
+        for task, pk in zip(objs, pks):
+            task.pk = pk
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._prefetch_regional_data = self._prefetch_regional_data
+        return clone
+
+    def iterator(self, chunk_size=2000):
+        """
+        With prefetch_regional_data, the data of the streamed tasks is
+        fetched in bulk chunk by chunk.
+        """
+        tasks = super().iterator(chunk_size)
+        if not self._prefetch_regional_data:
+            return tasks
+        return self._prefetching_iterator(tasks, chunk_size)
+
+    @staticmethod
+    def _prefetching_iterator(tasks, chunk_size):
+        while True:
+            chunk = list(itertools.islice(tasks, chunk_size))
+            if not chunk:
+                return
+            prefetch_regional_data(chunk)
+            yield from chunk
+
+    def _fetch_all(self):
+        fetched = self._result_cache is not None
+        super()._fetch_all()
+        if self._prefetch_regional_data and not fetched:
+            prefetch_regional_data(self._result_cache)
+
+
 class Task(models.Model):
     status = models.CharField(max_length=128, default="new")
     completed_at = models.DateTimeField(null=True)
@@ -57,6 +233,27 @@ class Task(models.Model):
     data = JSONField(blank=True, default=list)
     correct = models.BooleanField(null=True)
     region = models.CharField(max_length=128, null=True)
+    n_comments = models.IntegerField(default=0)
+
+    objects = TaskQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # the tasks of a workflow by status: claiming the next task, and
+            # the audits, exports and metrics of the completed tasks
+            models.Index(
+                fields=["workflow", "status", "completed_at", "id"],
+                name="task_status_idx",
+            ),
+            # listing the pending tasks in order
+            models.Index(
+                fields=["workflow", "created_at", "id"],
+                name="task_pending_idx",
+                condition=~models.Q(status="completed"),
+            ),
+            # the tasks assigned to a worker
+            models.Index(fields=["assigned_to", "status"], name="task_assignee_idx"),
+        ]
 
     def __str__(self):
         return "{0}_task_{1}".format(self.workflow.name, self.pk)
@@ -66,11 +263,20 @@ class Task(models.Model):
         task = super(Task, cls).from_db(db, field_names, values)
 
         if "data" in field_names and task.region:
-            region = Region[task.region]
-            task.data = regional_storage.retrieve(task.pk, region)
+            # The DB only holds a placeholder, leave the field deferred so the
+            # regional data is only fetched from storage when accessed
+            del task.__dict__["data"]
 
         return task
 
+    def refresh_from_db(self, using=None, fields=None):
+        if fields is not None and "data" in fields and self.region:
+            self.data = regional_storage.retrieve(self.pk, Region[self.region])
+            fields = [field for field in fields if field != "data"]
+            if not fields:
+                return
+        super(Task, self).refresh_from_db(using=using, fields=fields)
+
     def save(
         self,
         force_insert=False,
@@ -78,8 +284,10 @@ class Task(models.Model):
         using=None,
         update_fields=None,
     ):
+        # new tasks are inserted with all their fields
+        kwargs = {} if self._state.adding else {"update_fields": self._saved_fields()}
         if self.region is None or "data" in self.get_deferred_fields():
-            super(Task, self).save()
+            super(Task, self).save(**kwargs)
             return
 
         region = Region[self.region]
@@ -88,12 +296,26 @@ class Task(models.Model):
         data: Any = self.data
         self.data = {}
         try:
-            super(Task, self).save()
+            super(Task, self).save(**kwargs)
             regional_storage.store(self.pk, region, data)
         finally:
             # restore regional data on task
             self.data = data
 
+    def _saved_fields(self):
+        """
+        The fields written when saving an existing task. n_comments is only
+        changed by atomic updates, which saving a stale task would undo.
+        """
+        deferred = self.get_deferred_fields()
+        return [
+            field.attname
+            for field in self._meta.concrete_fields
+            if not field.primary_key
+            and field.attname not in deferred
+            and field.attname != "n_comments"
+        ]
+
     def get_status(self):
         return STATUS_MAPPING.get(self.status, self.status)
 
@@ -113,7 +335,7 @@ class Task(models.Model):
             "queue": self.workflow.pk,
             "data": self.data,
             "source": self.source.pk if self.source else None,
-            "n_comments": self.taskactivity_set.filter(action="comment").count(),
+            "n_comments": self.n_comments,
         }
 
         if self.region:
@@ -146,7 +368,7 @@ class Task(models.Model):
             "data": self.data if include_data else None,
             "source": source_name,
             "source_id": source_id,
-            "n_comments": self.taskactivity_set.filter(action="comment").count(),
+            "n_comments": self.n_comments,
             "correct": self.correct,
             "org_id": self.workflow.organization_id,
         }
@@ -191,9 +413,83 @@ class Task(models.Model):
         return self.get_formatted_task_external()
 
 
+def prefetch_regional_data(tasks: Iterable[Task]) -> None:
+    """
+    Loads the data of all regional tasks whose data has not been fetched yet,
+    grouped into one bulk retrieval per region.
+    """
+    by_region = defaultdict(list)
+    for task in tasks:
+        if (
+            isinstance(task, Task)
+            and task.region
+            and "data" in task.get_deferred_fields()
+        ):
+            by_region[task.region].append(task)
+
+    for region_name, region_tasks in by_region.items():
+        retrieved = regional_storage.retrieve_many(
+            [task.pk for task in region_tasks], Region[region_name]
+        )
+        for task, task_data in zip(region_tasks, retrieved.data):
+            task.data = task_data
+
+
 class WebHook(AbstractHook):
     workflow = models.ForeignKey(Workflow, on_delete=models.CASCADE, default=None)
     is_zapier = models.BooleanField(default=False)
+    # tasks sent together in one request, up to batch_size tasks completed
+    # within batch_window_ms of the first
+    batch_size = models.PositiveIntegerField(default=1)
+    batch_window_ms = models.PositiveIntegerField(default=0)
+
+    @property
+    def batched(self) -> bool:
+        # Zapier expects a task per request
+        return self.batch_size > 1 and not self.is_zapier
+
+
+WEBHOOK_DELIVERY_STATUSES = [
+    ("pending", "pending"),
+    ("delivered", "delivered"),
+    ("failed", "failed"),
+]
+
+
+class WebhookDelivery(models.Model):
+    """
+    A webhook event of a task, written within the transaction of the event
+    and delivered once it commits, or by the webhook dispatcher of
+    `manage.py runworker` with WEBHOOK_BACKGROUND set. Every attempt is
+    appended to the log with its status code, error and latency.
+    """
+
+    workflow = models.ForeignKey(Workflow, on_delete=models.CASCADE)
+    hook = models.ForeignKey(WebHook, on_delete=models.SET_NULL, null=True)
+    task = models.ForeignKey(Task, on_delete=models.CASCADE)
+    event = models.CharField(max_length=64)
+    target = models.URLField(max_length=255)
+    status = models.CharField(
+        max_length=32, choices=WEBHOOK_DELIVERY_STATUSES, default="pending"
+    )
+    attempts = models.IntegerField(default=0)
+    # also pushed back while a dispatcher is delivering it
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True)
+    log = JSONField(default=list)
+    # shared by the deliveries sent together by a batched webhook
+    batch_id = models.UUIDField(null=True, db_index=True)
+    # the task at the event, None for regional tasks whose data does not
+    # leave their region, which are serialized when sent
+    payload = JSONField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "next_attempt_at"], name="webhook_delivery_due_idx"
+            )
+        ]
 
 
 class WorkflowNotification(models.Model):
@@ -236,3 +532,24 @@ class TaskActivity(models.Model):
         User, on_delete=models.CASCADE, null=True, related_name="assignee"
     )
     comment = models.TextField(null=True)
+
+
+class TaskDailyRollup(models.Model):
+    """
+    Metrics of the tasks completed by a worker in a workflow on a (UTC) day,
+    kept up to date as tasks are completed and audited.
+    """
+
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    workflow = models.ForeignKey(Workflow, on_delete=models.CASCADE)
+    worker = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
+    day = models.DateField()
+    completed = models.IntegerField(default=0)
+    handling_time_seconds = models.BigIntegerField(default=0)
+    turnaround_seconds = models.FloatField(default=0)
+    audited = models.IntegerField(default=0)
+    correct = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("workflow", "worker", "day")
+        indexes = [models.Index(fields=["organization", "day"])]
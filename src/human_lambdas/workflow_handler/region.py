@@ -2,23 +2,19 @@ import functools
 from enum import Enum
 
 from django.conf import settings
-from google.cloud import storage
+from django.utils.module_loading import import_string
 
-from human_lambdas.workflow_handler.latency import timer
+from human_lambdas.workflow_handler.storage_backends import StorageBackend
 
 
 class Region(Enum):
     bucket_name: str
 
     @functools.lru_cache
-    def get_bucket(self) -> storage.Bucket:
-
-        if self.bucket_name is None:
-            raise ValueError("Regional bucket name is None. Config is missing.")
-
-        with timer(f"Connecting to cloud storage bucket {self.bucket_name}"):
-            client = storage.Client()
-            return client.get_bucket(self.bucket_name)
+    def get_backend(self) -> StorageBackend:
+        config = settings.REGIONAL_STORAGE[self.name]
+        backend_class = import_string(config["BACKEND"])
+        return backend_class(config.get("LOCATION"), **config.get("OPTIONS", {}))
 
     def __new__(cls, bucket_name: str):
         obj = object.__new__(cls)
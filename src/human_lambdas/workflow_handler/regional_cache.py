@@ -0,0 +1,221 @@
+import functools
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:  # only needed for the encrypted disk tier
+    Fernet = None
+
+logger = logging.getLogger(__name__)
+
+# (region name, task pk)
+CacheKey = Tuple[str, int]
+
+
+class CachedBlob(NamedTuple):
+    generation: int
+    content: bytes
+    # time.monotonic() of when the bucket last confirmed the generation, 0 if
+    # it never did in this process
+    validated_at: float = 0
+
+
+class LRUCache:
+    """
+    Thread-safe LRU of blobs, bounded by the total size of their content.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[CacheKey, CachedBlob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: CacheKey) -> Optional[CachedBlob]:
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is not None:
+                self._entries.move_to_end(key)
+            return blob
+
+    def put(self, key: CacheKey, blob: CachedBlob) -> None:
+        with self._lock:
+            self._pop(key)
+            if len(blob.content) > self.max_bytes:
+                return
+            self._entries[key] = blob
+            self.size += len(blob.content)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.content)
+
+    def invalidate(self, key: CacheKey) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def _pop(self, key: CacheKey) -> None:
+        blob = self._entries.pop(key, None)
+        if blob is not None:
+            self.size -= len(blob.content)
+
+
+class EncryptedDiskCache:
+    """
+    Keeps blobs Fernet-encrypted on local disk, one file per task. Only used
+    for the configured regions, i.e. those the server itself is located in,
+    so regional data never persists outside of its region.
+    """
+
+    def __init__(self, directory: str, key: str, regions: Iterable[str]):
+        if Fernet is None:
+            raise ImproperlyConfigured(
+                "The encrypted regional cache requires the cryptography package"
+            )
+        self.directory = Path(directory)
+        self.regions = set(regions)
+        self._fernet = Fernet(key)
+
+    def _path(self, key: CacheKey) -> Path:
+        region_name, pk = key
+        return self.directory / region_name / str(pk)
+
+    def get(self, key: CacheKey) -> Optional[CachedBlob]:
+        if key[0] not in self.regions:
+            return None
+        path = self._path(key)
+        try:
+            plain = self._fernet.decrypt(path.read_bytes())
+        except FileNotFoundError:
+            return None
+        except InvalidToken:
+            logger.warning(f"Discarding unreadable regional cache file {path}")
+            path.unlink(missing_ok=True)
+            return None
+        generation, _, content = plain.partition(b"\n")
+        # revalidated before it is served, the file may be stale
+        return CachedBlob(int(generation), content)
+
+    def put(self, key: CacheKey, blob: CachedBlob) -> None:
+        if key[0] not in self.regions:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        token = self._fernet.encrypt(b"%d\n%s" % (blob.generation, blob.content))
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(token)
+        os.replace(tmp_path, path)
+
+    def invalidate(self, key: CacheKey) -> None:
+        if key[0] in self.regions:
+            self._path(key).unlink(missing_ok=True)
+
+
+class RegionalCache:
+    """
+    Read-through cache of regional blobs. Entries are only served after the
+    bucket confirmed their generation is still current, and then trusted for
+    revalidate_seconds, see regional_storage.
+    """
+
+    def __init__(
+        self,
+        memory: LRUCache,
+        disk: Optional[EncryptedDiskCache] = None,
+        revalidate_seconds: float = 0,
+    ):
+        self.memory = memory
+        self.disk = disk
+        self.revalidate_seconds = revalidate_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, region_name: str, pk: int) -> Optional[CachedBlob]:
+        key = (region_name, pk)
+        blob = self.memory.get(key)
+        if blob is None and self.disk is not None:
+            blob = self.disk.get(key)
+            if blob is not None:
+                self.memory.put(key, blob)
+        return blob
+
+    def put(
+        self, region_name: str, pk: int, generation: Optional[int], content: bytes
+    ) -> None:
+        key = (region_name, pk)
+        if generation is None:
+            self.invalidate(region_name, pk)
+            return
+        blob = CachedBlob(int(generation), content, time.monotonic())
+        self.memory.put(key, blob)
+        if self.disk is not None:
+            self.disk.put(key, blob)
+
+    def is_fresh(self, blob: CachedBlob) -> bool:
+        """
+        Whether the blob was validated recently enough to be served as is.
+        """
+        return time.monotonic() - blob.validated_at < self.revalidate_seconds
+
+    def revalidated(self, region_name: str, pk: int, blob: CachedBlob) -> None:
+        self.memory.put((region_name, pk), blob._replace(validated_at=time.monotonic()))
+
+    def invalidate(self, region_name: str, pk: int) -> None:
+        key = (region_name, pk)
+        self.memory.invalidate(key)
+        if self.disk is not None:
+            self.disk.invalidate(key)
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.memory),
+            "bytes": self.memory.size,
+            "max_bytes": self.memory.max_bytes,
+            "disk": self.disk is not None,
+        }
+
+
+@functools.lru_cache
+def get_cache() -> Optional[RegionalCache]:
+    if not settings.REGIONAL_CACHE_MAX_BYTES:
+        return None
+    disk = None
+    if settings.REGIONAL_CACHE_DISK_DIR:
+        disk = EncryptedDiskCache(
+            settings.REGIONAL_CACHE_DISK_DIR,
+            settings.REGIONAL_CACHE_DISK_KEY,
+            settings.REGIONAL_CACHE_DISK_REGIONS,
+        )
+    return RegionalCache(
+        LRUCache(settings.REGIONAL_CACHE_MAX_BYTES),
+        disk,
+        settings.REGIONAL_CACHE_REVALIDATE_SECONDS,
+    )
+
+
+def stats() -> Dict[str, Any]:
+    cache = get_cache()
+    return cache.stats() if cache else {}
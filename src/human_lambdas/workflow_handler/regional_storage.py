@@ -1,16 +1,50 @@
+import functools
+import gzip
 import json
 import logging
-from typing import Any, Dict, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 from django.conf import settings
-from google.api_core.exceptions import NotFound
-from google.cloud.storage import Blob
 
+from human_lambdas.workflow_handler import regional_cache
 from human_lambdas.workflow_handler.latency import timer
 from human_lambdas.workflow_handler.region import Region
+from human_lambdas.workflow_handler.storage_backends import (
+    BlobNotFound,
+    BlobNotModified,
+    GenerationMismatch,
+)
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Blobs are stored as gzip compressed, compact JSON (format 2). Blobs written
+# before are plain JSON (format 1) and still read transparently.
+BLOB_FORMAT = "2"
+BLOB_METADATA = {"hl-format": BLOB_FORMAT, "hl-encoding": "gzip"}
+BLOB_CONTENT_TYPE = "application/gzip"
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class RetrievedTasks(NamedTuple):
+    # task data in the order of the requested pks, None where missing
+    data: List[Union[None, Dict[Any, Any]]]
+    missing: List[int]
+
 
 def _get_key(pk: int, region: Region) -> str:
     if settings.STORAGE_TEST_PREFIX:
@@ -19,22 +53,136 @@ def _get_key(pk: int, region: Region) -> str:
         return f"{pk}"
 
 
+@functools.lru_cache
+def _get_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=settings.REGIONAL_STORAGE_MAX_WORKERS,
+        thread_name_prefix="regional-storage",
+    )
+
+
+def _map(fn: Callable[[T], R], items: Sequence[T]) -> List[R]:
+    if len(items) <= 1:
+        return [fn(item) for item in items]
+    return list(_get_executor().map(fn, items))
+
+
+def encode_blob(data: Union[None, Dict[Any, Any]]) -> bytes:
+    text = json.dumps(data, separators=(",", ":"))
+    return gzip.compress(text.encode("utf-8"), mtime=0)
+
+
+def decode_blob(content: bytes) -> Union[None, Dict[Any, Any]]:
+    if content.startswith(GZIP_MAGIC):
+        content = gzip.decompress(content)
+    return json.loads(content)
+
+
+def _write(pk: int, region: Region, content: bytes, **preconditions) -> int:
+    return region.get_backend().write(
+        _get_key(pk, region),
+        content,
+        metadata=BLOB_METADATA,
+        content_type=BLOB_CONTENT_TYPE,
+        **preconditions,
+    )
+
+
+def _upload(pk: int, region: Region, data: Union[None, Dict[Any, Any]]) -> None:
+    content = encode_blob(data)
+    generation = _write(pk, region, content)
+    cache = regional_cache.get_cache()
+    if cache:
+        cache.put(region.name, pk, generation, content)
+
+
+def _download(pk: int, region: Region) -> Tuple[bool, Union[None, Dict[Any, Any]]]:
+    cache = regional_cache.get_cache()
+    cached = cache.get(region.name, pk) if cache else None
+    if cached and cache.is_fresh(cached):
+        cache.record(hit=True)
+        return True, decode_blob(cached.content)
+    try:
+        # only transfers the blob if it changed since it was cached
+        blob = region.get_backend().read(
+            _get_key(pk, region),
+            if_generation_not_match=cached.generation if cached else None,
+        )
+    except BlobNotModified:
+        cache.record(hit=True)
+        cache.revalidated(region.name, pk, cached)
+        return True, decode_blob(cached.content)
+    except BlobNotFound:
+        if cache:
+            cache.record(hit=False)
+            cache.invalidate(region.name, pk)
+        return False, None
+
+    if cache:
+        cache.record(hit=False)
+        cache.put(region.name, pk, blob.generation, blob.content)
+    return True, decode_blob(blob.content)
+
+
 def store(pk: int, region: Region, data: Union[None, Dict[Any, Any]]) -> None:
     key = _get_key(pk, region)
     with timer(f"storing task id: {key} in {region.name}"):
-        blob: Blob = region.get_bucket().blob(f"{key}")
-        blob.upload_from_string(json.dumps(data))
+        _upload(pk, region, data)
 
 
 def retrieve(pk: int, region: Region) -> Union[None, Dict[Any, Any]]:
     key = _get_key(pk, region)
     with timer(f"retrieving task id: {key} from {region.name}"):
-        blob = region.get_bucket().blob(f"{key}")
-        try:
-            text = blob.download_as_text()
-            return json.loads(text)
-        except NotFound:
-            logger.warning(
-                f"Task {key} not found in cloud bucket {region.bucket_name}."
-            )
-            return None
+        found, data = _download(pk, region)
+        if not found:
+            logger.warning(f"Task {key} not found in regional storage {region.name}.")
+        return data
+
+
+def store_many(
+    items: Iterable[Tuple[int, Union[None, Dict[Any, Any]]]], region: Region
+) -> None:
+    items = list(items)
+    with timer(f"storing {len(items)} tasks in {region.name}"):
+        _map(lambda item: _upload(item[0], region, item[1]), items)
+
+
+def retrieve_many(pks: Sequence[int], region: Region) -> RetrievedTasks:
+    with timer(f"retrieving {len(pks)} tasks from {region.name}"):
+        results = _map(lambda pk: _download(pk, region), pks)
+
+    missing = [pk for pk, (found, _) in zip(pks, results) if not found]
+    if missing:
+        logger.warning(f"Tasks {missing} not found in regional storage {region.name}.")
+    return RetrievedTasks([data for _, data in results], missing)
+
+
+def _recompress(pk: int, region: Region, dry_run: bool) -> bool:
+    try:
+        blob = region.get_backend().read(_get_key(pk, region))
+    except BlobNotFound:
+        return False
+    if blob.content.startswith(GZIP_MAGIC):
+        return False
+    if dry_run:
+        return True
+    try:
+        # do not overwrite the task if it was saved in the meantime
+        _write(
+            pk,
+            region,
+            encode_blob(decode_blob(blob.content)),
+            if_generation_match=blob.generation,
+        )
+    except GenerationMismatch:
+        return False
+    return True
+
+
+def recompress_many(pks: Sequence[int], region: Region, dry_run: bool = False) -> int:
+    """
+    Rewrites legacy plain JSON blobs in the current format, returns how many
+    blobs were (or with dry_run would be) rewritten.
+    """
+    with timer(f"recompressing {len(pks)} tasks in {region.name}"):
+        return sum(_map(lambda pk: _recompress(pk, region, dry_run), pks))
@@ -0,0 +1,212 @@
+"""
+Maintains the TaskDailyRollup table, the per day metrics of completed tasks
+read by the metrics views.
+
+Changes to a task are applied as the difference between its contribution
+before and after the change, so completing, re-submitting, auditing and
+deleting a task (AuditsGetTask.perform_destroy) all go through
+update_rollup, which also invalidates the cached metrics of the task's
+buckets once the change is committed, a metrics request made before the
+commit would otherwise cache the old metrics under the new version.
+
+update_rollup is called within the transaction saving the change, and it
+locks the row of the workflow like backfill_rollups does, so that a
+backfill never misses or counts twice a change made while it runs.
+"""
+
+import datetime
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from human_lambdas.metrics.cache import invalidate
+
+from .models import Task, TaskDailyRollup, Workflow
+
+# organization, workflow, worker and day of a rollup
+RollupKey = Tuple[int, int, Optional[int], datetime.date]
+Contribution = Tuple[RollupKey, Dict[str, float]]
+
+ROLLUP_FIELDS = (
+    "completed",
+    "handling_time_seconds",
+    "turnaround_seconds",
+    "audited",
+    "correct",
+)
+
+
+def rollup_day(completed_at: datetime.datetime) -> datetime.date:
+    return completed_at.astimezone(timezone.utc).date()
+
+
+def contribution(task: Task) -> Optional[Contribution]:
+    """
+    The values the task adds to its rollup, None if it is not completed.
+    """
+    if task.status != "completed" or task.completed_at is None:
+        return None
+    key = (
+        task.workflow.organization_id,
+        task.workflow_id,
+        task.assigned_to_id,
+        rollup_day(task.completed_at),
+    )
+    return (
+        key,
+        {
+            "completed": 1,
+            "handling_time_seconds": task.handling_time_seconds,
+            "turnaround_seconds": (task.completed_at - task.created_at)
+            / timezone.timedelta(seconds=1),
+            "audited": int(task.correct is not None),
+            "correct": int(task.correct is True),
+        },
+    )
+
+
+def _add(key: RollupKey, values: Dict[str, float]) -> None:
+    organization_id, workflow_id, worker_id, day = key
+    rollups = TaskDailyRollup.objects.filter(
+        workflow_id=workflow_id, worker_id=worker_id, day=day
+    )
+    # the row is created by the first task of the day, a concurrent request
+    # creating it first makes the insert fail and the update succeed
+    for _ in range(2):
+        pk = rollups.values_list("pk", flat=True).first()
+        if pk is not None:
+            rollups.filter(pk=pk).update(
+                **{field: F(field) + value for field, value in values.items()}
+            )
+            return
+        try:
+            with transaction.atomic():
+                TaskDailyRollup.objects.create(
+                    organization_id=organization_id,
+                    workflow_id=workflow_id,
+                    worker_id=worker_id,
+                    day=day,
+                    **values,
+                )
+            return
+        except IntegrityError:
+            continue
+
+
+def _lock_workflows(workflow_ids: Iterable[int]) -> None:
+    """
+    Serializes the changes to the rollups of the workflows until the end of
+    the transaction.
+    """
+    list(
+        Workflow.objects.select_for_update()
+        .filter(pk__in=workflow_ids)
+        .values_list("pk", flat=True)
+    )
+
+
+def update_rollup(
+    before: Optional[Contribution], after: Optional[Contribution]
+) -> None:
+    """
+    Replaces the contribution of a task before a change by the one after it,
+    call it within the transaction saving the change.
+    """
+    deltas: Dict[RollupKey, Counter] = defaultdict(Counter)
+    for sign, change in [(-1, before), (1, after)]:
+        if change is None:
+            continue
+        key, values = change
+        for field, value in values.items():
+            deltas[key][field] += sign * value
+    deltas = {
+        key: {field: value for field, value in values.items() if value}
+        for key, values in deltas.items()
+    }
+    deltas = {key: values for key, values in deltas.items() if values}
+    if not deltas:
+        return
+    with transaction.atomic():
+        _lock_workflows({workflow_id for _, workflow_id, _, _ in deltas})
+        for key, values in deltas.items():
+            _add(key, values)
+    days = defaultdict(set)
+    for organization_id, _, _, day in deltas:
+        days[organization_id].add(day)
+    for organization_id, organization_days in days.items():
+        transaction.on_commit(
+            lambda args=(organization_id, organization_days): invalidate(*args)
+        )
+
+
+def backfill_rollups(workflows: Iterable[Workflow], chunk_size: int = 2000) -> int:
+    """
+    Recomputes the rollups of the workflows from their completed tasks,
+    returns the number of rollups written.
+    """
+    n_rollups = 0
+    for workflow in workflows:
+        with transaction.atomic():
+            # changes to the tasks of the workflow wait for the backfill,
+            # and the tasks are read once those in progress are committed
+            _lock_workflows([workflow.pk])
+            totals = _completed_totals(workflow, chunk_size)
+            previous = TaskDailyRollup.objects.filter(workflow=workflow)
+            days = set(previous.values_list("day", flat=True))
+            days.update(day for _, day in totals)
+            previous.delete()
+            TaskDailyRollup.objects.bulk_create(
+                [
+                    TaskDailyRollup(
+                        organization_id=workflow.organization_id,
+                        workflow=workflow,
+                        worker_id=worker_id,
+                        day=day,
+                        **{field: values[field] for field in ROLLUP_FIELDS},
+                    )
+                    for (worker_id, day), values in totals.items()
+                ],
+                batch_size=100,
+            )
+        transaction.on_commit(
+            lambda args=(workflow.organization_id, days): invalidate(*args)
+        )
+        n_rollups += len(totals)
+    return n_rollups
+
+
+def _completed_totals(
+    workflow: Workflow, chunk_size: int
+) -> Dict[Tuple[Optional[int], datetime.date], Counter]:
+    """
+    The rollup values of the completed tasks of the workflow per worker and
+    day.
+    """
+    totals: Dict[Tuple[Optional[int], datetime.date], Counter]
+    totals = defaultdict(Counter)
+    tasks = (
+        Task.objects.filter(workflow=workflow, status="completed")
+        .exclude(completed_at=None)
+        .values_list(
+            "assigned_to_id",
+            "completed_at",
+            "created_at",
+            "handling_time_seconds",
+            "correct",
+        )
+        .order_by()
+    )
+    for row in tasks.iterator(chunk_size=chunk_size):
+        worker_id, completed_at, created_at, handling_time, correct = row
+        totals[(worker_id, rollup_day(completed_at))].update(
+            completed=1,
+            handling_time_seconds=handling_time,
+            turnaround_seconds=(completed_at - created_at)
+            / timezone.timedelta(seconds=1),
+            audited=int(correct is not None),
+            correct=int(correct is True),
+        )
+    return totals
@@ -13,16 +13,20 @@ from human_lambdas.data_handler.data_validation import (
 )
 from human_lambdas.hl_rest_api import analytics
 from human_lambdas.hl_rest_api.utils import is_valid_url
+from human_lambdas.metrics.cache import invalidate_organization
 from human_lambdas.user_handler.models import Organization
 
 from .models import (
+    ImportJob,
     Source,
     Task,
     TaskActivity,
     WebHook,
+    WebhookDelivery,
     Workflow,
     WorkflowNotification,
 )
+from .rollups import contribution, update_rollup
 from .utils import get_session_duration_seconds, notify_staff_run_status
 
 logger = logging.getLogger(__name__)
@@ -49,9 +53,35 @@ class HookSerializer(serializers.ModelSerializer):
             raise exceptions.ValidationError(detail=err_msg)
         return event
 
+    def validate_batch_size(self, batch_size):
+        if not 1 <= batch_size <= settings.WEBHOOK_MAX_BATCH_SIZE:
+            raise serializers.ValidationError(
+                "The batch size must be between 1 and {}".format(
+                    settings.WEBHOOK_MAX_BATCH_SIZE
+                )
+            )
+        return batch_size
+
+    def validate_batch_window_ms(self, batch_window_ms):
+        if batch_window_ms > settings.WEBHOOK_MAX_BATCH_WINDOW_MS:
+            raise serializers.ValidationError(
+                "The batch window must be at most {} ms".format(
+                    settings.WEBHOOK_MAX_BATCH_WINDOW_MS
+                )
+            )
+        return batch_window_ms
+
     class Meta:
         model = WebHook
-        fields = ("target", "user", "event", "workflow", "id")
+        fields = (
+            "target",
+            "user",
+            "event",
+            "workflow",
+            "id",
+            "batch_size",
+            "batch_window_ms",
+        )
         read_only_fields = ("user", "event", "workflow", "id")
 
     def create(self, validated_data):
@@ -194,9 +224,14 @@ class WorkflowSerializer(serializers.ModelSerializer):
 
         _validate_automation(instance)
         instance.save()
+        if disabled:
+            # the metrics of the organization leave out disabled workflows
+            transaction.on_commit(
+                lambda: invalidate_organization(instance.organization_id)
+            )
 
         if "is_running" in validated_data:
-            notify_staff_run_status(validated_data, self.context["request"])
+            notify_staff_run_status(instance, self.context["request"])
 
         event_name = "Deleted" if disabled else "Updated"
         analytics.track(
@@ -212,7 +247,8 @@ class WorkflowSerializer(serializers.ModelSerializer):
                 if self.context.get("remove_webhook"):
                     hook_instance.delete()
                 else:
-                    hook_instance.target = webhook_data["target"]
+                    for field, value in webhook_data.items():
+                        setattr(hook_instance, field, value)
                     hook_instance.save()
             else:
                 webhook_data["event"] = "task.completed"
@@ -240,7 +276,7 @@ class WorkflowSerializer(serializers.ModelSerializer):
 class TaskSerializer(serializers.ModelSerializer):
     workflow = serializers.SerializerMethodField()
     workflow_id = serializers.SerializerMethodField()
-    n_comments = serializers.SerializerMethodField()
+    n_comments = serializers.IntegerField(read_only=True)
 
     def validate_event(self, event):
         if event not in settings.HOOK_EVENTS:
@@ -318,6 +354,7 @@ class TaskSerializer(serializers.ModelSerializer):
         if instance.status == "completed" and not validated_data["force"]:
             raise serializers.ValidationError("Cannot change a completed task")
         elif instance.assigned_to == user:
+            before = contribution(instance)
             instance.data = validated_data.get("data", instance.data)
 
             instance.handling_time_seconds += get_session_duration_seconds(instance)
@@ -326,16 +363,23 @@ class TaskSerializer(serializers.ModelSerializer):
             if validated_data["submit_task"]:
                 instance.status = "completed"
                 instance.completed_at = timezone.now()
-                instance.save()
-                instance.task_completed(user)
-                TaskActivity(task=instance, action="completed", created_by=user).save()
-                workflow = instance.workflow
+                # the webhook deliveries and the rollup are updated with the
+                # completion
                 with transaction.atomic():
+                    instance.save()
+                    instance.task_completed(user)
+                    TaskActivity(
+                        task=instance, action="completed", created_by=user
+                    ).save()
+                    workflow = instance.workflow
                     workflow.n_tasks = F("n_tasks") - 1
                     workflow.save()
+                    update_rollup(before, contribution(instance))
             else:
-                instance.save()
-                TaskActivity(task=instance, action="saved", created_by=user).save()
+                with transaction.atomic():
+                    instance.save()
+                    TaskActivity(task=instance, action="saved", created_by=user).save()
+                    update_rollup(before, contribution(instance))
             event_name = "Completed" if validated_data["submit_task"] else "Saved"
             analytics.track(
                 user.pk,
@@ -362,9 +406,6 @@ class TaskSerializer(serializers.ModelSerializer):
     def get_workflow_id(self, obj):
         return obj.workflow.pk
 
-    def get_n_comments(self, obj):
-        return obj.taskactivity_set.filter(action="comment").count()
-
     def to_representation(self, instance):
         return instance.get_formatted_task()
 
@@ -383,3 +424,43 @@ class SourceSerializer(serializers.ModelSerializer):
     class Meta:
         fields = "__all__"
         model = Source
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = (
+            "id",
+            "workflow",
+            "source",
+            "filename",
+            "status",
+            "rows_total",
+            "rows_done",
+            "rows_failed",
+            "rows_pending",
+            "errors",
+            "created_at",
+            "started_at",
+            "finished_at",
+        )
+        read_only_fields = fields
+
+
+class WebhookDeliverySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WebhookDelivery
+        fields = (
+            "id",
+            "task",
+            "event",
+            "target",
+            "status",
+            "attempts",
+            "created_at",
+            "next_attempt_at",
+            "delivered_at",
+            "batch_id",
+            "log",
+        )
+        read_only_fields = fields
@@ -0,0 +1,273 @@
+"""
+Blob stores behind regional_storage, configured per region in the
+REGIONAL_STORAGE setting, e.g.
+
+    REGIONAL_STORAGE = {
+        "AU": {
+            "BACKEND": "human_lambdas.workflow_handler.storage_backends.FileSystemBackend",
+            "LOCATION": "/var/lib/human-lambdas/au",
+        },
+    }
+"""
+
+import functools
+import itertools
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional
+
+from google.api_core.exceptions import (
+    NotFound,
+    NotModified,
+    PreconditionFailed,
+)
+
+from human_lambdas.workflow_handler.latency import timer
+
+
+class BlobNotFound(Exception):
+    pass
+
+
+class BlobNotModified(Exception):
+    pass
+
+
+class GenerationMismatch(Exception):
+    pass
+
+
+class StoredBlob(NamedTuple):
+    content: bytes
+    # changes with every write of the blob
+    generation: Optional[int]
+
+
+class StorageBackend(ABC):
+    def __init__(self, location: str):
+        self.location = location
+
+    @abstractmethod
+    def read(
+        self, key: str, if_generation_not_match: Optional[int] = None
+    ) -> StoredBlob:
+        """
+        Raises BlobNotFound, or BlobNotModified if the blob still has the
+        given generation.
+        """
+
+    @abstractmethod
+    def write(
+        self,
+        key: str,
+        content: bytes,
+        metadata: Optional[Dict[str, str]] = None,
+        content_type: str = "application/octet-stream",
+        if_generation_match: Optional[int] = None,
+    ) -> Optional[int]:
+        """
+        Returns the generation of the written blob. Raises GenerationMismatch
+        if the blob does not have the given generation.
+        """
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """
+        Deletes the blob, if it exists.
+        """
+
+
+class GCSBackend(StorageBackend):
+    """
+    Google Cloud Storage, LOCATION is the bucket name.
+    """
+
+    @functools.cached_property
+    def bucket(self):
+        from google.cloud import storage
+
+        if self.location is None:
+            raise ValueError("Regional bucket name is None. Config is missing.")
+
+        with timer(f"Connecting to cloud storage bucket {self.location}"):
+            client = storage.Client()
+            return client.get_bucket(self.location)
+
+    def read(
+        self, key: str, if_generation_not_match: Optional[int] = None
+    ) -> StoredBlob:
+        blob = self.bucket.blob(key)
+        try:
+            content = blob.download_as_bytes(
+                if_generation_not_match=if_generation_not_match
+            )
+        except NotFound:
+            raise BlobNotFound(key)
+        except NotModified:
+            raise BlobNotModified(key)
+        return StoredBlob(content, blob.generation)
+
+    def write(
+        self,
+        key: str,
+        content: bytes,
+        metadata: Optional[Dict[str, str]] = None,
+        content_type: str = "application/octet-stream",
+        if_generation_match: Optional[int] = None,
+    ) -> Optional[int]:
+        blob = self.bucket.blob(key)
+        blob.metadata = metadata
+        try:
+            blob.upload_from_string(
+                content,
+                content_type=content_type,
+                if_generation_match=if_generation_match,
+            )
+        except PreconditionFailed:
+            raise GenerationMismatch(key)
+        return blob.generation
+
+    def delete(self, key: str) -> None:
+        try:
+            self.bucket.blob(key).delete()
+        except NotFound:
+            pass
+
+
+class FileSystemBackend(StorageBackend):
+    """
+    One file per blob below the LOCATION directory. Files start with a header
+    holding the generation and metadata, reads are memory mapped so that an
+    unchanged blob is answered from its header alone.
+
+    Conditional writes are only atomic within a process, do not share the
+    directory between servers.
+    """
+
+    MAGIC = b"HLB1"
+    # magic, generation, metadata length
+    HEADER = struct.Struct("<4sQI")
+
+    def __init__(self, location: str):
+        super().__init__(location)
+        self.root = Path(location)
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        if not key or ".." in key.split("/"):
+            raise ValueError(f"Invalid blob key {key}")
+        return self.root / key
+
+    def _generation(self, path: Path) -> Optional[int]:
+        try:
+            with path.open("rb") as blob_file:
+                _, generation, _ = self.HEADER.unpack(blob_file.read(self.HEADER.size))
+                return generation
+        except FileNotFoundError:
+            return None
+
+    def read(
+        self, key: str, if_generation_not_match: Optional[int] = None
+    ) -> StoredBlob:
+        try:
+            blob_file = self._path(key).open("rb")
+        except FileNotFoundError:
+            raise BlobNotFound(key)
+        with blob_file, mmap.mmap(
+            blob_file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mapped:
+            magic, generation, metadata_length = self.HEADER.unpack_from(mapped)
+            if magic != self.MAGIC:
+                raise ValueError(f"{key} is not a blob file")
+            if generation == if_generation_not_match:
+                raise BlobNotModified(key)
+            return StoredBlob(mapped[self.HEADER.size + metadata_length :], generation)
+
+    def write(
+        self,
+        key: str,
+        content: bytes,
+        metadata: Optional[Dict[str, str]] = None,
+        content_type: str = "application/octet-stream",
+        if_generation_match: Optional[int] = None,
+    ) -> Optional[int]:
+        path = self._path(key)
+        encoded_metadata = json.dumps(
+            {"content_type": content_type, **(metadata or {})}
+        ).encode("utf-8")
+        with self._lock:
+            if (
+                if_generation_match is not None
+                and self._generation(path) != if_generation_match
+            ):
+                raise GenerationMismatch(key)
+            generation = max(time.time_ns(), (self._generation(path) or 0) + 1)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # write to a temporary file first so readers never see partial blobs
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".")
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(
+                    self.HEADER.pack(self.MAGIC, generation, len(encoded_metadata))
+                )
+                tmp_file.write(encoded_metadata)
+                tmp_file.write(content)
+            os.replace(tmp_path, path)
+        return generation
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
+
+
+class InMemoryBackend(StorageBackend):
+    """
+    Process local dictionary, for tests and benchmarks. LOCATION is unused.
+    """
+
+    def __init__(self, location: Optional[str] = None):
+        super().__init__(location)
+        self.blobs: Dict[str, Any] = {}
+        self._generations = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def read(
+        self, key: str, if_generation_not_match: Optional[int] = None
+    ) -> StoredBlob:
+        try:
+            blob, _ = self.blobs[key]
+        except KeyError:
+            raise BlobNotFound(key)
+        if blob.generation == if_generation_not_match:
+            raise BlobNotModified(key)
+        return blob
+
+    def write(
+        self,
+        key: str,
+        content: bytes,
+        metadata: Optional[Dict[str, str]] = None,
+        content_type: str = "application/octet-stream",
+        if_generation_match: Optional[int] = None,
+    ) -> Optional[int]:
+        with self._lock:
+            if if_generation_match is not None:
+                current = self.blobs.get(key)
+                if current is None or current[0].generation != if_generation_match:
+                    raise GenerationMismatch(key)
+            blob = StoredBlob(bytes(content), next(self._generations))
+            self.blobs[key] = (blob, dict(metadata or {}, content_type=content_type))
+        return blob.generation
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self.blobs.pop(key, None)
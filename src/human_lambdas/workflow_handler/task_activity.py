@@ -1,4 +1,5 @@
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import F, Q
 from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.generics import ListCreateAPIView, RetrieveDestroyAPIView
@@ -82,6 +83,14 @@ class ActivityView(ListCreateAPIView):
 
         return self.create(request, *args, **kwargs)
 
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            activity = serializer.save()
+            if activity.action == "comment":
+                Task.objects.filter(pk=activity.task_id).update(
+                    n_comments=F("n_comments") + 1
+                )
+
 
 class RDActivityView(RetrieveDestroyAPIView):
     permission_classes = (IsAuthenticated,)
@@ -117,3 +126,12 @@ class RDActivityView(RetrieveDestroyAPIView):
             task.save()
 
         return self.destroy(request, *args, **kwargs)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            deleted, _ = instance.delete()
+            # a concurrent request may have deleted the comment already
+            if deleted:
+                Task.objects.filter(pk=instance.task_id).update(
+                    n_comments=F("n_comments") - 1
+                )
@@ -1,7 +1,11 @@
 import copy
+import importlib
+import io
 import logging
 import os
 
+from django.apps import apps
+from django.core.management import call_command
 from rest_framework import status
 from rest_framework.test import APITestCase
 
@@ -17,6 +21,10 @@ logger = logging.getLogger(__name__)
 
 _CURRENT_DIR = os.path.dirname(__file__)
 
+backfill_migration = importlib.import_module(
+    "human_lambdas.workflow_handler.migrations.0045_backfill_task_n_comments"
+)
+
 
 class TestTasksActivity(APITestCase):
     def setUserClient(self, email):
@@ -183,3 +191,79 @@ class TestTasksActivity(APITestCase):
         )
         self.assertEqual(response.data[0]["assignee_name"], "foo")
         self.assertEqual(response.data[0]["created_by_name"], "foo")
+
+    def comment(self, task):
+        response = self.client.post(
+            "/v1/orgs/{0}/workflows/{1}/tasks/{2}/activity".format(
+                self.org_id, self.workflow_id, task.pk
+            ),
+            data={"action": "comment", "comment": "hello world"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data["id"]
+
+    def test_comment_count(self):
+        task = Task.objects.first()
+        activity_ids = [self.comment(task) for _ in range(3)]
+        _ = self.client.post(
+            "/v1/orgs/{0}/workflows/{1}/tasks/{2}/assign".format(
+                self.org_id, self.workflow_id, task.id
+            ),
+            data={"assigned_to": self.user_id},
+            format="json",
+        )
+        response = self.client.delete(
+            "/v1/orgs/{0}/workflows/{1}/tasks/{2}/activity/{3}".format(
+                self.org_id, self.workflow_id, task.pk, activity_ids[0]
+            ),
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        task.refresh_from_db()
+        self.assertEqual(task.n_comments, 2)
+        response = self.client.get(
+            "/v1/orgs/{0}/workflows/{1}/tasks".format(self.org_id, self.workflow_id)
+        )
+        n_comments = {data["id"]: data["n_comments"] for data in response.data}
+        self.assertEqual(n_comments[task.pk], 2)
+
+    def test_stale_task_saved_then_comment_count_kept(self):
+        task = Task.objects.first()
+        self.comment(task)
+
+        task.status = "in_progress"
+        task.save()
+
+        task.refresh_from_db()
+        self.assertEqual(task.n_comments, 1)
+
+    def test_repair_comment_counts(self):
+        task, other_task = Task.objects.all()[:2]
+        self.comment(task)
+        self.comment(task)
+        Task.objects.filter(pk=task.pk).update(n_comments=5)
+        Task.objects.filter(pk=other_task.pk).update(n_comments=1)
+
+        out = io.StringIO()
+        call_command("repaircommentcounts", stdout=out)
+
+        self.assertIn("2 tasks", out.getvalue())
+        task.refresh_from_db()
+        other_task.refresh_from_db()
+        self.assertEqual(task.n_comments, 2)
+        self.assertEqual(other_task.n_comments, 0)
+
+    def test_when_migrated_then_comment_counts_backfilled(self):
+        task, other_task = Task.objects.all()[:2]
+        self.comment(task)
+        self.comment(task)
+        self.comment(other_task)
+        Task.objects.update(n_comments=0)
+
+        backfill_migration.backfill_comment_counts(apps, None)
+
+        task.refresh_from_db()
+        other_task.refresh_from_db()
+        self.assertEqual(task.n_comments, 2)
+        self.assertEqual(other_task.n_comments, 1)
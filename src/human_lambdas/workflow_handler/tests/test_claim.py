@@ -0,0 +1,85 @@
+from django.test import TestCase
+
+from human_lambdas.user_handler.models import Organization, User
+from human_lambdas.workflow_handler.models import Task, Workflow
+from human_lambdas.workflow_handler.utils import (
+    _claim_conditional,
+    claim_next_task,
+)
+
+
+class TestClaimNextTask(TestCase):
+    def setUp(self):
+        self.user = User(name="foo", email="foo@bar.com")
+        self.user.save()
+        self.other_user = User(name="bar", email="bar@bar.com")
+        self.other_user.save()
+        organization = Organization(name="fooInc")
+        organization.save()
+        organization.add_admin(self.user)
+        self.workflow = Workflow(
+            name="claims", created_by=self.user, organization=organization
+        )
+        self.workflow.save()
+
+    def create_task(self, status="new"):
+        task = Task(workflow=self.workflow, data=[], status=status)
+        task.save()
+        return task
+
+    def queryset(self):
+        return (
+            Task.objects.defer("data")
+            .filter(workflow=self.workflow)
+            .order_by("created_at")
+        )
+
+    def test_when_claimed_then_oldest_task_assigned(self):
+        first = self.create_task()
+        self.create_task()
+
+        task = claim_next_task(self.queryset(), self.user)
+
+        self.assertEqual(task.pk, first.pk)
+        first.refresh_from_db()
+        self.assertEqual(first.status, "in_progress")
+        self.assertEqual(first.assigned_to, self.user)
+        self.assertIsNotNone(first.assigned_at)
+
+    def test_when_claimed_twice_then_different_tasks(self):
+        self.create_task()
+        self.create_task()
+
+        task = claim_next_task(self.queryset(), self.user)
+        other_task = claim_next_task(self.queryset(), self.other_user)
+
+        self.assertNotEqual(task.pk, other_task.pk)
+        self.assertEqual(other_task.assigned_to, self.other_user)
+
+    def test_when_only_open_tasks_then_open_task_claimed(self):
+        self.create_task(status="completed")
+        open_task = self.create_task(status="open")
+
+        task = claim_next_task(self.queryset(), self.user)
+
+        self.assertEqual(task.pk, open_task.pk)
+
+    def test_when_nothing_to_claim_then_none(self):
+        self.create_task(status="in_progress")
+
+        self.assertIsNone(claim_next_task(self.queryset(), self.user))
+
+    def test_when_candidate_claimed_concurrently_then_next_candidate(self):
+        lost = self.create_task()
+        won = self.create_task()
+        # the first candidate is read as claimable but taken before our UPDATE
+        candidates = self.queryset().filter(pk__in=[lost.pk, won.pk])
+        Task.objects.filter(pk=lost.pk).update(
+            status="in_progress", assigned_to=self.other_user
+        )
+
+        task = _claim_conditional(candidates, ("new",), self.user)
+
+        self.assertEqual(task.pk, won.pk)
+        lost.refresh_from_db()
+        self.assertEqual(lost.assigned_to, self.other_user)
@@ -140,6 +140,7 @@ class TestCompletedTasksToCSV(APITestCase):
         )
         self.assertEqual(needed_csv, received_csv)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
 
     def test_list_completed_task_internal_add_output(self):
         self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
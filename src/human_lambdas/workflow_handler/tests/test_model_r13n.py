@@ -7,6 +7,7 @@ from parameterized import parameterized
 from human_lambdas.user_handler.models import Organization, User
 from human_lambdas.workflow_handler.models import Task, Workflow
 from human_lambdas.workflow_handler.region import Region
+from human_lambdas.workflow_handler.regional_storage import RetrievedTasks
 
 DB_DATA = {"foo": 2}
 BUCKET_DATA = {"blah": 3}
@@ -173,3 +174,69 @@ class TestR13n(TestCase):
             task.save()
             assert len(store.mock_calls) == 0
             assert len(retrieve.mock_calls) == 0
+
+    def test_when_non_eu_task_loaded_then_data_fetched_on_access(self):
+        with patch("human_lambdas.workflow_handler.regional_storage.store"):
+            Task(pk=TASK_PK, workflow=self.workflow, data=DB_DATA, region="AU").save()
+
+        with patch(
+            "human_lambdas.workflow_handler.regional_storage.retrieve"
+        ) as retrieve:
+            retrieve.return_value = BUCKET_DATA
+            t = Task.objects.get(pk=TASK_PK)
+
+            assert len(retrieve.mock_calls) == 0
+            assert t.data == BUCKET_DATA
+            assert t.data == BUCKET_DATA
+            assert len(retrieve.mock_calls) == 1
+
+    def test_when_regional_data_prefetched_then_retrieved_in_bulk(self):
+        with patch("human_lambdas.workflow_handler.regional_storage.store"):
+            for pk, region in [(1, "AU"), (2, "AU"), (3, "US"), (4, None)]:
+                Task(pk=pk, workflow=self.workflow, data=DB_DATA, region=region).save()
+
+        with patch(
+            "human_lambdas.workflow_handler.regional_storage.retrieve_many"
+        ) as retrieve_many, patch(
+            "human_lambdas.workflow_handler.regional_storage.retrieve"
+        ) as retrieve:
+            retrieve_many.side_effect = lambda pks, region: RetrievedTasks(
+                [{"pk": pk} for pk in pks], []
+            )
+            tasks = list(
+                Task.objects.prefetch_regional_data().filter(pk__gt=0).order_by("pk")
+            )
+
+            assert [task.data for task in tasks] == [
+                {"pk": 1},
+                {"pk": 2},
+                {"pk": 3},
+                DB_DATA,
+            ]
+            assert [call.args[0] for call in retrieve_many.mock_calls] == [[1, 2], [3]]
+            assert len(retrieve.mock_calls) == 0
+
+    def test_when_iterating_prefetched_tasks_then_retrieved_per_chunk(self):
+        with patch("human_lambdas.workflow_handler.regional_storage.store"):
+            for pk in range(1, 6):
+                Task(pk=pk, workflow=self.workflow, data=DB_DATA, region="AU").save()
+
+        with patch(
+            "human_lambdas.workflow_handler.regional_storage.retrieve_many"
+        ) as retrieve_many:
+            retrieve_many.side_effect = lambda pks, region: RetrievedTasks(
+                [{"pk": pk} for pk in pks], []
+            )
+            tasks = (
+                Task.objects.prefetch_regional_data()
+                .filter(pk__gt=0)
+                .order_by("pk")
+                .iterator(chunk_size=2)
+            )
+
+            assert [task.data for task in tasks] == [{"pk": pk} for pk in range(1, 6)]
+            assert [call.args[0] for call in retrieve_many.mock_calls] == [
+                [1, 2],
+                [3, 4],
+                [5],
+            ]
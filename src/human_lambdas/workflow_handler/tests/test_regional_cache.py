@@ -0,0 +1,146 @@
+import pytest
+from pytest_django.fixtures import SettingsWrapper
+
+from human_lambdas.workflow_handler import regional_cache
+from human_lambdas.workflow_handler.region import Region
+from human_lambdas.workflow_handler.regional_cache import CachedBlob, LRUCache
+from human_lambdas.workflow_handler.regional_storage import (
+    _get_key,
+    encode_blob,
+    retrieve,
+    retrieve_many,
+    store,
+)
+
+DATA = {"BL": 42}
+PK = 1
+
+
+@pytest.fixture
+def cached_storage(settings: SettingsWrapper, tmp_path):
+    settings.REGIONAL_STORAGE = {
+        region: {
+            "BACKEND": "human_lambdas.workflow_handler.storage_backends.FileSystemBackend",
+            "LOCATION": str(tmp_path / "buckets" / region),
+        }
+        for region in ["AU", "US"]
+    }
+    settings.REGIONAL_CACHE_MAX_BYTES = 1024
+    Region.AU.get_backend.cache_clear()
+    regional_cache.get_cache.cache_clear()
+    yield settings
+    Region.AU.get_backend.cache_clear()
+    regional_cache.get_cache.cache_clear()
+
+
+@pytest.fixture
+def disk_key():
+    # only the encrypted disk tier needs cryptography
+    fernet = pytest.importorskip("cryptography.fernet")
+    return fernet.Fernet.generate_key().decode()
+
+
+def test_when_lru_over_capacity_then_least_recently_used_evicted():
+    cache = LRUCache(max_bytes=10)
+    cache.put(("AU", 1), CachedBlob(1, b"aaaa"))
+    cache.put(("AU", 2), CachedBlob(1, b"bbbb"))
+    cache.get(("AU", 1))
+
+    cache.put(("AU", 3), CachedBlob(1, b"cccc"))
+
+    assert cache.get(("AU", 2)) is None
+    assert cache.get(("AU", 1)).content == b"aaaa"
+    assert cache.size == 8
+
+
+def test_when_blob_larger_than_lru_then_not_cached():
+    cache = LRUCache(max_bytes=2)
+    cache.put(("AU", 1), CachedBlob(1, b"aaaa"))
+
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+def test_when_stored_then_retrieve_is_cache_hit(cached_storage):
+    store(PK, Region.AU, DATA)
+
+    assert retrieve(PK, Region.AU) == DATA
+    assert retrieve(PK, Region.AU) == DATA
+    assert regional_cache.stats()["hits"] == 2
+    assert regional_cache.stats()["misses"] == 0
+
+
+def test_when_warm_then_retrieved_without_backend_call(cached_storage, monkeypatch):
+    store(PK, Region.AU, DATA)
+    assert retrieve(PK, Region.AU) == DATA
+
+    def read(*args, **kwargs):
+        raise AssertionError("the bucket was called")
+
+    monkeypatch.setattr(Region.AU.get_backend(), "read", read)
+    assert retrieve(PK, Region.AU) == DATA
+    assert retrieve_many([PK], Region.AU).data == [DATA]
+    assert regional_cache.stats()["hits"] == 3
+
+
+def test_when_blob_changed_elsewhere_then_fresh_data_retrieved(cached_storage):
+    cached_storage.REGIONAL_CACHE_REVALIDATE_SECONDS = 0
+    regional_cache.get_cache.cache_clear()
+    store(PK, Region.AU, DATA)
+    # another process updates the blob, bypassing this process' cache
+    Region.AU.get_backend().write(_get_key(PK, Region.AU), b'{"BL": 43}')
+
+    assert retrieve(PK, Region.AU) == {"BL": 43}
+    assert retrieve(PK, Region.AU) == {"BL": 43}
+    assert regional_cache.stats()["misses"] == 1
+    assert regional_cache.stats()["hits"] == 1
+
+
+def test_when_cached_task_mutated_then_cache_unaffected(cached_storage):
+    store(PK, Region.AU, DATA)
+    retrieve(PK, Region.AU)["BL"] = 0
+
+    assert retrieve_many([PK], Region.AU).data == [DATA]
+
+
+def test_when_cache_disabled_then_nothing_cached(cached_storage):
+    cached_storage.REGIONAL_CACHE_MAX_BYTES = 0
+    regional_cache.get_cache.cache_clear()
+
+    store(PK, Region.AU, DATA)
+
+    assert retrieve(PK, Region.AU) == DATA
+    assert regional_cache.stats() == {}
+
+
+def test_when_disk_tier_enabled_then_blob_encrypted_on_disk(
+    cached_storage, tmp_path, disk_key
+):
+    cached_storage.REGIONAL_CACHE_DISK_DIR = str(tmp_path / "cache")
+    cached_storage.REGIONAL_CACHE_DISK_KEY = disk_key
+    cached_storage.REGIONAL_CACHE_DISK_REGIONS = ["AU"]
+    regional_cache.get_cache.cache_clear()
+
+    store(PK, Region.AU, DATA)
+    cache_file = tmp_path / "cache" / "AU" / str(PK)
+    assert cache_file.exists()
+    assert encode_blob(DATA) not in cache_file.read_bytes()
+
+    # a restarted process revalidates the disk entry instead of downloading
+    regional_cache.get_cache().memory = LRUCache(1024)
+    assert retrieve(PK, Region.AU) == DATA
+    assert regional_cache.stats()["hits"] == 1
+
+
+def test_when_region_not_allowed_on_disk_then_not_written(
+    cached_storage, tmp_path, disk_key
+):
+    cached_storage.REGIONAL_CACHE_DISK_DIR = str(tmp_path / "cache")
+    cached_storage.REGIONAL_CACHE_DISK_KEY = disk_key
+    cached_storage.REGIONAL_CACHE_DISK_REGIONS = []
+    regional_cache.get_cache.cache_clear()
+
+    store(PK, Region.AU, DATA)
+
+    assert not (tmp_path / "cache").exists()
+    assert retrieve(PK, Region.AU) == DATA
@@ -1,10 +1,23 @@
+import io
+import json
 from unittest import mock
 
 import pytest
+from django.core.management import call_command
 from pytest_django.fixtures import SettingsWrapper
 
+from human_lambdas.user_handler.models import Organization, User
+from human_lambdas.workflow_handler import regional_cache
+from human_lambdas.workflow_handler.models import Task, Workflow
 from human_lambdas.workflow_handler.region import Region
-from human_lambdas.workflow_handler.regional_storage import retrieve, store
+from human_lambdas.workflow_handler.regional_storage import (
+    GZIP_MAGIC,
+    _get_key,
+    retrieve,
+    retrieve_many,
+    store,
+    store_many,
+)
 
 DATA = {"BL": 42}
 PK = 1
@@ -25,6 +38,111 @@ def test_when_local_dev_then_ephemeral_storage_used(settings: SettingsWrapper):
     settings.STORAGE_TEST_PREFIX = "lkjh"
     mock_region = mock.Mock()
     mock_region.name = "US"
+    mock_region.get_backend().write.return_value = 1
     store(PK, mock_region, DATA)
     obj_key = f"{settings.STORAGE_TEST_PREFIX}/{mock_region.name}/{PK}"
-    assert mock_region.get_bucket().blob.call_args[0][0] == obj_key
+    assert mock_region.get_backend().write.call_args[0][0] == obj_key
+
+
+@pytest.fixture(params=["FileSystemBackend", "InMemoryBackend"])
+def local_storage(request, settings: SettingsWrapper, tmp_path):
+    settings.REGIONAL_STORAGE = {
+        region: {
+            "BACKEND": f"human_lambdas.workflow_handler.storage_backends.{request.param}",
+            "LOCATION": str(tmp_path / region),
+        }
+        for region in ["AU", "US"]
+    }
+    # every read reaches the backend under test
+    settings.REGIONAL_CACHE_REVALIDATE_SECONDS = 0
+    Region.AU.get_backend.cache_clear()
+    regional_cache.get_cache.cache_clear()
+    yield Region.AU.get_backend()
+    Region.AU.get_backend.cache_clear()
+    regional_cache.get_cache.cache_clear()
+
+
+def test_when_local_backend_configured_then_used(local_storage):
+    store(PK, Region.AU, DATA)
+    assert retrieve(PK, Region.AU) == DATA
+    assert retrieve(9876, Region.AU) is None
+    assert local_storage.read(_get_key(PK, Region.AU)).content
+
+
+def test_when_stored_many_then_retrieved_in_input_order(local_storage):
+    pks = list(range(1, 21))
+    store_many([(pk, {"pk": pk}) for pk in pks], Region.AU)
+
+    retrieved = retrieve_many(list(reversed(pks)), Region.AU)
+
+    assert retrieved.data == [{"pk": pk} for pk in reversed(pks)]
+    assert retrieved.missing == []
+
+
+def test_when_retrieving_many_with_unknown_pks_then_missing_reported(local_storage):
+    store_many([(1, DATA), (3, None)], Region.AU)
+
+    retrieved = retrieve_many([1, 2, 3, 4], Region.AU)
+
+    assert retrieved.data == [DATA, None, None, None]
+    assert retrieved.missing == [2, 4]
+
+
+def test_when_deleted_then_not_found(local_storage):
+    store(PK, Region.AU, DATA)
+
+    local_storage.delete(_get_key(PK, Region.AU))
+    local_storage.delete(_get_key(PK, Region.AU))
+
+    assert retrieve(PK, Region.AU) is None
+
+
+def write_legacy_blob(pk, data):
+    Region.AU.get_backend().write(
+        _get_key(pk, Region.AU), json.dumps(data).encode("utf-8")
+    )
+
+
+def read_blob(pk):
+    return Region.AU.get_backend().read(_get_key(pk, Region.AU)).content
+
+
+def test_when_stored_then_blob_compressed(local_storage):
+    data = [{"id": "foo", "type": "text", "text": {"value": "bar"}}] * 50
+    store(PK, Region.AU, data)
+
+    content = read_blob(PK)
+
+    assert content.startswith(GZIP_MAGIC)
+    assert len(content) < len(json.dumps(data)) / 10
+    assert retrieve(PK, Region.AU) == data
+
+
+def test_when_legacy_blob_then_retrieved(local_storage):
+    write_legacy_blob(PK, DATA)
+
+    assert retrieve(PK, Region.AU) == DATA
+    assert retrieve_many([PK], Region.AU).data == [DATA]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("dry_run", [False, True])
+def test_when_recompressing_then_legacy_blobs_rewritten(local_storage, dry_run):
+    user = User.objects.create(name="foo", email="foo@bar.com")
+    organization = Organization.objects.create(name="fooInc")
+    workflow = Workflow.objects.create(
+        name="foo", created_by=user, organization=organization
+    )
+    tasks = [Task(workflow=workflow, data=DATA, region="AU") for _ in range(3)]
+    for task in tasks:
+        task.save()
+    for task in tasks[:2]:
+        write_legacy_blob(task.pk, DATA)
+
+    out = io.StringIO()
+    call_command("recompressblobs", "--batch-size=1", dry_run=dry_run, stdout=out)
+
+    assert "2 of 3 task blobs in AU" in out.getvalue()
+    for task in tasks[:2]:
+        assert read_blob(task.pk).startswith(GZIP_MAGIC) != dry_run
+    assert [retrieve(task.pk, Region.AU) for task in tasks] == [DATA] * 3
@@ -0,0 +1,146 @@
+import importlib
+import io
+import os
+
+from django.apps import apps
+from django.core.management import call_command
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from human_lambdas.user_handler.models import Organization
+from human_lambdas.workflow_handler.models import Task, TaskDailyRollup
+from human_lambdas.workflow_handler.tests.constants import (
+    REGISTRATION_DATA,
+    WORKFLOW_DATA_3,
+)
+
+_CURRENT_DIR = os.path.dirname(__file__)
+
+backfill_migration = importlib.import_module(
+    "human_lambdas.workflow_handler.migrations.0043_backfill_task_daily_rollups"
+)
+
+FIELDS = (
+    "workflow",
+    "worker",
+    "day",
+    "completed",
+    "handling_time_seconds",
+    "audited",
+    "correct",
+)
+
+
+def rollups():
+    return list(TaskDailyRollup.objects.order_by("pk").values(*FIELDS))
+
+
+class TestTaskDailyRollup(APITestCase):
+    def setUp(self):
+        response = self.client.post("/v1/users/register", REGISTRATION_DATA)
+        self.user_id = response.data["id"]
+        self.org_id = Organization.objects.get(user__email="foo@bar.com").pk
+        response = self.client.post(
+            "/v1/users/token", {"email": "foo@bar.com", "password": "foowordbar"}
+        )
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + response.data["access"])
+        response = self.client.post(
+            "/v1/orgs/{}/workflows/create".format(self.org_id),
+            WORKFLOW_DATA_3,
+            format="json",
+        )
+        self.workflow_id = response.data["id"]
+        with open(os.path.join(_CURRENT_DIR, "data", "test.csv")) as f:
+            response = self.client.post(
+                "/v1/orgs/{0}/workflows/{1}/upload".format(
+                    self.org_id, self.workflow_id
+                ),
+                data={"file": f},
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.tasks = list(Task.objects.order_by("pk"))
+        for task in self.tasks:
+            _ = self.client.post(
+                "/v1/orgs/{0}/workflows/{1}/tasks/{2}/assign".format(
+                    self.org_id, self.workflow_id, task.pk
+                ),
+                data={"assigned_to": self.user_id},
+                format="json",
+            )
+
+    def submit(self, task):
+        response = self.client.patch(
+            "/v1/orgs/{0}/workflows/{1}/tasks/{2}".format(
+                self.org_id, self.workflow_id, task.pk
+            ),
+            data={"data": task.data},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+
+    def audit(self, task, correct):
+        response = self.client.put(
+            f"/v1/orgs/{self.org_id}/workflows/tasks/{task.pk}/audit",
+            data={"correct": correct},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+
+    def assert_backfill_equal(self):
+        updated = rollups()
+        turnaround = TaskDailyRollup.objects.get().turnaround_seconds
+        call_command("backfillrollups", stdout=io.StringIO())
+        self.assertEqual(updated, rollups())
+        # floats summed in a different order
+        self.assertAlmostEqual(
+            turnaround, TaskDailyRollup.objects.get().turnaround_seconds
+        )
+
+    def test_when_tasks_completed_then_rollup_counts_them(self):
+        for task in self.tasks:
+            self.submit(task)
+
+        rollup = TaskDailyRollup.objects.get()
+        self.assertEqual(rollup.completed, len(self.tasks))
+        self.assertEqual(rollup.worker_id, self.user_id)
+        self.assertEqual(rollup.audited, 0)
+        self.assert_backfill_equal()
+
+    def test_when_tasks_audited_then_rollup_updated(self):
+        for task in self.tasks:
+            self.submit(task)
+
+        self.audit(self.tasks[0], True)
+        self.audit(self.tasks[1], False)
+        self.audit(self.tasks[2], True)
+        self.audit(self.tasks[2], None)
+
+        rollup = TaskDailyRollup.objects.get()
+        self.assertEqual(rollup.audited, 2)
+        self.assertEqual(rollup.correct, 1)
+        self.assert_backfill_equal()
+
+    def test_when_task_deleted_then_rollup_updated(self):
+        for task in self.tasks:
+            self.submit(task)
+        self.audit(self.tasks[0], True)
+
+        response = self.client.delete(
+            f"/v1/orgs/{self.org_id}/workflows/tasks/{self.tasks[0].pk}/audit"
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        rollup = TaskDailyRollup.objects.get()
+        self.assertEqual(rollup.completed, len(self.tasks) - 1)
+        self.assertEqual(rollup.audited, 0)
+        self.assert_backfill_equal()
+
+    def test_when_migrated_then_completed_tasks_backfilled(self):
+        for task in self.tasks:
+            self.submit(task)
+        self.audit(self.tasks[0], False)
+        updated = rollups()
+        TaskDailyRollup.objects.all().delete()
+
+        backfill_migration.backfill_rollups(apps, None)
+        self.assertEqual(updated, rollups())
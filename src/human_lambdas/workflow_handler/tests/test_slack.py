@@ -0,0 +1,84 @@
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from rest_framework.test import APITestCase
+
+from human_lambdas.workflow_handler import utils
+
+
+@mock.patch.dict("os.environ", {"SLACK_WEBHOOK_URL": "https://slack.local/hook"})
+class TestSlackNotifications(APITestCase):
+    def setUp(self):
+        self.request = SimpleNamespace(
+            user=SimpleNamespace(email="foo@bar.com"),
+            stream=SimpleNamespace(path="/v1/orgs/1/workflows/2/upload"),
+        )
+        self.foo = SimpleNamespace(pk=2, name="foo")
+        self.bar = SimpleNamespace(pk=3, name="bar")
+        patcher = mock.patch.object(utils.slack_session, "post")
+        self.post = patcher.start()
+        self.post.return_value.status_code = 200
+        self.addCleanup(patcher.stop)
+
+    def texts(self):
+        return [call[1]["json"]["text"] for call in self.post.call_args_list]
+
+    def test_repeated_notifications_are_coalesced(self):
+        for _ in range(3):
+            utils.notify_slack("bulk upload", self.foo, self.request)
+        utils.notify_slack("bulk upload", self.bar, self.request)
+        self.assertTrue(utils.slack_dispatcher.flush(timeout=5))
+
+        self.assertEqual(
+            self.texts(),
+            [
+                "bulk upload for foo (3 times, by foo@bar.com)",
+                "foo@bar.com called /v1/orgs/1/workflows/2/upload: "
+                "bulk upload for bar",
+            ],
+        )
+        for call in self.post.call_args_list:
+            self.assertEqual(call[0], ("https://slack.local/hook",))
+            self.assertEqual(call[1]["timeout"], settings.SLACK_TIMEOUT_SECONDS)
+
+    def test_notifications_of_different_users_are_coalesced(self):
+        other = SimpleNamespace(
+            user=SimpleNamespace(email="baz@bar.com"), stream=self.request.stream
+        )
+        utils.notify_slack("bulk upload", self.foo, self.request)
+        utils.notify_slack("bulk upload", self.foo, other)
+        utils.notify_slack("bulk upload", self.foo, self.request)
+        utils.notify_slack("Task created via form", self.foo, other)
+        self.assertTrue(utils.slack_dispatcher.flush(timeout=5))
+
+        self.assertEqual(
+            self.texts(),
+            [
+                "bulk upload for foo (3 times, by foo@bar.com, baz@bar.com)",
+                "baz@bar.com called /v1/orgs/1/workflows/2/upload: "
+                "Task created via form for foo",
+            ],
+        )
+
+    def test_does_not_wait_on_slack(self):
+        release = threading.Event()
+        response = self.post.return_value
+        self.post.side_effect = lambda *args, **kwargs: release.wait(5) and response
+
+        utils.notify_slack("bulk upload", self.foo, self.request)
+        # the notification is stuck on Slack in the background
+        self.assertFalse(utils.slack_dispatcher.flush(timeout=0.1))
+        utils.notify_slack("bulk upload", self.bar, self.request)
+        release.set()
+        self.assertTrue(utils.slack_dispatcher.flush(timeout=5))
+
+        self.assertEqual(self.post.call_count, 2)
+
+    def test_not_configured(self):
+        with mock.patch.dict("os.environ", clear=True):
+            utils.notify_slack("bulk upload", self.foo, self.request)
+        utils.slack_dispatcher.flush(timeout=5)
+
+        self.post.assert_not_called()
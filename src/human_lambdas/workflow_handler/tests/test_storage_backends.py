@@ -0,0 +1,74 @@
+import pytest
+
+from human_lambdas.workflow_handler.storage_backends import (
+    BlobNotFound,
+    BlobNotModified,
+    FileSystemBackend,
+    GenerationMismatch,
+    InMemoryBackend,
+    StorageBackend,
+)
+
+KEY = "prefix/AU/1"
+
+
+@pytest.fixture(params=[FileSystemBackend, InMemoryBackend])
+def backend(request, tmp_path):
+    return request.param(str(tmp_path))
+
+
+def test_when_written_then_read(backend):
+    generation = backend.write(KEY, b"foo", metadata={"hl-format": "2"})
+
+    blob = backend.read(KEY)
+
+    assert blob.content == b"foo"
+    assert blob.generation == generation
+
+
+def test_when_unknown_key_then_not_found(backend):
+    with pytest.raises(BlobNotFound):
+        backend.read(KEY)
+
+
+def test_when_overwritten_then_new_generation(backend):
+    first = backend.write(KEY, b"foo")
+    second = backend.write(KEY, b"bar")
+
+    assert first != second
+    assert backend.read(KEY, if_generation_not_match=first).content == b"bar"
+
+
+def test_when_generation_unchanged_then_not_modified(backend):
+    generation = backend.write(KEY, b"foo")
+
+    with pytest.raises(BlobNotModified):
+        backend.read(KEY, if_generation_not_match=generation)
+
+
+def test_when_generation_mismatch_then_not_written(backend):
+    generation = backend.write(KEY, b"foo")
+    backend.write(KEY, b"bar")
+
+    with pytest.raises(GenerationMismatch):
+        backend.write(KEY, b"baz", if_generation_match=generation)
+    with pytest.raises(GenerationMismatch):
+        backend.write("prefix/AU/2", b"baz", if_generation_match=generation)
+
+    assert backend.read(KEY).content == b"bar"
+
+
+def test_when_key_escapes_location_then_rejected(tmp_path):
+    backend = FileSystemBackend(str(tmp_path / "AU"))
+
+    with pytest.raises(ValueError):
+        backend.write("../US/1", b"foo")
+
+
+def test_when_backend_incomplete_then_not_created():
+    class ReadOnlyBackend(StorageBackend):
+        def read(self, key, if_generation_not_match=None):
+            raise BlobNotFound(key)
+
+    with pytest.raises(TypeError):
+        ReadOnlyBackend("location")
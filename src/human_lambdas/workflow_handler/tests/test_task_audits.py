@@ -208,6 +208,38 @@ class TestTaskAudit(HLTestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
 
+    def test_when_prefetch_then_upcoming_task_ids_in_list_order(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+        response = self.client.get(
+            "/v1/orgs/{}/workflows/tasks/completed".format(self.org_id)
+        )
+        task_ids = [task["id"] for task in response.data["tasks"]]
+
+        response = self.client.get(
+            "/v1/orgs/{}/queues/tasks/{}/audit".format(self.org_id, task_ids[1]),
+            data={"prefetch": 2},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(response.data["upcoming"], task_ids[2:4])
+        self.assertTrue(
+            response.data["next"].startswith(f"/queues/tasks/{task_ids[2]}/audit")
+        )
+        self.assertTrue(
+            response.data["previous"].startswith(f"/queues/tasks/{task_ids[0]}/audit")
+        )
+
+    def test_when_prefetch_invalid_then_bad_request(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+        task = Task.objects.filter(status="completed").first()
+
+        for prefetch in ["foo", -1, 1000]:
+            response = self.client.get(
+                "/v1/orgs/{}/queues/tasks/{}/audit".format(self.org_id, task.id),
+                data={"prefetch": prefetch},
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_when_no_tasks_audited_then_null_accuracy(self):
         # assert
         data = {
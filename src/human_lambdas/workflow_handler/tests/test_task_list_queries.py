@@ -0,0 +1,93 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from human_lambdas.user_handler.models import Organization, User
+from human_lambdas.workflow_handler.models import (
+    Source,
+    Task,
+    TaskActivity,
+    Workflow,
+)
+from human_lambdas.workflow_handler.tests.constants import REGISTRATION_DATA
+
+
+class TestTaskListQueries(APITestCase):
+    def setUp(self):
+        _ = self.client.post("/v1/users/register", REGISTRATION_DATA)
+        self.org_id = Organization.objects.get(user__email="foo@bar.com").pk
+        response = self.client.post(
+            "/v1/users/token", {"email": "foo@bar.com", "password": "foowordbar"}
+        )
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + response.data["access"])
+        response = self.client.get("/v1/users/api-token")
+        self.token = response.data["token"]
+        self.user = User.objects.get(email="foo@bar.com")
+        self.workflow = Workflow.objects.create(
+            name="workflow", organization_id=self.org_id, created_by=self.user
+        )
+        self.source = Source.objects.create(
+            name="source.csv", workflow=self.workflow, created_by=self.user
+        )
+        self.n_tasks = 0
+
+    def create_tasks(self, n_tasks):
+        for _ in range(n_tasks):
+            completed = self.n_tasks % 2 == 0
+            task = Task.objects.create(
+                workflow=self.workflow,
+                source=self.source,
+                assigned_to=self.user,
+                status="completed" if completed else "new",
+                completed_at=timezone.now() if completed else None,
+                n_comments=self.n_tasks % 3,
+            )
+            for _ in range(task.n_comments):
+                TaskActivity.objects.create(
+                    task=task, created_by=self.user, action="comment", comment="hi"
+                )
+            self.n_tasks += 1
+
+    def count_queries(self, url, key, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        tasks = response.data[key] if key else response.data
+        for task in tasks:
+            if "n_comments" in task:
+                expected = TaskActivity.objects.filter(
+                    task_id=task["id"], action="comment"
+                ).count()
+                self.assertEqual(task["n_comments"], expected)
+        return len(queries)
+
+    def assert_constant_queries(self, url, key="tasks", **kwargs):
+        self.create_tasks(4)
+        few = self.count_queries(url, key, **kwargs)
+        self.create_tasks(20)
+        many = self.count_queries(url, key, **kwargs)
+        self.assertEqual(few, many)
+
+    def test_list_tasks(self):
+        self.assert_constant_queries(
+            f"/v1/orgs/{self.org_id}/workflows/{self.workflow.pk}/tasks", key=None
+        )
+
+    def test_list_pending_tasks(self):
+        self.assert_constant_queries(
+            f"/v1/orgs/{self.org_id}/workflows/{self.workflow.pk}/tasks/pending"
+        )
+
+    def test_list_completed_tasks(self):
+        self.assert_constant_queries(
+            f"/v1/orgs/{self.org_id}/workflows/tasks/completed"
+        )
+
+    def test_list_external_completed_tasks(self):
+        self.client.credentials()
+        self.assert_constant_queries(
+            f"/v1/orgs/{self.org_id}/workflows/{self.workflow.pk}/tasks/completed",
+            HTTP_AUTHORIZATION="Token " + self.token,
+        )
@@ -0,0 +1,100 @@
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from human_lambdas.user_handler.models import Organization, User
+from human_lambdas.workflow_handler.models import Task, Workflow
+from human_lambdas.workflow_handler.tests.constants import REGISTRATION_DATA
+
+
+class TestTaskCursorPagination(APITestCase):
+    def setUp(self):
+        cache.clear()
+        _ = self.client.post("/v1/users/register", REGISTRATION_DATA)
+        self.org_id = Organization.objects.get(user__email="foo@bar.com").pk
+        response = self.client.post(
+            "/v1/users/token", {"email": "foo@bar.com", "password": "foowordbar"}
+        )
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + response.data["access"])
+        response = self.client.get("/v1/users/api-token")
+        self.token = response.data["token"]
+        self.user = User.objects.get(email="foo@bar.com")
+        self.workflow = Workflow.objects.create(
+            name="workflow", organization_id=self.org_id, created_by=self.user
+        )
+        now = timezone.now()
+        for i in range(23):
+            # several tasks share their completion and creation times
+            moment = now - timezone.timedelta(minutes=i // 3)
+            task = Task.objects.create(
+                workflow=self.workflow,
+                status="completed" if i % 2 else "new",
+                completed_at=moment if i % 2 else None,
+            )
+            Task.objects.filter(pk=task.pk).update(created_at=moment)
+        self.completed_url = f"/v1/orgs/{self.org_id}/workflows/tasks/completed"
+        self.pending_url = (
+            f"/v1/orgs/{self.org_id}/workflows/{self.workflow.pk}/tasks/pending"
+        )
+
+    def get(self, url, data=None, **kwargs):
+        response = self.client.get(url, data, **kwargs)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return response.data
+
+    def walk(self, url, **kwargs):
+        pages = [self.get(url, {"cursor": "", "limit": 4}, **kwargs)]
+        while pages[-1]["next"]:
+            pages.append(self.get(pages[-1]["next"], **kwargs))
+        return pages
+
+    def ids(self, page):
+        return [task["id"] for task in page["tasks"]]
+
+    def assert_walk_equal_to_offset_pages(self, url, **kwargs):
+        pages = self.walk(url, **kwargs)
+        offset_page = self.get(url, {"limit": 100}, **kwargs)
+
+        self.assertEqual(
+            [task_id for page in pages for task_id in self.ids(page)],
+            self.ids(offset_page),
+        )
+        self.assertIsNone(pages[0]["previous"])
+        for previous_page, page in zip(pages, pages[1:]):
+            previous = self.get(page["previous"], **kwargs)
+            self.assertEqual(self.ids(previous), self.ids(previous_page))
+            self.assertIsNotNone(previous["next"])
+
+    def test_completed_tasks(self):
+        self.assert_walk_equal_to_offset_pages(self.completed_url)
+
+    def test_pending_tasks(self):
+        self.assert_walk_equal_to_offset_pages(self.pending_url)
+
+    def test_external_completed_tasks(self):
+        self.client.credentials()
+        self.assert_walk_equal_to_offset_pages(
+            f"/v1/orgs/{self.org_id}/workflows/{self.workflow.pk}/tasks/completed",
+            HTTP_AUTHORIZATION="Token " + self.token,
+        )
+
+    def test_count_only_when_requested_and_cached(self):
+        page = self.get(self.completed_url, {"cursor": "", "limit": 4})
+        self.assertIsNone(page["count"])
+
+        page = self.get(self.completed_url, {"cursor": "", "count": "true"})
+        self.assertEqual(page["count"], 11)
+
+        Task.objects.create(
+            workflow=self.workflow, status="completed", completed_at=timezone.now()
+        )
+        page = self.get(self.completed_url, {"cursor": "", "count": "true"})
+        self.assertEqual(page["count"], 11)
+        page = self.get(self.completed_url, {"cursor": "", "count": "true", "limit": 2})
+        self.assertEqual(page["count"], 11)
+        self.assertEqual(self.get(page["next"])["count"], 11)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.completed_url, {"cursor": "foo"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
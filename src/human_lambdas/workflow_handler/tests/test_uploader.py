@@ -2,15 +2,34 @@ import csv
 import logging
 import os
 from io import StringIO
+from unittest.mock import patch
 
 import pytest
-from django.test import TestCase
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from human_lambdas.data_handler.csv_utils import process_csv, validate_keys
+from human_lambdas.data_handler import csv_utils
+from human_lambdas.data_handler.csv_utils import (
+    ExtractionPlan,
+    process_csv,
+    validate_keys,
+)
 from human_lambdas.user_handler.models import Organization, User
-from human_lambdas.workflow_handler.models import Task, Workflow
+from human_lambdas.workflow_handler.models import (
+    ImportJob,
+    Source,
+    Task,
+    TaskActivity,
+    Workflow,
+)
+from human_lambdas.workflow_handler.region import Region
+from human_lambdas.workflow_handler.storage_backends import InMemoryBackend
 from human_lambdas.workflow_handler.tests.constants import (
     ALPHA,
     BETA,
@@ -483,3 +502,310 @@ class TestUploadList(APITestCase):
         task = Task.objects.filter(workflow__pk=workflow_id).first()
         self.assertIn(task.source.name, self.file_path)
         assert task.region == "AU"
+
+
+class TestBulkCSV(TestCase):
+    def setUp(self):
+        self.user = User(name="foo", email="foo@bar.com")
+        self.user.save()
+        org = Organization(name="fooInc")
+        org.save()
+        org.add_admin(self.user)
+        self.workflow = Workflow(
+            name="bulk",
+            inputs=[],
+            outputs=[],
+            data=[ALPHA, BETA, GAMMA],
+            organization=org,
+            created_by=self.user,
+        )
+        self.workflow.save()
+        self.source = Source(
+            name="bulk.csv", workflow=self.workflow, created_by=self.user
+        )
+        self.source.save()
+
+    def csv_file(self, n_rows):
+        rows = "\n".join(f"{i},{i + 1},{i + 2}" for i in range(n_rows))
+        return StringIO(f"Alpha,Beta,Gamma\n{rows}")
+
+    def process(self, csv_file, **kwargs):
+        process_csv(
+            csv_file,
+            workflow=self.workflow,
+            source=self.source,
+            user=self.user,
+            filename="bulk.csv",
+            **kwargs,
+        )
+
+    def test_when_processed_in_chunks_then_all_rows_created(self):
+        self.process(self.csv_file(25), chunk_size=10)
+
+        tasks = Task.objects.filter(workflow=self.workflow).order_by("pk")
+        self.assertEqual(tasks.count(), 25)
+        self.assertEqual(
+            [task.data[0]["text"]["value"] for task in tasks],
+            [str(i) for i in range(25)],
+        )
+        self.assertEqual(
+            TaskActivity.objects.filter(
+                task__in=tasks, action="created", source="csv", filename="bulk.csv"
+            ).count(),
+            25,
+        )
+        self.workflow.refresh_from_db()
+        self.assertEqual(self.workflow.n_tasks, 25)
+
+    def test_when_processed_then_queries_per_chunk_not_per_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.process(self.csv_file(200), chunk_size=100)
+
+        self.assertEqual(Task.objects.filter(workflow=self.workflow).count(), 200)
+        self.assertLess(len(queries), 25)
+
+    def test_when_row_invalid_then_chunk_not_created(self):
+        self.workflow.data = [ALPHA, BETA, {**GAMMA, "type": "number", "number": {}}]
+        self.workflow.save()
+
+        with self.assertRaises(Exception):
+            self.process(StringIO("Alpha,Beta,Gamma\n1,2,3\n4,5,[6"), chunk_size=10)
+
+        self.assertEqual(Task.objects.filter(workflow=self.workflow).count(), 0)
+        self.workflow.refresh_from_db()
+        self.assertEqual(self.workflow.n_tasks, 0)
+
+    def test_when_regional_rows_then_data_stored_in_bulk(self):
+        with patch(
+            "human_lambdas.workflow_handler.regional_storage.store_many"
+        ) as store_many:
+            self.process(self.csv_file(5), region="AU", chunk_size=10)
+
+        tasks = list(Task.objects.filter(workflow=self.workflow).order_by("pk"))
+        self.assertEqual(len(store_many.mock_calls), 1)
+        items, region = store_many.call_args[0]
+        self.assertEqual([pk for pk, _ in items], [task.pk for task in tasks])
+        self.assertEqual(items[0][1][0]["text"]["value"], "0")
+        self.assertEqual(region, Region.AU)
+        self.assertEqual(
+            list(
+                Task.objects.filter(workflow=self.workflow).values_list(
+                    "data", flat=True
+                )
+            ),
+            [{}] * 5,
+        )
+
+
+@override_settings(CSV_IMPORT_CHUNK_SIZE=10)
+class TestImportJob(APITestCase):
+    def setUp(self):
+        _ = self.client.post("/v1/users/register", REGISTRATION_DATA)
+        self.org_id = Organization.objects.get(user__email="foo@bar.com").pk
+        response = self.client.post(
+            "/v1/users/token", {"email": "foo@bar.com", "password": "foowordbar"}
+        )
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + response.data["access"])
+        self.workflow = Workflow(
+            name="imports",
+            inputs=[],
+            outputs=[],
+            data=[ALPHA, BETA, {**GAMMA, "type": "number", "number": {}}],
+            organization_id=self.org_id,
+            created_by=User.objects.get(email="foo@bar.com"),
+        )
+        self.workflow.save()
+        self.url = f"/v1/orgs/{self.org_id}/workflows/{self.workflow.pk}"
+
+    def csv_file(self, rows):
+        content = "Alpha,Beta,Gamma\n" + "\n".join(rows)
+        return SimpleUploadedFile("imports.csv", content.encode("utf-8"))
+
+    def upload(self, rows, region=None):
+        url = f"{self.url}/upload" + (f"?region={region}" if region else "")
+        return self.client.post(url, {"file": self.csv_file(rows)})
+
+    def get_job(self, job_id):
+        response = self.client.get(f"{self.url}/imports/{job_id}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        return response.data
+
+    def test_when_background_then_imported_by_worker(self):
+        with self.settings(CSV_IMPORT_BACKGROUND=True):
+            response = self.upload([f"{i},{i},{i}" for i in range(25)])
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job_id = response.data["job"]["id"]
+        self.assertEqual(self.get_job(job_id)["status"], "queued")
+        self.assertEqual(Task.objects.filter(workflow=self.workflow).count(), 0)
+
+        call_command("runworker", "--once", stdout=StringIO())
+
+        job = self.get_job(job_id)
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual(
+            (job["rows_total"], job["rows_done"], job["rows_failed"]), (25, 25, 0)
+        )
+        self.assertEqual(job["rows_pending"], 0)
+        self.assertEqual(Task.objects.filter(workflow=self.workflow).count(), 25)
+
+    def test_when_row_invalid_then_only_that_row_skipped(self):
+        rows = [f"{i},{i},{i}" for i in range(15)]
+        rows[12] = "12,12,[12"
+
+        response = self.upload(rows)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("partially imported", response.data["message"])
+        self.assertEqual(len(response.data["errors"]), 1)
+        job = response.data["job"]
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual((job["rows_done"], job["rows_failed"]), (14, 1))
+        self.assertEqual(job["errors"][0]["row"], 13)
+        self.assertEqual(Task.objects.filter(workflow=self.workflow).count(), 14)
+        self.workflow.refresh_from_db()
+        self.assertEqual(self.workflow.n_tasks, 14)
+
+    def test_when_job_failed_then_resumed_after_committed_chunks(self):
+        create_tasks = csv_utils.create_tasks
+        calls = []
+
+        def fail_second_chunk(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise Exception("database went away")
+            return create_tasks(*args, **kwargs)
+
+        with patch.object(csv_utils, "create_tasks", fail_second_chunk):
+            response = self.upload([f"{i},{i},{i}" for i in range(25)])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("15 rows left", response.data["message"])
+        job = response.data["job"]
+        self.assertEqual(job["status"], "failed")
+        self.assertEqual((job["rows_done"], job["rows_pending"]), (10, 15))
+        self.assertEqual(Task.objects.filter(workflow=self.workflow).count(), 10)
+
+        self.assertFalse(ImportJob.objects.get(pk=job["id"]).file)
+
+        response = self.client.post(
+            f"{self.url}/imports/{job['id']}/resume",
+            {"file": self.csv_file([f"{i},{i},{i}" for i in range(25)])},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.assertEqual(response.data["job"]["rows_done"], 25)
+        tasks = Task.objects.filter(workflow=self.workflow).order_by("pk")
+        self.assertEqual(
+            [task.data[0]["text"]["value"] for task in tasks],
+            [str(i) for i in range(25)],
+        )
+
+    def test_when_resumed_with_other_file_then_not_resumed(self):
+        with patch.object(csv_utils, "create_tasks", side_effect=Exception("gone")):
+            job_id = self.upload(["1,2,3", "4,5,6"]).data["job"]["id"]
+        url = f"{self.url}/imports/{job_id}/resume"
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(url, {"file": self.csv_file(["1,2,3"])})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        job = ImportJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, "failed")
+        self.assertFalse(job.file)
+        self.assertEqual(Task.objects.filter(workflow=self.workflow).count(), 0)
+
+    def test_when_job_completed_then_file_deleted(self):
+        with self.settings(CSV_IMPORT_BACKGROUND=True):
+            job_id = self.upload(["1,2,3"]).data["job"]["id"]
+        name = ImportJob.objects.get(pk=job_id).file.name
+        self.assertTrue(default_storage.exists(name))
+
+        call_command("runworker", "--once", stdout=StringIO())
+
+        self.assertFalse(ImportJob.objects.get(pk=job_id).file)
+        self.assertFalse(default_storage.exists(name))
+
+    def test_when_regional_then_file_staged_in_region(self):
+        backend = InMemoryBackend()
+        with self.settings(CSV_IMPORT_BACKGROUND=True), patch.object(
+            Region, "get_backend", return_value=backend
+        ):
+            job_id = self.upload(["1,2,3"], region="AU").data["job"]["id"]
+            name = ImportJob.objects.get(pk=job_id).file.name
+            self.assertTrue(name.startswith("AU/imports/"))
+            self.assertFalse(default_storage.exists(name))
+            self.assertEqual(len(backend.blobs), 1)
+
+            call_command("runworker", "--once", stdout=StringIO())
+
+        self.assertEqual(ImportJob.objects.get(pk=job_id).status, "completed")
+        # only the data of the task is left
+        self.assertEqual(len(backend.blobs), 1)
+        [key] = backend.blobs
+        self.assertNotIn("imports", key)
+
+    def test_when_job_not_failed_then_not_resumed(self):
+        job_id = self.upload(["1,2,3"]).data["job"]["id"]
+
+        response = self.client.post(
+            f"{self.url}/imports/{job_id}/resume", {"file": self.csv_file(["1,2,3"])}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Task.objects.filter(workflow=self.workflow).count(), 1)
+
+
+class TestExtractionPlan(SimpleTestCase):
+    def setUp(self):
+        self.blocks = [
+            {**ALPHA, "layout": {"x": 0}},
+            {"id": "score", "name": "score", "type": "number", "number": {}},
+            {
+                "id": "ner",
+                "name": "ner",
+                "type": "named_entity_recognition",
+                "named_entity_recognition": {"options": ["PER"]},
+            },
+        ]
+
+    def test_when_extracted_then_values_set_by_column(self):
+        plan = ExtractionPlan(self.blocks, ["ner.text", "score", "Alpha"])
+
+        alpha, score, ner = plan.extract(["foo bar", " 42 ", "alpha"])
+
+        self.assertEqual(alpha["text"]["value"], "alpha")
+        self.assertNotIn("layout", alpha)
+        self.assertEqual(score["number"]["value"], 42)
+        self.assertEqual(ner["named_entity_recognition"]["value"], "foo bar")
+
+    def test_when_ner_object_column_then_preferred_over_text(self):
+        plan = ExtractionPlan(self.blocks[2:], ["ner.text", "ner"])
+        entity = {"start": 0, "end": 3, "category": "PER"}
+
+        [ner] = plan.extract(["ignored", str({"text": "foo", "entities": [entity]})])
+
+        self.assertEqual(ner["named_entity_recognition"]["value"], "foo")
+        self.assertEqual(
+            ner["named_entity_recognition"]["entities"],
+            [{"start": 0, "end": 3, "tag": "PER"}],
+        )
+
+    def test_when_row_short_or_column_missing_then_value_not_set(self):
+        plan = ExtractionPlan(self.blocks[:2], ["Alpha", "score"])
+
+        alpha, score = plan.extract(["alpha"])
+
+        self.assertEqual(alpha["text"]["value"], "alpha")
+        self.assertNotIn("value", score["number"])
+
+    def test_when_rows_extracted_then_blocks_not_shared(self):
+        plan = ExtractionPlan(self.blocks, ["Alpha", "score"])
+
+        first, second = plan.extract(["a", "1"]), plan.extract(["b", "2"])
+
+        self.assertEqual(first[0]["text"]["value"], "a")
+        self.assertEqual(second[0]["text"]["value"], "b")
+        self.assertNotIn("value", self.blocks[0]["text"])
+        self.assertIn("layout", self.blocks[0])
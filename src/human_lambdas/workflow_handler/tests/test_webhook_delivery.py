@@ -0,0 +1,376 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from human_lambdas.user_handler.models import Organization
+from human_lambdas.workflow_handler import regional_storage
+from human_lambdas.workflow_handler.models import (
+    Task,
+    WebHook,
+    WebhookDelivery,
+)
+from human_lambdas.workflow_handler.region import Region
+from human_lambdas.workflow_handler.storage_backends import InMemoryBackend
+from human_lambdas.workflow_handler.tests.constants import (
+    REGISTRATION_DATA,
+    WORKFLOW_DATA_3,
+)
+from human_lambdas.workflow_handler.webhooks import WebhookDispatcher
+
+_CURRENT_DIR = os.path.dirname(__file__)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.bodies.append(json.loads(body))
+        status_codes = self.server.status_codes
+        self.send_response(status_codes.pop(0) if status_codes else 200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class WebhookDeliveryMixin:
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        self.server.bodies, self.server.status_codes = [], []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.target = "http://127.0.0.1:{}/hook".format(self.server.server_port)
+
+        response = self.client.post("/v1/users/register", REGISTRATION_DATA)
+        self.user_id = response.data["id"]
+        self.org_id = Organization.objects.get(user__email="foo@bar.com").pk
+        response = self.client.post(
+            "/v1/users/token", {"email": "foo@bar.com", "password": "foowordbar"}
+        )
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + response.data["access"])
+        response = self.client.post(
+            "/v1/orgs/{}/workflows/create".format(self.org_id),
+            {**WORKFLOW_DATA_3, "webhook": {"target": self.target}},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.workflow_id = response.data["id"]
+        with open(os.path.join(_CURRENT_DIR, "data", "test.csv")) as f:
+            response = self.client.post(
+                "/v1/orgs/{0}/workflows/{1}/upload".format(
+                    self.org_id, self.workflow_id
+                ),
+                data={"file": f},
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+
+    def complete_task(self, task):
+        task_url = "/v1/orgs/{0}/workflows/{1}/tasks/{2}".format(
+            self.org_id, self.workflow_id, task.pk
+        )
+        response = self.client.post(
+            task_url + "/assign", data={"assigned_to": self.user_id}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        data = task.data
+        for idata in data:
+            if idata["id"] == "foo":
+                idata[idata["type"]]["value"] = "foo1"
+        response = self.client.patch(
+            task_url,
+            data={"data": data, "assigned_to": self.user_id},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+
+
+class TestInlineWebhookDelivery(WebhookDeliveryMixin, APITransactionTestCase):
+    def test_delivered_on_completion(self):
+        task = Task.objects.filter(workflow_id=self.workflow_id).first()
+        self.complete_task(task)
+
+        delivery = WebhookDelivery.objects.get(task=task)
+        self.assertEqual(delivery.status, "delivered")
+        self.assertEqual(delivery.attempts, 1)
+        self.assertEqual(len(self.server.bodies), 1)
+        self.assertEqual(self.server.bodies[0]["id"], task.pk)
+
+    def test_failure_is_not_retried(self):
+        self.server.status_codes = [500]
+        task = Task.objects.filter(workflow_id=self.workflow_id).first()
+        self.complete_task(task)
+
+        delivery = WebhookDelivery.objects.get(task=task)
+        self.assertEqual(delivery.status, "failed")
+        self.assertEqual(delivery.log[0]["status_code"], 500)
+
+    def test_not_batched(self):
+        WebHook.objects.filter(workflow_id=self.workflow_id).update(batch_size=2)
+        for task in Task.objects.filter(workflow_id=self.workflow_id)[:2]:
+            self.complete_task(task)
+
+        self.assertEqual(len(self.server.bodies), 2)
+        self.assertNotIn("batch_id", self.server.bodies[0])
+
+
+@override_settings(WEBHOOK_BACKGROUND=True)
+class TestWebhookDelivery(WebhookDeliveryMixin, APITestCase):
+    def run_worker(self):
+        call_command("runworker", "--once", "--queue", "webhooks", "--interval", "0.01")
+
+    def test_completion_queues_delivery(self):
+        task = Task.objects.filter(workflow_id=self.workflow_id).first()
+        self.complete_task(task)
+
+        delivery = WebhookDelivery.objects.get(task=task)
+        self.assertEqual(delivery.status, "pending")
+        self.assertEqual(delivery.event, "task.completed")
+        self.assertEqual(delivery.target, self.target)
+        self.assertEqual(self.server.bodies, [])
+
+    def test_delivery(self):
+        task = Task.objects.filter(workflow_id=self.workflow_id).first()
+        self.complete_task(task)
+        self.run_worker()
+
+        delivery = WebhookDelivery.objects.get(task=task)
+        self.assertEqual(delivery.status, "delivered")
+        self.assertEqual(delivery.attempts, 1)
+        self.assertIsNotNone(delivery.delivered_at)
+        self.assertEqual(delivery.log[0]["status_code"], 200)
+        self.assertIsNone(delivery.log[0]["error"])
+        self.assertGreaterEqual(delivery.log[0]["latency_ms"], 0)
+        self.assertEqual(len(self.server.bodies), 1)
+        self.assertEqual(self.server.bodies[0]["id"], task.pk)
+        self.assertEqual(self.server.bodies[0]["status"], "completed")
+
+        response = self.client.get(
+            "/v1/orgs/{0}/workflows/{1}/webhook/deliveries".format(
+                self.org_id, self.workflow_id
+            )
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(response.data["count"], 1)
+        result = response.data["results"][0]
+        self.assertEqual(result["task"], task.pk)
+        self.assertEqual(result["status"], "delivered")
+        self.assertEqual(result["log"][0]["status_code"], 200)
+
+        response = self.client.get(
+            "/v1/orgs/{0}/workflows/{1}/webhook/deliveries".format(
+                self.org_id, self.workflow_id
+            ),
+            {"status": "failed"},
+        )
+        self.assertEqual(response.data["count"], 0)
+
+    def test_task_sent_as_at_the_event(self):
+        task = Task.objects.filter(workflow_id=self.workflow_id).first()
+        self.complete_task(task)
+        Task.objects.filter(pk=task.pk).update(status="new", correct=False)
+        self.run_worker()
+
+        self.assertEqual(self.server.bodies[0]["status"], "completed")
+        self.assertIsNone(self.server.bodies[0]["correct"])
+
+    def test_server_error_is_retried(self):
+        self.server.status_codes = [500]
+        task = Task.objects.filter(workflow_id=self.workflow_id).first()
+        self.complete_task(task)
+        self.run_worker()
+
+        delivery = WebhookDelivery.objects.get(task=task)
+        self.assertEqual(delivery.status, "pending")
+        self.assertEqual(delivery.attempts, 1)
+        self.assertGreater(delivery.next_attempt_at, timezone.now())
+        self.assertEqual(delivery.log[0]["status_code"], 500)
+
+        # not due yet
+        self.run_worker()
+        self.assertEqual(len(self.server.bodies), 1)
+
+        WebhookDelivery.objects.update(next_attempt_at=timezone.now())
+        self.run_worker()
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, "delivered")
+        self.assertEqual(delivery.attempts, 2)
+        self.assertEqual(len(self.server.bodies), 2)
+
+    def test_client_error_fails(self):
+        self.server.status_codes = [400]
+        task = Task.objects.filter(workflow_id=self.workflow_id).first()
+        self.complete_task(task)
+        self.run_worker()
+
+        delivery = WebhookDelivery.objects.get(task=task)
+        self.assertEqual(delivery.status, "failed")
+        self.assertEqual(delivery.attempts, 1)
+
+    @override_settings(WEBHOOK_MAX_ATTEMPTS=2)
+    def test_max_attempts(self):
+        self.server.status_codes = [503, 503]
+        task = Task.objects.filter(workflow_id=self.workflow_id).first()
+        self.complete_task(task)
+        self.run_worker()
+        WebhookDelivery.objects.update(next_attempt_at=timezone.now())
+        self.run_worker()
+
+        delivery = WebhookDelivery.objects.get(task=task)
+        self.assertEqual(delivery.status, "failed")
+        self.assertEqual(delivery.attempts, 2)
+
+    def test_unreachable_target_is_retried(self):
+        WebHook.objects.filter(workflow_id=self.workflow_id).update(
+            target="http://127.0.0.1:1/hook"
+        )
+        task = Task.objects.filter(workflow_id=self.workflow_id).first()
+        self.complete_task(task)
+        self.run_worker()
+
+        delivery = WebhookDelivery.objects.get(task=task)
+        self.assertEqual(delivery.status, "pending")
+        self.assertIsNone(delivery.log[0]["status_code"])
+        self.assertIsNotNone(delivery.log[0]["error"])
+
+    def test_removed_hook_fails(self):
+        task = Task.objects.filter(workflow_id=self.workflow_id).first()
+        self.complete_task(task)
+        WebHook.objects.filter(workflow_id=self.workflow_id).delete()
+        self.run_worker()
+
+        delivery = WebhookDelivery.objects.get(task=task)
+        self.assertEqual(delivery.status, "failed")
+        self.assertEqual(self.server.bodies, [])
+
+    def test_target_concurrency(self):
+        for task in Task.objects.filter(workflow_id=self.workflow_id)[:2]:
+            self.complete_task(task)
+        self.assertEqual(WebhookDelivery.objects.count(), 2)
+
+        dispatcher = WebhookDispatcher(concurrency=4, target_concurrency=1)
+        try:
+            self.assertEqual(dispatcher.dispatch(), 1)
+        finally:
+            dispatcher.close()
+        self.assertEqual(WebhookDelivery.objects.filter(status="delivered").count(), 1)
+
+        dispatcher = WebhookDispatcher(concurrency=4, target_concurrency=1)
+        try:
+            self.assertEqual(dispatcher.dispatch(), 1)
+        finally:
+            dispatcher.close()
+        self.assertEqual(WebhookDelivery.objects.filter(status="delivered").count(), 2)
+
+    def set_batching(self, **kwargs):
+        response = self.client.patch(
+            "/v1/orgs/{0}/workflows/{1}/webhook".format(self.org_id, self.workflow_id),
+            {"target": self.target, **kwargs},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+
+    def test_full_batch(self):
+        self.set_batching(batch_size=2, batch_window_ms=60000)
+        tasks = list(Task.objects.filter(workflow_id=self.workflow_id)[:2])
+        self.complete_task(tasks[0])
+        self.run_worker()
+        self.assertEqual(self.server.bodies, [])
+
+        self.complete_task(tasks[1])
+        self.run_worker()
+        self.assertEqual(len(self.server.bodies), 1)
+        body = self.server.bodies[0]
+        self.assertEqual([task["id"] for task in body["tasks"]], [t.pk for t in tasks])
+        deliveries = WebhookDelivery.objects.all()
+        self.assertEqual({delivery.status for delivery in deliveries}, {"delivered"})
+        self.assertEqual(
+            {str(delivery.batch_id) for delivery in deliveries}, {body["batch_id"]}
+        )
+
+    def test_batch_window(self):
+        self.set_batching(batch_size=3, batch_window_ms=0)
+        tasks = list(Task.objects.filter(workflow_id=self.workflow_id)[:2])
+        for task in tasks:
+            self.complete_task(task)
+        self.run_worker()
+
+        self.assertEqual(len(self.server.bodies), 1)
+        self.assertEqual(
+            [task["id"] for task in self.server.bodies[0]["tasks"]],
+            [task.pk for task in tasks],
+        )
+
+    def test_regional_batch_fetched_together(self):
+        backend = InMemoryBackend()
+        patcher = patch.object(Region, "get_backend", return_value=backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        tasks = list(Task.objects.filter(workflow_id=self.workflow_id)[:3])
+        for task in tasks:
+            task.region = "AU"
+            task.save()
+        self.set_batching(batch_size=3)
+        for task in tasks:
+            self.complete_task(Task.objects.get(pk=task.pk))
+
+        with patch.object(
+            regional_storage, "retrieve", wraps=regional_storage.retrieve
+        ) as retrieve, patch.object(
+            regional_storage, "retrieve_many", wraps=regional_storage.retrieve_many
+        ) as retrieve_many:
+            self.run_worker()
+
+        retrieve.assert_not_called()
+        self.assertEqual(retrieve_many.call_count, 1)
+        body = self.server.bodies[0]
+        self.assertEqual([task["region"] for task in body["tasks"]], ["AU"] * 3)
+        self.assertTrue(all(task["data"] for task in body["tasks"]))
+
+    def test_batch_retried_together(self):
+        self.server.status_codes = [500]
+        self.set_batching(batch_size=2)
+        for task in Task.objects.filter(workflow_id=self.workflow_id)[:2]:
+            self.complete_task(task)
+        self.run_worker()
+
+        deliveries = WebhookDelivery.objects.all()
+        self.assertEqual({delivery.status for delivery in deliveries}, {"pending"})
+        self.assertEqual(len({delivery.next_attempt_at for delivery in deliveries}), 1)
+
+        WebhookDelivery.objects.update(next_attempt_at=timezone.now())
+        self.run_worker()
+        self.assertEqual(len(self.server.bodies), 2)
+        self.assertEqual(
+            self.server.bodies[0]["batch_id"], self.server.bodies[1]["batch_id"]
+        )
+        self.assertEqual(
+            set(WebhookDelivery.objects.values_list("status", "attempts")),
+            {("delivered", 2)},
+        )
+
+    def test_zapier_hooks_are_not_batched(self):
+        WebHook.objects.filter(workflow_id=self.workflow_id).update(
+            is_zapier=True, batch_size=2
+        )
+        for task in Task.objects.filter(workflow_id=self.workflow_id)[:2]:
+            self.complete_task(task)
+        self.run_worker()
+
+        self.assertEqual(len(self.server.bodies), 2)
+        self.assertNotIn("batch_id", self.server.bodies[0])
+
+    def test_invalid_batching(self):
+        response = self.client.patch(
+            "/v1/orgs/{0}/workflows/{1}/webhook".format(self.org_id, self.workflow_id),
+            {"target": self.target, "batch_size": 0},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,25 +1,42 @@
+import base64
 import copy
 import datetime
+import hashlib
+import json
 import logging
 import os
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
 import cchardet
 import requests
 import sentry_sdk
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Q, QuerySet
 from django.utils import timezone
 from django.utils.timezone import make_aware
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
-from .models import WebHook, Workflow, WorkflowNotification
+from human_lambdas.hl_rest_api.background import BackgroundDispatcher
+
+from .models import Task, WebHook, Workflow, WorkflowNotification
+from .webhooks import deliver_now, enqueue_deliveries
 
 logger = logging.getLogger(__name__)
 
 TEMPLATE_ORG_ID = 40
 STAFF_ORG_ID = 1000000000
 
+# Claimed in order: new work first, then tasks which were unassigned again
+CLAIMABLE_STATUSES = (("pending", "new"), ("open",))  # TODO: Remove pending
+CLAIM_CANDIDATES = 10
+
 
 def parse_dates(request):
     try:
@@ -39,13 +56,19 @@ def parse_dates(request):
 
 
 def find_and_fire_hook(event_name, instance, **kwargs):
+    """
+    Queues the delivery of the event to the webhooks of the workflow, which
+    is sent once the event is committed unless WEBHOOK_BACKGROUND is set,
+    see workflow_handler.webhooks.
+    """
     filters = {
         "event": event_name,
         "workflow": instance.workflow,
     }
     hooks = WebHook.objects.filter(**filters)
-    for hook in hooks:
-        hook.deliver_hook(instance)
+    deliveries = enqueue_deliveries(event_name, instance, hooks)
+    if deliveries and not settings.WEBHOOK_BACKGROUND:
+        transaction.on_commit(lambda: deliver_now(deliveries))
 
 
 def decode_csv(file_obj):
@@ -86,10 +109,121 @@ def process_query_params(query_params):
 class TaskPagination(LimitOffsetPagination):
     """
     Extended pagination class for Tasks
+
+    Pages by limit and offset or, when the cursor query parameter is given
+    (empty for the first page), by cursor: the page continues the ordering
+    of the queryset, with the primary key breaking ties, after the last task
+    of the previous page, so neither the tasks before the page are skipped
+    nor all the tasks are counted. The count of a cursor page is only
+    included when requested with count=true, and cached for
+    TASK_COUNT_CACHE_TTL seconds.
     """
 
     default_limit = 100
     max_limit = 1000
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    invalid_cursor_message = "Invalid cursor"
+
+    cursor = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.ordering = keyset_ordering(queryset)
+        self.cursor = self.decode_cursor(request)
+        self.count = None
+        if request.query_params.get(self.count_query_param) == "true":
+            self.count = self.get_cached_count(queryset, request)
+
+        reverse, values = self.cursor
+        ordering = self.ordering
+        if reverse:
+            ordering = [(name, not descending) for name, descending in ordering]
+        if values is not None:
+            queryset = queryset.filter(keyset_filter(ordering, values))
+        queryset = queryset.order_by(*keyset_order_by(ordering))
+        page = list(queryset[: self.limit + 1])
+        has_more = len(page) > self.limit
+        page = page[: self.limit]
+        if reverse:
+            page.reverse()
+
+        self.page = page
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else values is not None
+        return page
+
+    def decode_cursor(self, request):
+        """
+        The direction and the ordering values of the task the page continues
+        after, None for the first page.
+        """
+        encoded = request.query_params[self.cursor_query_param]
+        if not encoded:
+            return False, None
+        try:
+            reverse, values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            fields = [self._get_field(name) for name, _ in self.ordering]
+            return bool(reverse), [
+                field.to_python(value) for field, value in zip(fields, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, task, reverse):
+        values = [
+            self._get_field(name).value_to_string(task) for name, _ in self.ordering
+        ]
+        encoded = base64.urlsafe_b64encode(json.dumps([reverse, values]).encode())
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.offset_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded.decode())
+
+    def _get_field(self, name):
+        if name == "pk":
+            return Task._meta.pk
+        return Task._meta.get_field(name)
+
+    def get_cached_count(self, queryset, request):
+        params = sorted(
+            (key, request.query_params.getlist(key))
+            for key in request.query_params
+            if key
+            not in (
+                self.cursor_query_param,
+                self.limit_query_param,
+                self.offset_query_param,
+            )
+        )
+        key = hashlib.sha1(
+            json.dumps([request.path, request.user.pk, params]).encode()
+        ).hexdigest()
+        key = f"task-count:{key}"
+        count = cache.get(key)
+        if count is None:
+            count = self.get_count(queryset)
+            cache.set(key, count, timeout=settings.TASK_COUNT_CACHE_TTL)
+        return count
+
+    def get_next_link(self):
+        if self.cursor is None:
+            return super().get_next_link()
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if self.cursor is None:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
 
     def get_paginated_response(self, data):
         return Response(
@@ -103,6 +237,107 @@ class TaskPagination(LimitOffsetPagination):
         )
 
 
+def keyset_ordering(queryset: QuerySet) -> List[Tuple[str, bool]]:
+    """
+    The (field name, descending) ordering of the queryset, ending with the
+    primary key so that it is total.
+    """
+    ordering = [
+        (name.lstrip("-"), name.startswith("-")) for name in queryset.query.order_by
+    ]
+    if not ordering or ordering[-1][0] not in ("pk", "id"):
+        ordering.append(("pk", ordering[0][1] if ordering else False))
+    return ordering
+
+
+def keyset_order_by(ordering: List[Tuple[str, bool]]) -> List[str]:
+    return [("-" if descending else "") + name for name, descending in ordering]
+
+
+def keyset_filter(ordering: List[Tuple[str, bool]], values: List[Any]) -> Q:
+    """
+    The rows after the values in the ordering.
+    """
+    condition = Q()
+    for index in reversed(range(len(ordering))):
+        name, descending = ordering[index]
+        after = Q(**{f"{name}__{'lt' if descending else 'gt'}": values[index]})
+        if index + 1 < len(ordering):
+            after |= Q(**{name: values[index]}) & condition
+        condition = after
+    return condition
+
+
+def keyset_neighbours(
+    queryset: QuerySet, task: Task, count: int = 1, previous: bool = False
+) -> List[int]:
+    """
+    The ids of the count tasks after, or before, the task in the ordering of
+    the queryset.
+    """
+    ordering = keyset_ordering(queryset)
+    values = [getattr(task, name) for name, _ in ordering]
+    if previous:
+        ordering = [(name, not descending) for name, descending in ordering]
+    return list(
+        queryset.filter(keyset_filter(ordering, values))
+        .order_by(*keyset_order_by(ordering))
+        .values_list("pk", flat=True)[:count]
+    )
+
+
+def claim_next_task(queryset: QuerySet, user) -> Optional[Task]:
+    """
+    Assigns the first unclaimed task of an ordered queryset to the user.
+
+    Where the database supports SKIP LOCKED (Postgres) every worker locks a
+    different row instead of queueing behind the head of the queue. Databases
+    without row locks (SQLite) only have a single writer, so there the claim
+    is a conditional UPDATE which only succeeds while the task is unclaimed.
+    """
+    for statuses in CLAIMABLE_STATUSES:
+        candidates = queryset.filter(status__in=statuses)
+        if connection.features.has_select_for_update_skip_locked:
+            task = _claim_skip_locked(candidates, user)
+        else:
+            task = _claim_conditional(candidates, statuses, user)
+        if task:
+            return task
+    return None
+
+
+def _assign(task: Task, user):
+    task.status = "in_progress"
+    task.assigned_to = user
+    task.assigned_at = timezone.now()
+    return {
+        "status": task.status,
+        "assigned_to": user,
+        "assigned_at": task.assigned_at,
+    }
+
+
+def _claim_skip_locked(candidates: QuerySet, user) -> Optional[Task]:
+    with transaction.atomic():
+        task = candidates.select_for_update(skip_locked=True).first()
+        if task:
+            Task.objects.filter(pk=task.pk).update(**_assign(task, user))
+        return task
+
+
+def _claim_conditional(candidates: QuerySet, statuses, user) -> Optional[Task]:
+    while True:
+        tasks = list(candidates[:CLAIM_CANDIDATES])
+        if not tasks:
+            return None
+        for task in tasks:
+            claimed = Task.objects.filter(pk=task.pk, status__in=statuses).update(
+                **_assign(task, user)
+            )
+            if claimed:
+                return task
+
+
 def create_template(template_id, user, org):
     if template_id:
         workflow = Workflow.objects.filter(
@@ -137,33 +372,75 @@ def is_force(query_params):
     return False
 
 
-def notify_staff_run_status(data: Dict[str, Any], request: Request):
-    if not "SLACK_WEBHOOK_URL" in os.environ:
-        logger.warn("not sending notification, slack not configured")
-        return
-    try:
-        status = "running" if data["is_running"] else "paused"
-        text = f" set {data['name']} to {status}"
-        notify_slack(text, request)
-    except Exception as ex:
-        sentry_sdk.capture_exception(ex)
+def notify_staff_run_status(workflow: Workflow, request: Request):
+    status = "running" if workflow.is_running else "paused"
+    notify_slack(f"set to {status}", workflow, request)
 
 
-def notify_slack(text: str, request: Request):
+def notify_slack(event: str, workflow: Workflow, request: Request):
+    """
+    Queues a Slack notification of an event of the workflow, see
+    send_slack_messages.
+    """
     if not "SLACK_WEBHOOK_URL" in os.environ:
         logger.warn("not sending notification, slack not configured")
         return
     try:
-        email = request.user.email
-        path = request.stream.path
-        slack_url = os.getenv("SLACK_WEBHOOK_URL")
-        if slack_url is None:
-            sentry_sdk.capture_exception("No slack url configured!")
-
-        r = requests.post(slack_url, json={"text": f"{email} called {path}: {text}"})
-        if r.status_code != 200:
-            return sentry_sdk.capture_message(
-                f"Slack notification failed with status {r.status_code}"
+        slack_dispatcher.put(
+            (
+                os.getenv("SLACK_WEBHOOK_URL"),
+                workflow.pk,
+                event,
+                workflow.name,
+                request.user.email,
+                request.stream.path,
             )
+        )
     except Exception as ex:
         sentry_sdk.capture_exception(ex)
+
+
+def render_slack_message(
+    event: str, workflow_name: str, callers: List[Tuple[str, str]]
+) -> str:
+    text = f"{event} for {workflow_name}"
+    if len(callers) == 1:
+        email, path = callers[0]
+        return f"{email} called {path}: {text}"
+    emails = ", ".join(dict.fromkeys(email for email, _ in callers))
+    return f"{text} ({len(callers)} times, by {emails})"
+
+
+def send_slack_messages(messages: List[Tuple[str, int, str, str, str, str]]):
+    """
+    Posts the queued Slack notifications, those of the same event of a
+    workflow once with their count and callers. Notifications are queued for
+    up to SLACK_COALESCE_SECONDS, so that those of a burst of task creations
+    for a workflow are coalesced.
+    """
+    groups: Dict[Tuple[str, int, str], List[Tuple[str, str]]] = {}
+    names: Dict[int, str] = {}
+    for slack_url, workflow_id, event, workflow_name, email, path in messages:
+        groups.setdefault((slack_url, workflow_id, event), []).append((email, path))
+        names[workflow_id] = workflow_name
+    for (slack_url, workflow_id, event), callers in groups.items():
+        text = render_slack_message(event, names[workflow_id], callers)
+        try:
+            r = slack_session.post(
+                slack_url, json={"text": text}, timeout=settings.SLACK_TIMEOUT_SECONDS
+            )
+            if r.status_code != 200:
+                sentry_sdk.capture_message(
+                    f"Slack notification failed with status {r.status_code}"
+                )
+        except Exception as ex:
+            sentry_sdk.capture_exception(ex)
+
+
+slack_session = requests.Session()
+slack_dispatcher = BackgroundDispatcher(
+    "slack",
+    send_slack_messages,
+    max_size=1000,
+    flush_interval=settings.SLACK_COALESCE_SECONDS,
+)
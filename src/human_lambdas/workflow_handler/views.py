@@ -1,6 +1,7 @@
 import copy
 import logging
 
+from django.conf import settings
 from django.db import transaction
 from django.db.models import OuterRef, Q, Subquery
 from django.shortcuts import get_list_or_404, get_object_or_404
@@ -14,26 +15,41 @@ from rest_framework.generics import (
     RetrieveUpdateAPIView,
 )
 from rest_framework.mixins import CreateModelMixin, UpdateModelMixin
+from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
-from human_lambdas.data_handler.csv_utils import process_csv
+from human_lambdas.data_handler.csv_utils import (
+    run_import_job,
+    stage_import_file,
+)
 from human_lambdas.data_handler.data_sync import sync_workflow_task
 from human_lambdas.external.authentication import TokenAuthentication
 from human_lambdas.user_handler.permissions import IsAuthorized, IsOrgAdmin
 from human_lambdas.workflow_handler.utils import is_force
 
-from .models import Source, Task, TaskActivity, User, WebHook, Workflow
+from .models import (
+    ImportJob,
+    Source,
+    Task,
+    TaskActivity,
+    User,
+    WebHook,
+    WebhookDelivery,
+    Workflow,
+)
 from .serializers import (
     HookSerializer,
+    ImportJobSerializer,
     PendingTaskSerializer,
     TaskSerializer,
+    WebhookDeliverySerializer,
     WorkflowSerializer,
 )
-from .utils import STAFF_ORG_ID, TaskPagination, decode_csv, notify_slack
+from .utils import STAFF_ORG_ID, TaskPagination, claim_next_task, notify_slack
 
 
 class RUWebhookView(RetrieveUpdateAPIView, CreateModelMixin):
@@ -51,6 +67,12 @@ class RUWebhookView(RetrieveUpdateAPIView, CreateModelMixin):
         queryset = self.filter_queryset(self.get_queryset())
         return queryset.first()
 
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        if not instance:
+            return Response({"target": ""})
+        return Response(self.get_serializer(instance).data)
+
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop("partial", False)
         instance = self.get_object()
@@ -84,6 +106,32 @@ class RUWebhookView(RetrieveUpdateAPIView, CreateModelMixin):
         instance.delete()
 
 
+class WebhookDeliveryPagination(LimitOffsetPagination):
+    default_limit = 100
+    max_limit = 1000
+
+
+class ListWebhookDeliveryView(ListAPIView):
+    """
+    The webhook deliveries of a workflow and their attempts, latest first,
+    optionally filtered by status.
+    """
+
+    permission_classes = (IsAuthenticated, IsOrgAdmin)
+    authentication_classes = (TokenAuthentication, JWTAuthentication)
+    serializer_class = WebhookDeliverySerializer
+    pagination_class = WebhookDeliveryPagination
+
+    def get_queryset(self):
+        queryset = WebhookDelivery.objects.filter(
+            workflow__organization__pk=self.kwargs["org_id"],
+            workflow__pk=self.kwargs["workflow_id"],
+        )
+        if self.request.query_params.get("status"):
+            queryset = queryset.filter(status=self.request.query_params["status"])
+        return queryset.order_by("-created_at", "-pk")
+
+
 logger = logging.getLogger(__name__)
 
 
@@ -195,8 +243,11 @@ class BaseWorkflowView(RetrieveAPIView):
             hasattr(obj, "webhook_set")
             and obj.webhook_set.filter(is_zapier=False).exists()
         ):
+            hook = WebHook.objects.get(workflow=obj, is_zapier=False)
             workflow["webhook"] = {
-                "target": WebHook.objects.get(workflow=obj, is_zapier=False).target
+                "target": hook.target,
+                "batch_size": hook.batch_size,
+                "batch_window_ms": hook.batch_window_ms,
             }
 
         return workflow
@@ -255,34 +306,114 @@ class FileUploadView(APIView):
     def post(self, request: request.Request, *args, **kwargs):
         file_obj = request.data["file"]
         workflow: Workflow = get_object_or_404(self.get_queryset())
-        content = decode_csv(file_obj)
-        filename = request.data["file"].name
+        filename = file_obj.name
         source = Source(name=filename, workflow=workflow, created_by=request.user)
         source.save()
-        try:
-            process_csv(
-                content,
-                workflow=workflow,
-                source=source,
-                user=request.user,
-                filename=filename,
-                region=request.query_params.get("region", None),
-            )
-        except Exception as exception:
-            return Response(
-                {"status_code": 400, "errors": [{"message": str(exception)}]},
-                status=400,
-            )
-        if workflow.is_running:
-            notify_slack(f"bulk upload for {workflow.name}", request)
+        job = ImportJob(
+            workflow=workflow,
+            source=source,
+            created_by=request.user,
+            file=file_obj,
+            filename=filename,
+            region=request.query_params.get("region", None),
+        )
+        job.save()
+        response = run_or_queue_import_job(job)
+        if workflow.is_running and response.status_code != 400:
+            notify_slack("bulk upload", workflow, request)
+        return response
+
+
+def run_or_queue_import_job(job: ImportJob) -> Response:
+    if settings.CSV_IMPORT_BACKGROUND:
+        return Response(
+            {
+                "status_code": 202,
+                "message": f"File {job.filename} was queued for import",
+                "job": ImportJobSerializer(job).data,
+            },
+            status=202,
+        )
 
+    ImportJob.objects.filter(pk=job.pk).update(
+        status="running", started_at=timezone.now()
+    )
+    job.refresh_from_db()
+    run_import_job(job)
+    errors = [{"message": error["message"]} for error in job.errors]
+    if job.rows_done and errors:
+        # the tasks of the imported rows are kept, a failed job is resumed
+        # with the file uploaded again
+        message = (
+            f"File {job.filename} was partially imported, {job.rows_done} tasks "
+            f"created and {job.rows_failed} rows skipped"
+        )
+        if job.status == "failed":
+            message += f", the import failed with {job.rows_pending} rows left"
         return Response(
             {
                 "status_code": 200,
-                "message": f"File {filename} was processed and task created",
+                "message": message,
+                "errors": errors,
+                "job": ImportJobSerializer(job).data,
             },
             status=200,
         )
+    if errors:
+        return Response(
+            {
+                "status_code": 400,
+                "errors": errors,
+                "job": ImportJobSerializer(job).data,
+            },
+            status=400,
+        )
+    return Response(
+        {
+            "status_code": 200,
+            "message": f"File {job.filename} was processed and task created",
+            "job": ImportJobSerializer(job).data,
+        },
+        status=200,
+    )
+
+
+class ImportJobView(RetrieveAPIView):
+    permission_classes = (IsAuthenticated, IsOrgAdmin)
+    serializer_class = ImportJobSerializer
+    lookup_url_kwarg = "job_id"
+
+    def get_queryset(self):
+        return ImportJob.objects.filter(
+            workflow__organization__pk=self.kwargs["org_id"],
+            workflow__pk=self.kwargs["workflow_id"],
+        )
+
+
+class ResumeImportJobView(ImportJobView):
+    parser_classes = [MultiPartParser]
+
+    def post(self, request: request.Request, *args, **kwargs):
+        job = self.get_object()
+        # only failed jobs still have rows left to import
+        if job.status != "failed":
+            return resume_error("Only failed import jobs can be resumed")
+        if "file" not in request.data:
+            return resume_error("Upload the file of the import again to resume it")
+        try:
+            stage_import_file(job, request.data["file"])
+        except ValueError as exception:
+            return resume_error(str(exception))
+        if not ImportJob.objects.filter(pk=job.pk, status="failed").update(
+            status="queued"
+        ):
+            return resume_error("Only failed import jobs can be resumed")
+        job.refresh_from_db()
+        return run_or_queue_import_job(job)
+
+
+def resume_error(message: str) -> Response:
+    return Response({"status_code": 400, "errors": [{"message": message}]}, status=400)
 
 
 class ListTaskView(ListAPIView):
@@ -295,7 +426,8 @@ class ListTaskView(ListAPIView):
             Q(disabled=False) & Q(organization__pk=self.kwargs["org_id"])
         )
         return (
-            Task.objects.defer("data")
+            Task.objects.prefetch_regional_data()
+            .with_list_fields()
             .filter(Q(workflow__in=workflows) & Q(workflow=self.kwargs["workflow_id"]))
             .order_by("-created_at")
         )
@@ -318,9 +450,10 @@ class ListNonCompleteTaskView(ListTaskView):
             Q(pk=self.kwargs["workflow_id"]) & Q(disabled=False)
         )
         return (
-            Task.objects.defer("data")
+            Task.objects.prefetch_regional_data()
+            .with_list_fields()
             .filter(Q(workflow=workflow.first()) & ~Q(status="completed"))
-            .order_by("created_at")
+            .order_by("created_at", "pk")
         )
 
     def list(self, request, *args, **kwargs):
@@ -446,30 +579,21 @@ class NextTaskView(APIView):
                 task["status_code"] = 200
                 return Response(task, status=200)
 
-        # 2 get first pending, can take +1.3s
+        # 2 claim the oldest unassigned task
         with transaction.atomic():
-            obj = (
-                queryset.select_for_update()
-                .filter(Q(status="pending") | Q(status="new"))
-                .first()  # TODO: Remove pending in the future
-            )
-            if not obj:
-                obj = queryset.select_for_update().filter(status="open").first()
+            obj = claim_next_task(queryset, request.user)
             if obj:
-                obj.status = "in_progress"
-                obj.assigned_to = request.user
-                obj.assigned_at = timezone.now()
-                obj.save()
                 TaskActivity(
                     task=obj,
                     created_by=request.user,
                     action="assigned",
                     assignee=request.user,
                 ).save()
-                sync_workflow_task(workflow, obj)
-                task = self.serializer_class(obj).data
-                task["status_code"] = 200
-                return Response(task, status=200)
+        if obj:
+            sync_workflow_task(workflow, obj)
+            task = self.serializer_class(obj).data
+            task["status_code"] = 200
+            return Response(task, status=200)
         return Response(status=204)
 
 
@@ -593,7 +717,7 @@ class CreateTaskFormView(CreateAPIView):
                 request.data["data"].append(idata)
 
         if workflow.is_running:
-            notify_slack(f"Task created via form for {workflow.name}", request)
+            notify_slack("Task created via form", workflow, request)
 
         return self.create(request, *args, **kwargs)
 
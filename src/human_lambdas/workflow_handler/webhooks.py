@@ -0,0 +1,394 @@
+"""
+Webhook delivery through an outbox.
+
+Webhook events are written as WebhookDelivery rows within the transaction
+of the event, with the payload of the task at the event. The data of
+regional tasks is kept out of the database, their payload is serialized
+when sent instead. By default the deliveries are sent once the transaction
+of the event commits, within the request, and are not retried.
+
+With WEBHOOK_BACKGROUND set the request triggering them never waits on the
+target. The WebhookDispatcher of `manage.py runworker` claims the due
+deliveries and POSTs them from a thread pool sharing pooled HTTP
+connections, with at most WEBHOOK_TARGET_CONCURRENCY requests in flight
+per target. Failed attempts are retried with exponential backoff up to
+WEBHOOK_MAX_ATTEMPTS times. A batched webhook gets the tasks completed
+within its batch window, up to its batch size, in one request:
+{"batch_id": ..., "tasks": [...]}. The batch id stays the same on retries
+so that the target can ignore the batches it already got. Zapier webhooks
+are never batched.
+
+A claim pushes next_attempt_at back by WEBHOOK_LEASE_SECONDS, so the
+deliveries of a dispatcher which died are claimed again once it expires.
+Only the thread calling dispatch uses the database, the pool threads only
+send requests.
+"""
+
+import json
+import logging
+import random
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Any, Dict, Iterable, List, Optional
+
+import requests
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from .models import Task, WebHook, WebhookDelivery, prefetch_regional_data
+
+logger = logging.getLogger(__name__)
+
+# status codes of failures which are worth retrying, besides 5xx
+RETRY_STATUS_CODES = {408, 429}
+
+# the session of the deliveries sent within requests
+session = requests.Session()
+
+
+def enqueue_deliveries(
+    event: str, task: Task, hooks: Iterable[WebHook]
+) -> List[WebhookDelivery]:
+    """
+    With WEBHOOK_BACKGROUND set, the deliveries of a batched webhook wait for
+    batch_window_ms, or until batch_size of them are waiting. Webhooks are
+    only batched by the worker.
+    """
+    now = timezone.now()
+    deliveries = []
+    for hook in hooks:
+        batched = settings.WEBHOOK_BACKGROUND and hook.batched
+        deliveries.append(
+            WebhookDelivery.objects.create(
+                workflow_id=task.workflow_id,
+                hook=hook,
+                task=task,
+                event=event,
+                target=hook.target,
+                payload=None if task.region else snapshot(hook, task),
+                next_attempt_at=(
+                    now + timezone.timedelta(milliseconds=hook.batch_window_ms)
+                    if batched
+                    else now
+                ),
+            )
+        )
+        if batched:
+            waiting = list(
+                waiting_deliveries(hook.pk).values_list("pk", flat=True)[
+                    : hook.batch_size
+                ]
+            )
+            if len(waiting) == hook.batch_size:
+                # the batch is full, claim_deliveries sends it with the oldest
+                WebhookDelivery.objects.filter(pk=waiting[0]).update(
+                    next_attempt_at=now
+                )
+    return deliveries
+
+
+def snapshot(hook: WebHook, task: Task) -> Dict[str, Any]:
+    """
+    The payload of the task as stored in the JSONField of the delivery.
+    """
+    return json.loads(json.dumps(hook.serialize_hook(task), cls=DjangoJSONEncoder))
+
+
+def deliver_now(deliveries: List[WebhookDelivery]) -> None:
+    """
+    Sends the deliveries within the request, without WEBHOOK_BACKGROUND. A
+    failed delivery is not retried.
+    """
+    for delivery in deliveries:
+        attempt = post(
+            session,
+            delivery.target,
+            serialize_batch([delivery]),
+            settings.WEBHOOK_TIMEOUT_SECONDS,
+        )
+        record_attempt([delivery], attempt, retry=False)
+
+
+def waiting_deliveries(hook_id: int):
+    """
+    The deliveries of a batched webhook not in a batch yet, oldest first.
+    """
+    return WebhookDelivery.objects.filter(
+        hook_id=hook_id, status="pending", batch_id__isnull=True
+    ).order_by("created_at", "pk")
+
+
+def retry_delay(attempts: int) -> timezone.timedelta:
+    """
+    Exponential backoff with jitter, so that the retries of the deliveries
+    which failed together are spread out.
+    """
+    delay = min(
+        settings.WEBHOOK_RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+        settings.WEBHOOK_RETRY_MAX_SECONDS,
+    )
+    return timezone.timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def claim_deliveries(
+    limit: int, in_flight: Counter, target_concurrency: int
+) -> List[List[WebhookDelivery]]:
+    """
+    Leases up to limit due batches, leaving out those of the targets with
+    target_concurrency batches in flight. The deliveries of webhooks which
+    are not batched are batches of one.
+
+    A due delivery of a batched webhook starts a batch with the other
+    deliveries waiting for it, which keeps its batch_id on retries.
+    """
+    now = timezone.now()
+    lease_until = now + timezone.timedelta(seconds=settings.WEBHOOK_LEASE_SECONDS)
+    busy = [
+        target for target, count in in_flight.items() if count >= target_concurrency
+    ]
+    due = list(
+        WebhookDelivery.objects.filter(status="pending", next_attempt_at__lte=now)
+        .exclude(target__in=busy)
+        .order_by("next_attempt_at")
+        .values_list("pk", "target", "next_attempt_at", "hook_id", "batch_id")[
+            : limit * 4
+        ]
+    )
+    hooks = WebHook.objects.in_bulk({row[3] for row in due if row[3] is not None})
+    claimed_pks, claimed_batch_ids, claimed = set(), set(), []
+    # the waiting deliveries taken into a batch are due later in the list
+    batched_pks = set()
+    targets = Counter(in_flight)
+    for pk, target, next_attempt_at, hook_id, batch_id in due:
+        if len(claimed) == limit:
+            break
+        if targets[target] >= target_concurrency or pk in batched_pks:
+            continue
+        # another dispatcher may have claimed the deliveries in the meantime
+        if batch_id is not None:
+            if batch_id in claimed_batch_ids:
+                continue
+            leased = WebhookDelivery.objects.filter(
+                batch_id=batch_id, status="pending", next_attempt_at=next_attempt_at
+            ).update(next_attempt_at=lease_until)
+        elif hook_id in hooks and hooks[hook_id].batched:
+            batch_id = uuid.uuid4()
+            pks = list(
+                waiting_deliveries(hook_id).values_list("pk", flat=True)[
+                    : hooks[hook_id].batch_size
+                ]
+            )
+            leased = pk in pks and WebhookDelivery.objects.filter(
+                pk__in=pks, status="pending", batch_id__isnull=True
+            ).update(batch_id=batch_id, next_attempt_at=lease_until)
+            batched_pks.update(pks)
+        else:
+            leased = WebhookDelivery.objects.filter(
+                pk=pk, status="pending", next_attempt_at=next_attempt_at
+            ).update(next_attempt_at=lease_until)
+        if leased:
+            targets[target] += 1
+            claimed.append(batch_id or pk)
+            if batch_id is None:
+                claimed_pks.add(pk)
+            else:
+                claimed_batch_ids.add(batch_id)
+
+    batches = defaultdict(list)
+    for delivery in (
+        WebhookDelivery.objects.filter(
+            Q(pk__in=claimed_pks, batch_id__isnull=True)
+            | Q(batch_id__in=claimed_batch_ids),
+            status="pending",
+            next_attempt_at=lease_until,
+        )
+        .select_related("hook", "task")
+        .order_by("created_at", "pk")
+    ):
+        batches[delivery.batch_id or delivery.pk].append(delivery)
+    return [batches[key] for key in claimed if key in batches]
+
+
+def post(
+    session: requests.Session, target: str, body: str, timeout: float
+) -> Dict[str, Any]:
+    """
+    Sends a delivery, the log entry of the attempt.
+    """
+    attempted_at = timezone.now()
+    start = time.perf_counter()
+    status_code, error = None, None
+    try:
+        response = session.post(
+            target,
+            data=body,
+            headers={"Content-Type": "application/json"},
+            timeout=timeout,
+        )
+        status_code = response.status_code
+    except requests.RequestException as exception:
+        error = str(exception) or exception.__class__.__name__
+    return {
+        "attempted_at": attempted_at.isoformat(),
+        "status_code": status_code,
+        "error": error,
+        "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+def record_attempt(
+    batch: List[WebhookDelivery], attempt: Dict[str, Any], retry: bool = True
+) -> None:
+    """
+    Records the attempt of a batch on all its deliveries, which are retried
+    or fail together.
+    """
+    now = timezone.now()
+    attempts = batch[0].attempts + 1
+    status_code = attempt["status_code"]
+    status, delivered_at, next_attempt_at = "pending", None, batch[0].next_attempt_at
+    if status_code is not None and 200 <= status_code < 300:
+        status, delivered_at = "delivered", now
+    elif (
+        retry
+        and (
+            status_code is None
+            or status_code >= 500
+            or status_code in RETRY_STATUS_CODES
+        )
+        and attempts < settings.WEBHOOK_MAX_ATTEMPTS
+    ):
+        next_attempt_at = now + retry_delay(attempts)
+    else:
+        status = "failed"
+        logger.warning(
+            f"Webhook delivery {batch[0].pk} to {batch[0].target} failed after "
+            f"{attempts} attempts"
+        )
+    with transaction.atomic():
+        for delivery in batch:
+            delivery.attempts = attempts
+            delivery.log = delivery.log + [attempt]
+            delivery.status = status
+            delivery.delivered_at = delivered_at
+            delivery.next_attempt_at = next_attempt_at
+            delivery.save(
+                update_fields=[
+                    "attempts",
+                    "log",
+                    "status",
+                    "delivered_at",
+                    "next_attempt_at",
+                ]
+            )
+
+
+def serialize_batch(batch: List[WebhookDelivery]) -> str:
+    """
+    The body of a batch, the payload of its task when it is a single
+    delivery, otherwise the payloads of its tasks with the batch id.
+    """
+    hook = batch[0].hook
+    # the data of the regional tasks of the batch, one request per region
+    prefetch_regional_data(
+        [delivery.task for delivery in batch if delivery.payload is None]
+    )
+    payloads = [
+        hook.serialize_hook(delivery.task)
+        if delivery.payload is None
+        else delivery.payload
+        for delivery in batch
+    ]
+    if batch[0].batch_id is None:
+        payload = payloads[0]
+    else:
+        payload = {"batch_id": str(batch[0].batch_id), "tasks": payloads}
+    return json.dumps(payload, cls=DjangoJSONEncoder)
+
+
+class WebhookDispatcher:
+    """
+    Delivers the due webhook deliveries concurrently, call dispatch in a
+    loop and close when done.
+    """
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        target_concurrency: Optional[int] = None,
+    ):
+        self.concurrency = concurrency or settings.WEBHOOK_CONCURRENCY
+        self.target_concurrency = (
+            target_concurrency or settings.WEBHOOK_TARGET_CONCURRENCY
+        )
+        self.executor = ThreadPoolExecutor(
+            self.concurrency, thread_name_prefix="webhook"
+        )
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.concurrency, pool_maxsize=self.concurrency
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.in_flight: Dict[Future, List[WebhookDelivery]] = {}
+
+    def dispatch(self) -> int:
+        """
+        Records the finished batches and starts the due ones there is room
+        for, the number of batches in flight.
+        """
+        self.collect()
+        free = self.concurrency - len(self.in_flight)
+        if free > 0:
+            targets = Counter(batch[0].target for batch in self.in_flight.values())
+            for batch in claim_deliveries(free, targets, self.target_concurrency):
+                self.start(batch)
+        return len(self.in_flight)
+
+    def start(self, batch: List[WebhookDelivery]) -> None:
+        if batch[0].hook is None:
+            for delivery in batch:
+                delivery.status = "failed"
+                delivery.log = delivery.log + [{"error": "The webhook was removed"}]
+                delivery.save(update_fields=["status", "log"])
+            return
+        future = self.executor.submit(
+            post,
+            self.session,
+            batch[0].target,
+            serialize_batch(batch),
+            settings.WEBHOOK_TIMEOUT_SECONDS,
+        )
+        self.in_flight[future] = batch
+
+    def collect(self, timeout: Optional[float] = 0) -> None:
+        """
+        Records the batches which finished within the timeout.
+        """
+        if not self.in_flight:
+            if timeout:
+                time.sleep(timeout)
+            return
+        done, _ = wait(self.in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            record_attempt(self.in_flight.pop(future), future.result())
+
+    def close(self) -> None:
+        """
+        Waits for the deliveries in flight.
+        """
+        while self.in_flight:
+            self.collect(timeout=None)
+        self.executor.shutdown()
+        self.session.close()